@@ -0,0 +1,857 @@
+import ipaddress
+import json
+import os
+import socket
+
+import models
+import store
+
+# Asignación de direcciones libres por subred de servidor con un mapa de bits.
+# El bit i de un entero de Python indica si la dirección base + i está ocupada;
+# la primera libre es el bit 0 más bajo, (bits + 1) & ~bits, que se calcula en C
+# sin crear un objeto ipaddress por host. Las direcciones de los clientes se
+# traducen a enteros con inet_pton.
+#
+# for_server() mantiene un asignador por servidor y subred (dos servidores en la
+# misma subred no comparten el mapa) y lo sincroniza de forma incremental con
+# sus clientes: tras la primera pasada solo se procesan los ids añadidos o
+# borrados; los cambios de dirección llegan como operaciones por refresh().
+#
+# allocate_many() reparte N direcciones de una sola pasada (o un bloque
+# contiguo) y falla sin reservar nada si la subred no tiene sitio.
+#
+# Doble pila: si la dirección del servidor incluye un prefijo IPv6
+# ("10.0.0.1/24, fd00::1/64") cada cliente recibe una dirección de cada familia
+# ("10.0.0.2/32, fd00::2/128"). Las subredes enormes (un /64 tiene 2^64
+# direcciones) no caben en un mapa de bits: CursorAllocator asigna con un cursor
+# secuencial y una lista de huecos liberados, en O(1) por dirección.
+#
+# Pools: un servidor puede tener subredes adicionales en 'pools'
+# ("10.0.1.1/24, 10.0.2.1/24"). Por familia se usan en orden: la de 'address' y,
+# al llenarse, la siguiente. La subred activa se recuerda por servidor y solo
+# retrocede si se libera una dirección en una anterior, así que elegirla no
+# recorre las que ya están llenas.
+#
+# Las direcciones liberadas al borrar clientes se apilan (sin repetidas y como
+# mucho RECLAIMED_MAX) y se reutilizan antes que cualquier otra. El estado de los asignadores se guarda junto al archivo de
+# datos (<archivo>.alloc.json) con la versión del documento: al arrancar se
+# restaura si la versión coincide y se actualiza tras cada alta o baja, de modo
+# que la vista de uso (usadas, libres, mayor tramo libre, huecos) no necesita
+# volver a recorrer las direcciones de los clientes. snapshot() copia el estado
+# (los mapas de bits son enteros inmutables: se copian por referencia) para que
+# write_state() lo serialice y escriba fuera del hilo que usa los asignadores.
+
+_FAMILIES = {4: socket.AF_INET, 6: socket.AF_INET6}
+BITMAP_MAX_ADDRESSES = 1 << 24 # Por encima se usa CursorAllocator (el mapa ocuparía más de 2 MB)
+STATE_SUFFIX = ".alloc.json"
+STATE_FORMAT = 2 # Entradas por (servidor, subred)
+RECLAIMED_MAX = 4096 # Direcciones liberadas recordadas por subred (las más antiguas se olvidan)
+_CHUNK_BYTES = 512 # free_ranges() recorre el mapa de bits en bloques de 4096 direcciones
+
+
+class AllocationError(ValueError):
+    """No hay suficientes direcciones libres; `available` indica cuántas quedan."""
+
+    def __init__(self, message, available):
+        super().__init__(message)
+        self.available = available
+
+
+class AddressAllocator:
+    """Mapa de bits de direcciones ocupadas en la subred del servidor."""
+
+    __slots__ = ("network", "server_ip", "_base", "_size", "_family", "_bits", "_shared", "_reclaimed")
+
+    def __init__(self, server_address):
+        """`server_address` es la dirección del servidor con su máscara ("10.0.0.1/24").
+
+        Lanza ValueError si no es una dirección válida.
+        """
+        interface = ipaddress.ip_interface(str(server_address).strip())
+        self.network = interface.network
+        self.server_ip = str(interface.ip)
+        self._base = int(self.network.network_address)
+        self._size = self.network.num_addresses
+        self._family = _FAMILIES[self.network.version]
+        self._bits = 0
+        self._shared = {} # desplazamiento -> reservas extra (direcciones duplicadas)
+        self._reclaimed = {} # Desplazamientos liberados en orden (dict como pila sin repetidos): se reutilizan primero
+        # Igual que network.hosts(): sin dirección de red ni de broadcast (salvo /31 y /32).
+        if self.network.version == 6 or self.network.prefixlen < 31:
+            self._bits |= 1
+        if self.network.version == 4 and self.network.prefixlen < 31:
+            self._bits |= 1 << (self._size - 1)
+        self.reserve(self.server_ip)
+
+    def copy(self):
+        other = object.__new__(type(self))
+        for cls in type(self).__mro__:
+            for name in getattr(cls, "__slots__", ()):
+                setattr(other, name, getattr(self, name))
+        other._shared = dict(self._shared)
+        other._reclaimed = dict(self._reclaimed)
+        return other
+
+    @property
+    def host_prefix(self):
+        return 32 if self.network.version == 4 else 128
+
+    def offset(self, address):
+        """Posición de `address` ("10.0.0.5/32" o "10.0.0.5") en la subred, o None si no pertenece.
+
+        Lanza ValueError si la dirección no es válida.
+        """
+        host = str(address).split("/")[0].strip()
+        try:
+            value = int.from_bytes(socket.inet_pton(self._family, host), "big")
+        except OSError:
+            other = _FAMILIES[6 if self._family == socket.AF_INET else 4]
+            try:
+                socket.inet_pton(other, host)
+            except OSError:
+                raise ValueError(f"Dirección IP inválida: {address}") from None
+            return None # Válida, pero de la otra familia
+        offset = value - self._base
+        return offset if 0 <= offset < self._size else None
+
+    def reserve(self, address):
+        """Marca `address` como ocupada. Devuelve False si no pertenece a la subred."""
+        offset = self.offset(address)
+        if offset is None:
+            return False
+        bit = 1 << offset
+        if self._bits & bit:
+            self._shared[offset] = self._shared.get(offset, 0) + 1
+        else:
+            self._bits |= bit
+        return True
+
+    def release(self, address):
+        """Libera `address` (si estaba reservada más de una vez, solo una de ellas)."""
+        offset = self.offset(address)
+        if offset is None:
+            return False
+        extra = self._shared.get(offset)
+        if extra:
+            if extra == 1:
+                del self._shared[offset]
+            else:
+                self._shared[offset] = extra - 1
+        else:
+            self._bits &= ~(1 << offset)
+            self._reclaim(offset)
+        return True
+
+    def _reclaim(self, offset):
+        """Apila `offset` como liberado (si ya estaba, pasa a la cima) sin superar RECLAIMED_MAX."""
+        self._reclaimed.pop(offset, None)
+        self._reclaimed[offset] = None
+        if len(self._reclaimed) > RECLAIMED_MAX:
+            del self._reclaimed[next(iter(self._reclaimed))] # Sigue libre en el mapa: solo deja de tener prioridad
+
+    def _is_used(self, offset):
+        return (self._bits >> offset) & 1
+
+    def is_free(self, address):
+        offset = self.offset(address)
+        return offset is not None and not self._is_used(offset)
+
+    def _first_unused(self):
+        lowest = (self._bits + 1) & ~self._bits
+        offset = lowest.bit_length() - 1
+        return offset if offset < self._size else None
+
+    def _next_offset(self):
+        """Siguiente desplazamiento libre sin reservarlo (antes los liberados), o None si no queda ninguno."""
+        while self._reclaimed:
+            offset = next(reversed(self._reclaimed))
+            if not self._is_used(offset):
+                return offset
+            del self._reclaimed[offset] # Reservado de nuevo desde fuera (p. ej. al sincronizar)
+        return self._first_unused()
+
+    def find_first_free(self):
+        """Siguiente dirección libre (cadena sin máscara) o None si la subred está llena."""
+        offset = self._next_offset()
+        return None if offset is None else str(ipaddress.ip_address(self._base + offset))
+
+    def next_address(self):
+        """Primera dirección libre con máscara de host ("10.0.0.2/32"), sin reservarla."""
+        free = self.find_first_free()
+        return None if free is None else f"{free}/{self.host_prefix}"
+
+    def allocate(self):
+        """Reserva y devuelve la primera dirección libre con máscara de host, o None."""
+        address = self.next_address()
+        if address is not None:
+            self.reserve(address)
+        return address
+
+    def _address(self, offset):
+        return f"{ipaddress.ip_address(self._base + offset)}/{self.host_prefix}"
+
+    def allocate_many(self, n, contiguous=False):
+        """Reserva y devuelve `n` direcciones libres con máscara de host.
+
+        Con contiguous=True las n direcciones forman un único bloque
+        consecutivo. Si no caben lanza AllocationError sin reservar ninguna.
+        """
+        if n <= 0:
+            return []
+        free = ~self._bits # Bits a 1 = libres (entero negativo: infinitos unos a la izquierda)
+        if contiguous:
+            # Tras el bucle, el bit i sigue a 1 solo si i..i+n-1 están libres.
+            run, width = free, 1
+            while width < n:
+                step = min(width, n - width)
+                run &= run >> step
+                width += step
+            start = (run & -run).bit_length() - 1
+            if start < 0 or start + n > self._size:
+                raise AllocationError(f"No hay {n} direcciones contiguas libres en {self.network} "
+                                      f"(quedan {self.free} libres en total).", self.free)
+            offsets = range(start, start + n)
+        else:
+            offsets = []
+            for offset in reversed(self._reclaimed): # Primero las liberadas
+                if len(offsets) < n and not self._is_used(offset) and (free >> offset) & 1:
+                    offsets.append(offset)
+                    free &= ~(1 << offset)
+            while len(offsets) < n:
+                lowest = free & -free
+                offset = lowest.bit_length() - 1
+                if offset >= self._size:
+                    break
+                offsets.append(offset)
+                free ^= lowest
+            if len(offsets) < n:
+                raise AllocationError(f"Solo quedan {len(offsets)} direcciones libres en {self.network} "
+                                      f"(se pidieron {n}).", len(offsets))
+        for offset in offsets:
+            self._bits |= 1 << offset
+        return [self._address(offset) for offset in offsets]
+
+    @property
+    def used(self):
+        return self._bits.bit_count()
+
+    @property
+    def free(self):
+        return self._size - self.used
+
+    def _reserved(self):
+        """Direcciones que nunca se asignan (red y broadcast)."""
+        return (self.network.version == 6 or self.network.prefixlen < 31) + \
+            (self.network.version == 4 and self.network.prefixlen < 31)
+
+    def _highest_used(self):
+        bits = self._bits
+        if self.network.version == 4 and self.network.prefixlen < 31:
+            bits &= ~(1 << (self._size - 1)) # Sin la dirección de broadcast
+        return bits.bit_length() - 1
+
+    def free_ranges(self):
+        """(desplazamiento inicial, longitud) de cada tramo libre, en orden.
+
+        El mapa se recorre en bloques de 4096 bits: los llenos y los vacíos se
+        reconocen comparando bytes y solo en los mixtos se salta de tramo en
+        tramo con operaciones de bits.
+        """
+        length = (self._size + 7) // 8
+        padding = ((1 << (length * 8)) - 1) ^ ((1 << self._size) - 1) # Bits tras el final: ocupados
+        data = (self._bits | padding).to_bytes(length, "little")
+        full, empty = b"\xff" * _CHUNK_BYTES, bytes(_CHUNK_BYTES)
+        start = None # Inicio del tramo libre en curso
+        for offset in range(0, length, _CHUNK_BYTES):
+            chunk = data[offset:offset + _CHUNK_BYTES]
+            base, width = offset * 8, len(chunk) * 8
+            if chunk == full[:len(chunk)]:
+                if start is not None:
+                    yield start, base - start
+                    start = None
+                continue
+            if chunk == empty[:len(chunk)]:
+                if start is None:
+                    start = base
+                continue
+            bits = int.from_bytes(chunk, "little")
+            position = 0
+            while position < width:
+                rest = bits >> position
+                if rest & 1:
+                    if start is not None:
+                        yield start, base + position - start
+                        start = None
+                    rest = ~rest # El bit 1 más bajo es ahora el siguiente libre
+                elif start is None:
+                    start = base + position
+                if not rest:
+                    break # Libre hasta el final del bloque
+                position += (rest & -rest).bit_length() - 1
+        if start is not None:
+            yield start, length * 8 - start
+
+    def _free_bits(self):
+        return ~self._bits & ((1 << self._size) - 1)
+
+    def _hole_count(self, highest):
+        """Tramos libres que empiezan por debajo de `highest`: bits libres cuyo anterior está ocupado."""
+        if highest <= 0:
+            return 0
+        free = self._free_bits()
+        return (free & ~(free << 1) & ((1 << highest) - 1)).bit_count()
+
+    def _largest_free(self):
+        """Longitud del mayor tramo libre con operaciones sobre el mapa completo (O(log n) pasadas)."""
+        runs = [self._free_bits()] # runs[j]: bit p a 1 si p..p+2^j-1 están libres
+        while runs[-1]:
+            width = 1 << (len(runs) - 1)
+            runs.append(runs[-1] & (runs[-1] >> width))
+        runs.pop()
+        if not runs:
+            return 0
+        current, largest = runs[-1], 1 << (len(runs) - 1)
+        for j in range(len(runs) - 2, -1, -1):
+            longer = current & (runs[j] >> largest)
+            if longer:
+                current, largest = longer, largest + (1 << j)
+        return largest
+
+    def usage(self, max_ranges=5):
+        """Resumen de ocupación: usadas, libres, mayor tramo libre y huecos por debajo de la última usada."""
+        highest = self._highest_used()
+        first = lambda offset: str(ipaddress.ip_address(self._base + offset))
+        hole_ranges = []
+        for start, length in self.free_ranges():
+            if start >= highest or len(hole_ranges) == max_ranges:
+                break
+            hole_ranges.append(first(start) if length == 1 else f"{first(start)}-{first(start + length - 1)}")
+        return {
+            "network": str(self.network),
+            "size": self._size - self._reserved(),
+            "used": self.used - self._reserved(),
+            "free": self.free,
+            "largest_free": self._largest_free(),
+            "holes": self._hole_count(highest),
+            "reclaimed": sum(1 for offset in self._reclaimed if not self._is_used(offset)),
+            "hole_ranges": hole_ranges,
+        }
+
+    def to_state(self):
+        """Copia del estado; 'bits' es el propio entero (inmutable), write_state() lo pasa a hexadecimal."""
+        return {"bits": self._bits, "shared": sorted(self._shared.items()), "reclaimed": list(self._reclaimed)}
+
+    def restore(self, state):
+        self._bits = int(state["bits"], 16)
+        self._shared = dict(state.get("shared", ()))
+        self._reclaimed = dict.fromkeys(state.get("reclaimed", ()))
+
+
+class CursorAllocator(AddressAllocator):
+    """Asignador disperso para subredes enormes (IPv6 /64).
+
+    Guarda solo las direcciones ocupadas. Las nuevas salen de un cursor que
+    avanza de forma secuencial; las liberadas por debajo del cursor se apilan y
+    se reutilizan primero.
+    """
+
+    __slots__ = ("_used", "_cursor")
+
+    def __init__(self, server_address):
+        self._used = {} # desplazamiento -> número de reservas
+        self._cursor = 1 # El desplazamiento 0 (anycast del router de la subred) no se asigna
+        super().__init__(server_address)
+
+    def copy(self):
+        other = super().copy()
+        other._used = dict(self._used)
+        return other
+
+    def _mark(self, offset):
+        self._used[offset] = self._used.get(offset, 0) + 1
+
+    def reserve(self, address):
+        offset = self.offset(address)
+        if offset is None:
+            return False
+        self._mark(offset)
+        return True
+
+    def release(self, address):
+        offset = self.offset(address)
+        if offset is None or offset not in self._used:
+            return offset is not None
+        if self._used[offset] > 1:
+            self._used[offset] -= 1
+        else:
+            del self._used[offset]
+            if 0 < offset < self._cursor:
+                self._reclaim(offset)
+        return True
+
+    def _is_used(self, offset):
+        return offset == 0 or offset in self._used
+
+    def _first_unused(self):
+        while self._cursor in self._used:
+            self._cursor += 1
+        return self._cursor if self._cursor < self._size else None
+
+    def allocate_many(self, n, contiguous=False):
+        if n <= 0:
+            return []
+        if contiguous:
+            start = self._cursor
+            while start + n <= self._size:
+                busy = [offset for offset in range(start, start + n) if offset in self._used]
+                if not busy:
+                    break
+                start = busy[-1] + 1
+            if start + n > self._size:
+                raise AllocationError(f"No hay {n} direcciones contiguas libres en {self.network} "
+                                      f"(quedan {self.free} libres en total).", self.free)
+            offsets = list(range(start, start + n))
+        else:
+            if n > self.free:
+                raise AllocationError(f"Solo quedan {self.free} direcciones libres en {self.network} "
+                                      f"(se pidieron {n}).", self.free)
+            offsets = []
+            for _ in range(n):
+                offset = self._next_offset()
+                self._mark(offset)
+                offsets.append(offset)
+            return [self._address(offset) for offset in offsets]
+        for offset in offsets:
+            self._mark(offset)
+        return [self._address(offset) for offset in offsets]
+
+    @property
+    def used(self):
+        return len(self._used) + 1
+
+    @property
+    def free(self):
+        return self._size - self.used
+
+    def _reserved(self):
+        return 1
+
+    def _highest_used(self):
+        return max(self._used, default=0)
+
+    def _hole_count(self, highest):
+        return sum(1 for start, _ in self.free_ranges() if start < highest)
+
+    def _largest_free(self):
+        return max((length for _, length in self.free_ranges()), default=0)
+
+    def free_ranges(self):
+        previous = 0
+        for offset in sorted(self._used):
+            if offset > previous + 1:
+                yield previous + 1, offset - previous - 1
+            previous = max(previous, offset)
+        if previous + 1 < self._size:
+            yield previous + 1, self._size - previous - 1
+
+    def to_state(self):
+        return {"used": sorted(self._used.items()), "cursor": self._cursor, "reclaimed": list(self._reclaimed)}
+
+    def restore(self, state):
+        self._used = dict(state.get("used", ()))
+        self._cursor = state.get("cursor", 1)
+        self._reclaimed = dict.fromkeys(state.get("reclaimed", ()))
+
+
+def make_allocator(server_address):
+    """Asignador adecuado al tamaño de la subred de `server_address`."""
+    interface = ipaddress.ip_interface(str(server_address).strip())
+    if interface.network.num_addresses > BITMAP_MAX_ADDRESSES:
+        return CursorAllocator(server_address)
+    return AddressAllocator(server_address)
+
+
+class _Entry:
+    """Asignador de una subred sincronizado con los clientes de un servidor."""
+
+    __slots__ = ("server_id", "allocator", "known", "invalid", "synced", "chain", "position")
+
+    def __init__(self, server_id, allocator):
+        self.server_id = server_id
+        self.allocator = allocator
+        self.known = {} # id de cliente -> 'address' ya reservada
+        self.invalid = {} # id de cliente -> dirección que no se pudo interpretar
+        self.synced = False # Ya se recorrieron todos los clientes una vez
+        self.chain = None # Subredes del servidor de esta familia (ver _pool_chains)
+        self.position = 0 # Posición de esta subred en `chain`
+
+    def _released(self):
+        # Vuelve a haber sitio en esta subred: la selección de subred retrocede hasta ella.
+        key = (self.server_id, self.chain)
+        if self.chain is not None and self.position < _active.get(key, 0):
+            _active[key] = self.position
+
+    def _apply(self, address, reserve):
+        for item in models.split_addresses(address):
+            try:
+                if reserve:
+                    self.allocator.reserve(item)
+                else:
+                    self.allocator.release(item)
+            except ValueError:
+                pass
+
+    def update(self, client_id, address):
+        """Reserva la dirección nueva de `client_id` y libera la anterior (si cambió)."""
+        if client_id in self.known:
+            if self.known[client_id] == address:
+                return
+            self._apply(self.known[client_id], reserve=False)
+            self._released()
+        self.invalid.pop(client_id, None)
+        for item in models.split_addresses(address):
+            try:
+                self.allocator.offset(item)
+            except ValueError:
+                self.invalid[client_id] = item
+        self._apply(address, reserve=True)
+        self.known[client_id] = address
+
+    def remove(self, client_id):
+        """Libera la dirección de un cliente borrado: queda la primera para reutilizar."""
+        if client_id in self.known:
+            self._apply(self.known.pop(client_id), reserve=False)
+            self._released()
+        self.invalid.pop(client_id, None)
+
+    def sync(self, clients, full=False):
+        """Sincroniza con `clients` ({id: cliente}).
+
+        La primera vez (o con full=True) se recorren todos; después solo los
+        ids añadidos o borrados desde la última vez (la diferencia de claves se
+        calcula en C). Los cambios de dirección de un cliente ya conocido se
+        anotan con refresh().
+        """
+        if full or not self.synced:
+            for client_id in [cid for cid in self.known if cid not in clients]:
+                self.remove(client_id)
+            for client_id, client in clients.items():
+                self.update(client_id, client.get("address"))
+            self.synced = True
+            return
+        if len(clients) == len(self.known) and clients.keys() == self.known.keys():
+            return
+        for client_id in self.known.keys() - clients.keys():
+            self.remove(client_id)
+        for client_id in clients.keys() - self.known.keys():
+            self.update(client_id, clients[client_id].get("address"))
+
+    def to_state(self):
+        return {"allocator": self.allocator.to_state(), "known": dict(self.known), "invalid": dict(self.invalid)}
+
+    @classmethod
+    def from_state(cls, server_id, key, state):
+        entry = cls(server_id, make_allocator(key))
+        entry.allocator.restore(state["allocator"])
+        entry.known = dict(state["known"])
+        entry.invalid = dict(state.get("invalid", {}))
+        entry.synced = True
+        return entry
+
+
+_entries = {} # (id de servidor, dirección del servidor de una familia) -> _Entry
+_owners = {} # id de servidor -> direcciones (claves de _entries) de sus subredes
+_active = {} # (id de servidor, subredes de una familia) -> posición de la primera que puede tener sitio
+
+
+def for_server(server_id, server_address, clients=None):
+    """Asignador de la subred `server_address` de `server_id` sincronizado con `clients` ({id: cliente}).
+
+    Con clients=None no se sincroniza (se usa el estado ya conocido).
+    Lanza ValueError si la dirección del servidor no es válida. El objeto es
+    compartido: para reservas provisionales úsese .copy().
+    """
+    return _entry(server_id, server_address, clients).allocator
+
+
+def _family_addresses(server_address):
+    """La primera dirección del servidor de cada familia (IPv4 y, en doble pila, IPv6).
+
+    Lanza ValueError si no hay ninguna o alguna no es válida.
+    """
+    by_family = {}
+    for item in models.split_addresses(server_address):
+        by_family.setdefault(ipaddress.ip_interface(item).version, item)
+    if not by_family:
+        raise ValueError(f"Dirección del servidor vacía: {server_address!r}")
+    return [by_family[version] for version in sorted(by_family)]
+
+
+def _pool_chains(server_address, pools=None):
+    """Subredes de cada familia en orden de uso: la de 'address' y después las de 'pools'.
+
+    Lanza ValueError si alguna dirección no es válida.
+    """
+    by_family = {}
+    for item in _family_addresses(server_address):
+        by_family[ipaddress.ip_interface(item).version] = [item]
+    for item in models.split_addresses(pools):
+        chain = by_family.setdefault(ipaddress.ip_interface(item).version, [])
+        if item not in chain:
+            chain.append(item)
+    return [tuple(by_family[version]) for version in sorted(by_family)]
+
+
+def _chain_entries(server_id, chain, clients, full=False):
+    """Entradas de las subredes de `chain`, sincronizadas con `clients` y enlazadas a su posición."""
+    entries = []
+    for position, key in enumerate(chain):
+        entry = _entry(server_id, key, clients, full)
+        entry.chain, entry.position = chain, position
+        entries.append(entry)
+    return entries
+
+
+def _select(server_id, chain, entries):
+    """Primera subred de `chain` con sitio, o None si están todas llenas.
+
+    `_active[(server_id, chain)]` apunta a la primera que puede tener sitio: solo avanza al
+    llenarse y retrocede cuando se libera una dirección en una anterior (ver
+    _Entry._released), así que elegir la subred no recorre las llenas.
+    """
+    active = _active.get((server_id, chain), 0)
+    while active < len(entries) and entries[active].allocator.find_first_free() is None:
+        active += 1
+    _active[(server_id, chain)] = active
+    return entries[active] if active < len(entries) else None
+
+
+def next_client_address(server_id, server_address, clients, pools=None):
+    """Dirección para un cliente nuevo de `server_id`, sin reservarla: una por familia ("10.0.0.2/32, fd00::2/128").
+
+    `server_address` es el campo 'address' del servidor y `pools` su campo
+    'pools' (subredes adicionales que se usan, en orden, al llenarse la
+    anterior). Devuelve None si todas las subredes de alguna familia están
+    llenas y lanza ValueError si alguna dirección del servidor no es válida.
+    """
+    parts = []
+    for chain in _pool_chains(server_address, pools):
+        entry = _select(server_id, chain, _chain_entries(server_id, chain, clients))
+        if entry is None:
+            return None
+        parts.append(entry.allocator.next_address())
+    return models.join_addresses(parts)
+
+
+def allocate_many(server_id, server, n, contiguous=False):
+    """`n` direcciones libres (una por familia en doble pila) para nuevos clientes de `server`.
+
+    Se reparten en orden entre la subred de 'address' y las de 'pools'; con
+    contiguous=True el bloque sale entero de una sola subred. Se calculan
+    sobre copias de los asignadores: quedan ocupadas cuando los clientes se
+    guardan en el servidor. Lanza AllocationError ("solo quedan k libres") si
+    no caben y ValueError si alguna dirección del servidor no es válida.
+    """
+    clients = server.get("clients") or {}
+    columns = []
+    for chain in _pool_chains(server.get("address"), server.get("pools")):
+        entries = _chain_entries(server_id, chain, clients)
+        first = _select(server_id, chain, entries)
+        candidates = [entry.allocator.copy() for entry in entries[entries.index(first):]] if first else []
+        if contiguous:
+            for candidate in candidates:
+                try:
+                    columns.append(candidate.allocate_many(n, contiguous=True))
+                    break
+                except AllocationError:
+                    continue
+            else:
+                free = sum(candidate.free for candidate in candidates)
+                raise AllocationError(f"No hay {n} direcciones contiguas libres en ninguna subred de "
+                                      f"{', '.join(chain)} (quedan {free} libres en total).", free)
+            continue
+        column = []
+        for candidate in candidates:
+            take = min(n - len(column), candidate.free)
+            if take > 0:
+                column.extend(candidate.allocate_many(take))
+        if len(column) < n:
+            raise AllocationError(f"Solo quedan {len(column)} direcciones libres en {', '.join(chain)} "
+                                  f"(se pidieron {n}).", len(column))
+        columns.append(column)
+    return [models.join_addresses(parts) for parts in zip(*columns)]
+
+
+def invalid_addresses(server_id, server_address, clients=None, pools=None):
+    """{id de cliente: dirección} de los clientes de `server_id` con una dirección que no se pudo interpretar.
+
+    Sin `clients` se devuelve el estado de la última sincronización.
+    """
+    invalid = {}
+    for chain in _pool_chains(server_address, pools):
+        for key in chain:
+            invalid.update(_entry(server_id, key, clients).invalid)
+    return invalid
+
+
+def _entry(server_id, server_address, clients, full=False):
+    key = str(server_address).strip()
+    entry = _entries.get((server_id, key))
+    if entry is None:
+        entry = _entries[(server_id, key)] = _Entry(server_id, make_allocator(key))
+    if clients is not None:
+        entry.sync(clients, full)
+    return entry
+
+
+def state_path(path):
+    """Archivo de estado de los asignadores junto al archivo de datos `path`."""
+    return os.path.abspath(path).rstrip(os.sep) + STATE_SUFFIX
+
+
+def reset():
+    """Olvida el estado de todos los asignadores (se reconstruyen al usarlos)."""
+    _entries.clear()
+    _owners.clear()
+    _active.clear()
+
+
+def load_state(path, version):
+    """Restaura el estado guardado de `path` si corresponde a la `version` del documento.
+
+    Devuelve False (y deja los asignadores vacíos, se reconstruyen al usarlos)
+    si no existe, está dañado o es de otra versión.
+    """
+    reset()
+    try:
+        with open(state_path(path), encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("format") != STATE_FORMAT or state.get("version") != version:
+            return False
+        entries = {(server_id, key): _Entry.from_state(server_id, key, item)
+                   for server_id, key, item in state["entries"]}
+    except (OSError, ValueError, KeyError, TypeError):
+        return False
+    _entries.update(entries)
+    _owners.update(state.get("owners", {}))
+    return True
+
+
+def snapshot():
+    """Copia del estado de todos los asignadores para guardarla con write_state() desde otro hilo."""
+    return {
+        "owners": {server_id: list(keys) for server_id, keys in _owners.items()},
+        "entries": [[server_id, key, entry.to_state()] for (server_id, key), entry in _entries.items()],
+    }
+
+
+def write_state(path, state, version):
+    """Escribe una copia de snapshot() junto a `path` para la `version` del documento."""
+    entries = []
+    for server_id, key, item in state["entries"]:
+        allocator_state = item["allocator"]
+        if "bits" in allocator_state:
+            allocator_state = dict(allocator_state, bits=format(allocator_state["bits"], "x"))
+        entries.append([server_id, key, dict(item, allocator=allocator_state)])
+    document = {"format": STATE_FORMAT, "version": version, "owners": state["owners"], "entries": entries}
+    store._atomic_write(state_path(path), json.dumps(document, separators=(",", ":")))
+
+
+def save_state(path, version):
+    """Guarda el estado de los asignadores de `path` para la `version` del documento."""
+    write_state(path, snapshot(), version)
+
+
+def _drop_server(server_id, keep=()):
+    """Olvida las subredes de `server_id` salvo las de `keep`."""
+    for entry_key in [entry_key for entry_key in _entries if entry_key[0] == server_id and entry_key[1] not in keep]:
+        del _entries[entry_key]
+    for active_key in [active_key for active_key in _active if active_key[0] == server_id]:
+        del _active[active_key]
+    if not keep:
+        _owners.pop(server_id, None)
+
+
+def _resync(data, server_id):
+    """Vuelve a sincronizar las subredes de un servidor con todos sus clientes."""
+    servers = data.get("servers") or {}
+    if server_id not in servers:
+        _drop_server(server_id)
+        return
+    server = servers[server_id]
+    try:
+        chains = _pool_chains(server.get("address"), server.get("pools"))
+    except ValueError:
+        _drop_server(server_id)
+        return
+    keys = [key for chain in chains for key in chain]
+    _drop_server(server_id, keep=keys)
+    _owners[server_id] = keys
+    clients = server.get("clients") or {}
+    for chain in chains:
+        _chain_entries(server_id, chain, clients, full=True)
+
+
+def refresh(data, ops):
+    """Aplica al estado de los asignadores las operaciones ya aplicadas a `data`.
+
+    Altas, bajas y cambios de dirección de clientes se anotan uno a uno, sin
+    recorrer el resto de clientes; los cambios del propio servidor
+    (dirección o el servidor completo) lo resincronizan.
+    """
+    dirty = set()
+    for op in ops:
+        path = op[1]
+        if len(path) < 2 or path[0] != "servers":
+            if not path or path[0] == "servers":
+                dirty.update(_owners) # Se sustituyó el documento o la sección completa
+            continue
+        server_id = path[1]
+        if len(path) == 3 and path[2] not in ("address", "pools", "clients"):
+            continue # Nombre, puerto, claves... no afectan a las direcciones
+        if len(path) < 4 or path[2] != "clients" or server_id not in _owners:
+            dirty.add(server_id)
+            continue
+        client_id = path[3]
+        if len(path) == 4:
+            address = op[2].get("address") if op[0] == "set" and hasattr(op[2], "get") else None
+            removed = op[0] == "del"
+        elif path[4] == "address":
+            address, removed = (op[2] if op[0] == "set" else None), False
+        else:
+            continue
+        for key in _owners[server_id]:
+            if removed:
+                _entries[(server_id, key)].remove(client_id)
+            else:
+                _entries[(server_id, key)].update(client_id, address)
+    for server_id in dirty:
+        _resync(data, server_id)
+
+
+def utilization(data, server_id):
+    """Uso de cada subred de `server_id` (ver AddressAllocator.usage) a partir del estado guardado.
+
+    Solo se recorren los clientes si el servidor aún no tiene estado.
+    Lanza ValueError si la dirección del servidor no es válida.
+    """
+    if server_id not in _owners:
+        server = data["servers"][server_id]
+        _pool_chains(server.get("address"), server.get("pools")) # ValueError si no es válida
+        _resync(data, server_id)
+    return [_entries[(server_id, key)].allocator.usage() for key in _owners[server_id]]
+
+
+def format_holes(usage):
+    """Número de huecos y los primeros tramos: "2 (10.0.0.5, 10.0.0.8-10.0.0.9)"."""
+    text = str(usage["holes"])
+    if usage["hole_ranges"]:
+        more = ", …" if usage["holes"] > len(usage["hole_ranges"]) else ""
+        text += f" ({', '.join(usage['hole_ranges'])}{more})"
+    return text
+
+
+def format_usage(usage):
+    """Línea corta para la interfaz: "10.0.0.0/24: 12 usadas, 242 libres, mayor tramo 240, 2 huecos"."""
+    return (f"{usage['network']}: {usage['used']} usadas, {usage['free']} libres, "
+            f"mayor tramo {usage['largest_free']}, huecos {format_holes(usage)}")
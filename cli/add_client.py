@@ -2,9 +2,17 @@ import json
 import os
 import uuid
 import datetime
-import subprocess
 import sys
-import ipaddress
+
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+import allocator
+import keys
+import models
+import netcheck
+import store
+import works
 
 try:
     from rich.console import Console
@@ -19,7 +27,7 @@ except ImportError:
 
 console = Console()
 
-WG_CONFIG_FILE = "wg_data.json"
+WG_CONFIG_FILE = store.DATA_FILE
 IP_SUBNET_PREFIX_DEFAULT = "10.10.10.1/24" # Fallback si no se puede derivar del servidor
 IP_START_OCTET = 2
 IP_MAX_OCTET = 254
@@ -30,8 +38,8 @@ def load_data(file_path):
         console.print(Panel(f"[bold red]Error:[/bold red] El archivo '{file_path}' no existe.", border_style="red"))
         return None
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        data = store.load(file_path)
+        allocator.load_state(file_path, store.version(data))
         return data
     except json.JSONDecodeError:
         console.print(Panel(f"[bold red]Error:[/bold red] El archivo '{file_path}' no contiene un JSON válido o está dañado.", border_style="red"))
@@ -43,75 +51,78 @@ def load_data(file_path):
 def save_data(file_path, data):
     """Guarda los datos en el archivo JSON con formato indentado."""
     try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        store.save(file_path, data)
         console.print(Panel(f"[green]Datos guardados exitosamente en '{file_path}'.[/green]", border_style="green"))
         return True # Indicar éxito
     except Exception as e:
         console.print(Panel(f"[bold red]Error al guardar los datos en '{file_path}':[/bold red] {e}", border_style="red"))
         return False # Indicar fallo
 
-def generate_wg_keys():
-    """Genera un par de claves privada y pública de WireGuard usando el comando 'wg'."""
+def apply_changes(file_path, ops, data=None):
+    """Persiste solo las operaciones indicadas (una fila en SQLite) en lugar del documento completo."""
     try:
-        # Generar clave privada
-        priv_key_proc = subprocess.run(['wg', 'genkey'], capture_output=True, text=True, check=True, encoding='utf-8')
-        private_key = priv_key_proc.stdout.strip()
-
-        # Generar clave pública desde la privada
-        pub_key_proc = subprocess.run(['wg', 'pubkey'], input=private_key, capture_output=True, text=True, check=True, encoding='utf-8')
-        public_key = pub_key_proc.stdout.strip()
-        
-        return private_key, public_key
-    except FileNotFoundError:
-        console.print("[bold yellow]Advertencia:[/bold yellow] Comando 'wg' no encontrado. Usando placeholders para las claves.")
-        console.print("Por favor, asegúrate de que las herramientas de WireGuard estén instaladas y en el PATH para generar claves reales.")
-        return "PLACEHOLDER_PRIVATE_KEY_wg_not_found", "PLACEHOLDER_PUBLIC_KEY_wg_not_found"
-    except subprocess.CalledProcessError as e:
-        console.print(f"[bold red]Error ejecutando el comando 'wg':[/bold red] {e}")
-        console.print("[yellow]Usando placeholders para las claves.[/yellow]")
-        return "PLACEHOLDER_PRIVATE_KEY_wg_error", "PLACEHOLDER_PUBLIC_KEY_wg_error"
+        merged = store.apply(file_path, ops, data)
+        if data is not None:
+            save_allocator_state(file_path, ops, data, merged)
+        console.print(Panel(f"[green]Datos guardados exitosamente en '{file_path}'.[/green]", border_style="green"))
+        return True # Indicar éxito
+    except Exception as e:
+        console.print(Panel(f"[bold red]Error al guardar los datos en '{file_path}':[/bold red] {e}", border_style="red"))
+        return False # Indicar fallo
 
-def generate_preshared_key():
-    """Genera una clave precompartida (PresharedKey) de WireGuard usando 'wg genpsk'."""
+def save_allocator_state(file_path, ops, data, merged=False):
+    """Anota las operaciones en los índices de direcciones (asignadores y netcheck) y guarda el de los asignadores."""
+    if merged:
+        allocator.reset() # Otro proceso escribió entretanto: se reconstruyen al consultarlos
+        netcheck.reset()
+    else:
+        allocator.refresh(data, ops)
+        netcheck.refresh(data, ops)
     try:
-        psk_proc = subprocess.run(['wg', 'genpsk'], capture_output=True, text=True, check=True, encoding='utf-8')
-        return psk_proc.stdout.strip()
-    except FileNotFoundError:
-        console.print("[bold yellow]Advertencia:[/bold yellow] Comando 'wg' no encontrado. No se pudo generar PresharedKey.")
-        console.print("Por favor, asegúrate de que las herramientas de WireGuard estén instaladas y en el PATH.")
-        return None
-    except subprocess.CalledProcessError as e:
-        console.print(f"[bold red]Error ejecutando 'wg genpsk':[/bold red] {e}")
-        return None
+        allocator.save_state(file_path, store.version(data))
+    except OSError as e:
+        console.print(f"[yellow]No se pudo guardar el estado de direcciones: {e}[/yellow]")
+
+def generate_wg_keys():
+    """Genera un par de claves privada y pública de WireGuard (X25519 en el propio proceso, ver keys.py)."""
+    return keys.generate_keypair()
+
+def generate_preshared_key():
+    """Genera una clave precompartida (PresharedKey) de WireGuard."""
+    return keys.generate_preshared_key()
 
-def get_next_available_ip(clients_data, server_address):
-    """Obtiene la siguiente dirección IP disponible en la subred especificada por el servidor."""
+def get_next_available_ip(server_id, clients_data, server_address, pools=None):
+    """Obtiene la siguiente dirección IP disponible en la subred del servidor `server_id` (o en sus pools)."""
     try:
-        # Crear el objeto de red a partir de la dirección del servidor
-        network = ipaddress.ip_network(server_address, strict=False)
-        server_ip = ipaddress.ip_address(server_address.split('/')[0])  # Extraer solo la IP del servidor
+        # Asignador de la subred (una dirección por familia en doble pila), sincronizado
+        # solo con los clientes que cambiaron. Si se llena se pasa al siguiente pool.
+        next_ip = allocator.next_client_address(server_id, server_address, clients_data or {}, pools)
     except ValueError:
         console.print(Panel(f"[bold red]Error:[/bold red] Dirección del servidor inválida: {server_address}", border_style="red"))
         return None
+    for client_address in allocator.invalid_addresses(server_id, server_address, pools=pools).values():
+        console.print(Panel(f"[yellow]Advertencia:[/yellow] Dirección IP inválida: {client_address}", border_style="yellow"))
+    return next_ip  # IP con máscara /32 (y /128 en doble pila), o None si no hay IPs disponibles
 
-    used_ips = set()
-    if clients_data:
-        for client_details in clients_data.values():
-            client_address = client_details.get("address")
-            if client_address:
-                try:
-                    ip = ipaddress.ip_address(client_address.split('/')[0])  # Extraer solo la IP
-                    used_ips.add(ip)
-                except ValueError:
-                    console.print(Panel(f"[yellow]Advertencia:[/yellow] Dirección IP inválida: {client_address}", border_style="yellow"))
-
-    # Iterar sobre todas las IPs posibles en la subred, excluyendo la del servidor
-    for ip in network.hosts():
-        if ip != server_ip and ip not in used_ips:
-            return f"{ip}/32"  # Devuelve la IP con máscara /32
-
-    return None  # No hay IPs disponibles
+def build_client(client_uuid, name, address, private_key, public_key, preshared_key, server, timestamp):
+    """Registro canónico de un cliente nuevo con los valores por defecto del servidor."""
+    persistent_keepalive_to_set = server.persistent_keepalive or 0
+    if persistent_keepalive_to_set < 0:
+        persistent_keepalive_to_set = 0
+    return models.Client(
+        id=client_uuid,
+        name=name,
+        address=address,
+        private_key=private_key,
+        public_key=public_key,
+        preshared_key=preshared_key,
+        created_at=timestamp,
+        updated_at=timestamp,
+        dns=server.dns if isinstance(server.dns, str) and server.dns else None,
+        persistent_keepalive=persistent_keepalive_to_set,
+        enable=True,
+        extra={"id": client_uuid},
+    ).to_dict()
 
 def add_new_client(client_name, server_id):
     """
@@ -135,46 +146,29 @@ def add_new_client(client_name, server_id):
     if "clients" not in server_config or not isinstance(server_config["clients"], dict):
         server_config["clients"] = {}
 
-    server_address_from_config = server_config.get("address")
+    server = models.Server.from_dict(server_id, server_config, with_clients=False)
+    server_address_from_config = (server.addresses or [None])[0]
     if not server_address_from_config:
         console.print(Panel(f"[bold red]Error:[/bold red] 'address' del servidor no encontrada o vacía. No se puede generar una dirección IP para el cliente.", border_style="red"))
         return
 
+    if store.find_client(WG_CONFIG_FILE, server_id, "name", client_name.strip()):
+        console.print(Panel(f"[bold red]Error:[/bold red] Ya existe un cliente llamado '{client_name.strip()}' en el servidor '{server_id}'.", border_style="red"))
+        return
+
     client_uuid = str(uuid.uuid4())
     private_key, public_key = generate_wg_keys()
-    next_ip = get_next_available_ip(server_config.get("clients"), server_address_from_config)
+    next_ip = get_next_available_ip(server_id, server_config.get("clients"), server.address, server.pools)
     if not next_ip:
-        console.print(Panel(f"[bold red]Error:[/bold red] No hay direcciones IP disponibles en la subred derivada de {server_address_from_config}.", border_style="red"))
+        console.print(Panel(f"[bold red]Error:[/bold red] No hay direcciones IP disponibles en la subred derivada de {server.address} ni en sus pools.", border_style="red"))
         return
 
     timestamp = datetime.datetime.utcnow().isoformat(timespec='milliseconds') + "Z"
-    server_dns_config = server_config.get("dns")
-    client_dns_to_set = server_dns_config if isinstance(server_dns_config, str) else None
-    preshared_key_to_set = None
-    generate_psk_str = server_config.get("PresharedKey", "False")
-    if str(generate_psk_str).lower() == "true":
-        preshared_key_to_set = generate_preshared_key()
-    persistent_keepalive_default = 0
-    persistent_keepalive_to_set = server_config.get("persistentKeepalive", persistent_keepalive_default)
-    if not isinstance(persistent_keepalive_to_set, int) or persistent_keepalive_to_set < 0:
-        persistent_keepalive_to_set = persistent_keepalive_default
-
-    new_client_data = {
-        "id": client_uuid,
-        "name": client_name.strip(),
-        "address": next_ip,
-        "privateKey": private_key,
-        "publicKey": public_key,
-        "PresharedKey": preshared_key_to_set,
-        "createdAt": timestamp,
-        "updatedAt": timestamp,
-        "dns": client_dns_to_set,
-        "persistentKeepalive": persistent_keepalive_to_set,
-        "allowedIPs": "0.0.0.0/0, ::/0",
-        "enabled": True
-    }
+    preshared_key_to_set = generate_preshared_key() if server.generate_psk else None
+    new_client_data = build_client(client_uuid, client_name.strip(), next_ip, private_key, public_key,
+                                   preshared_key_to_set, server, timestamp)
     server_config["clients"][client_uuid] = new_client_data
-    if save_data(WG_CONFIG_FILE, config_data):
+    if apply_changes(WG_CONFIG_FILE, [("set", ["servers", server_id, "clients", client_uuid], new_client_data)], config_data):
         console.print(Panel(f"[green]Cliente '{client_name}' añadido exitosamente al servidor '{server_id}'.[/green]", border_style="green"))
         console.print("\n[bold green]Cliente añadido y guardado. Detalles:[/bold green]")
         details_table = Table(show_header=True, header_style="bold magenta", box=HEAVY_HEAD)
@@ -191,6 +185,65 @@ def add_new_client(client_name, server_id):
     else:
         console.print(Panel("[bold red]Error al guardar los datos del cliente. No se mostrarán los detalles en tabla.[/bold red]", border_style="red"))
 
+def add_new_clients(client_names, server_id, contiguous=False):
+    """
+    Alta masiva: añade varios clientes a un servidor con una sola carga y una sola escritura.
+    Las claves se generan en lote (works.generate_keys(n)) y las direcciones en una sola pasada
+    (allocator.allocate_many; con contiguous=True en un bloque consecutivo).
+    Devuelve la lista de ids creados.
+    """
+    names = [name.strip() for name in client_names if name and name.strip()]
+    if not names:
+        console.print(Panel("[bold red]Error:[/bold red] No se indicó ningún nombre de cliente.", border_style="red"))
+        return []
+    if len(set(names)) != len(names):
+        console.print(Panel("[bold red]Error:[/bold red] Hay nombres de cliente repetidos en la lista.", border_style="red"))
+        return []
+
+    config_data = load_data(WG_CONFIG_FILE)
+    if not config_data:
+        console.print(Panel("[bold red]Error:[/bold red] No se pudo cargar la configuración. Operación cancelada.", border_style="red"))
+        return []
+    if "servers" not in config_data or server_id not in config_data["servers"]:
+        console.print(Panel(f"[bold red]Error:[/bold red] El servidor '{server_id}' no existe.", border_style="red"))
+        return []
+
+    server_config = config_data["servers"][server_id]
+    if "clients" not in server_config or not isinstance(server_config["clients"], dict):
+        server_config["clients"] = {}
+    server = models.Server.from_dict(server_id, server_config, with_clients=False)
+    server_address_from_config = (server.addresses or [None])[0]
+    if not server_address_from_config:
+        console.print(Panel(f"[bold red]Error:[/bold red] 'address' del servidor no encontrada o vacía. No se pueden generar direcciones IP.", border_style="red"))
+        return []
+
+    existing = {client.get("name") for client in server_config["clients"].values()}
+    repeated = [name for name in names if name in existing]
+    if repeated:
+        console.print(Panel(f"[bold red]Error:[/bold red] Ya existen en el servidor '{server_id}': {', '.join(repeated)}.", border_style="red"))
+        return []
+
+    try:
+        addresses = allocator.allocate_many(server_id, server_config, len(names), contiguous=contiguous)
+    except ValueError as e: # AllocationError: "Solo quedan k direcciones libres..."
+        console.print(Panel(f"[bold red]Error:[/bold red] {e}", border_style="red"))
+        return []
+
+    keypairs = works.generate_keys(len(names))
+    psks = works.generate_psks(len(names)) if server.generate_psk else [None] * len(names)
+    timestamp = datetime.datetime.utcnow().isoformat(timespec='milliseconds') + "Z"
+    ops = []
+    for name, address, (private_key, public_key), psk in zip(names, addresses, keypairs, psks):
+        client_uuid = str(uuid.uuid4())
+        new_client_data = build_client(client_uuid, name, address, private_key, public_key, psk, server, timestamp)
+        server_config["clients"][client_uuid] = new_client_data
+        ops.append(("set", ["servers", server_id, "clients", client_uuid], new_client_data))
+
+    if apply_changes(WG_CONFIG_FILE, ops, config_data):
+        console.print(Panel(f"[green]{len(ops)} clientes añadidos exitosamente al servidor '{server_id}'.[/green]", border_style="green"))
+        return [op[1][-1] for op in ops]
+    return []
+
 # Nueva función para agregar un servidor
 
 def add_new_server(server_id, server_data):
@@ -202,9 +255,16 @@ def add_new_server(server_id, server_data):
     if server_id in config_data["servers"]:
         console.print(Panel(f"[red]El servidor '{server_id}' ya existe.[/red]", border_style="red"))
         return
+    # Misma validación que el formulario del TUI: sin solapes con otros servidores ni direcciones inválidas.
+    conflicts = netcheck.index_for(config_data, all_servers=True).check_server(
+        server_id, server_data.get("address"), server_data.get("pools"))
+    if conflicts:
+        details = "\n".join(f"{conflict.address}: {conflict.detail}" for conflict in conflicts)
+        console.print(Panel(f"[bold red]Conflicto de direcciones:[/bold red]\n{details}", border_style="red"))
+        return
     server_data["clients"] = {}
     config_data["servers"][server_id] = server_data
-    if save_data(WG_CONFIG_FILE, config_data):
+    if apply_changes(WG_CONFIG_FILE, [("set", ["servers", server_id], server_data)], config_data):
         console.print(Panel(f"[green]Servidor '{server_id}' añadido exitosamente.[/green]", border_style="green"))
     else:
         console.print(Panel(f"[red]No se pudo guardar el servidor en el archivo.[/red]", border_style="red"))
@@ -212,9 +272,12 @@ def add_new_server(server_id, server_data):
 if __name__ == "__main__":
     console.rule("[bold blue]Añadir Nuevo Cliente WireGuard[/bold blue]")
     server_id = console.input("[b]Introduce el ID del servidor al que añadir el cliente:[/b] ")
-    client_name_input = console.input("[b]Introduce el nombre para el nuevo cliente:[/b] ")
+    client_name_input = console.input("[b]Introduce el nombre para el nuevo cliente (varios separados por comas):[/b] ")
     if client_name_input and server_id:
-        add_new_client(client_name_input, server_id)
+        if "," in client_name_input:
+            add_new_clients(client_name_input.split(","), server_id)
+        else:
+            add_new_client(client_name_input, server_id)
     else:
         console.print("[yellow]Operación cancelada. No se añadió ningún cliente.[/yellow]")
 
@@ -228,16 +291,15 @@ if __name__ == "__main__":
         persistent_keepalive = console.input("PersistentKeepalive (0 para desactivar): ")
         interface = console.input("Nombre de la interfaz: ")
         preshared = Confirm.ask("¿Habilitar PresharedKey?", default=True)
-        server_data = {
-            "name": new_server_id,
-            "privateKey": "",
-            "publicKey": "",
-            "address": address,
-            "dns": dns,
-            "port": int(port),
-            "PresharedKey": str(preshared),
-            "endpoint": endpoint,
-            "persistentKeepalive": int(persistent_keepalive),
-            "interface": interface
-        }
+        server_data = models.Server(
+            name=new_server_id,
+            address=address,
+            dns=dns,
+            port=models.to_int(port, 51820),
+            generate_psk=preshared,
+            endpoint=endpoint,
+            persistent_keepalive=models.to_int(persistent_keepalive),
+            interface=interface,
+            enable=True,
+        ).to_dict(with_clients=False)
         add_new_server(new_server_id, server_data)
\ No newline at end of file
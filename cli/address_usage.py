@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+import allocator
+import store
+
+from rich.console import Console
+from rich.table import Table
+
+# Uso de direcciones por servidor: usadas, libres, mayor tramo libre y huecos.
+# Se lee del estado de los asignadores guardado junto a los datos
+# (<archivo>.alloc.json, ver allocator.py); solo si falta o es de otra versión
+# se recorren los clientes, y entonces se guarda para la próxima vez.
+# Uso: python cli/address_usage.py [archivo]
+
+console = Console()
+
+def collect_rows(data):
+    """(servidor, subred, usadas, libres, mayor tramo, huecos) de cada subred de cada servidor."""
+    rows = []
+    for name, server_id in store.server_names(data.get("servers") or {}):
+        try:
+            usages = allocator.utilization(data, server_id)
+        except ValueError as e:
+            rows.append((name, f"[red]{e}[/red]", "", "", "", ""))
+            continue
+        for usage in usages:
+            rows.append((name, usage["network"], str(usage["used"]), str(usage["free"]),
+                         str(usage["largest_free"]), allocator.format_holes(usage)))
+    return rows
+
+def print_usage(rows, seconds, from_state):
+    """Muestra una fila por subred de cada servidor."""
+    table = Table(title="Uso de direcciones", show_header=True, header_style="bold magenta")
+    table.add_column("Servidor", style="cyan")
+    table.add_column("Subred")
+    table.add_column("Usadas", justify="right")
+    table.add_column("Libres", justify="right", style="green")
+    table.add_column("Mayor tramo libre", justify="right")
+    table.add_column("Huecos", style="dim")
+    for row in rows:
+        table.add_row(*row)
+    console.print(table)
+    origin = "estado guardado" if from_state else "clientes recorridos"
+    console.print(f"[dim]Calculado en {seconds:.3f}s ({origin})[/dim]")
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else store.DATA_FILE
+    if not os.path.exists(path):
+        console.print(f"[red]El archivo '{path}' no existe.[/red]")
+        sys.exit(2)
+    data = store.load(path)
+    start = time.perf_counter()
+    from_state = allocator.load_state(path, store.version(data))
+    rows = collect_rows(data)
+    print_usage(rows, time.perf_counter() - start, from_state)
+    if not from_state:
+        allocator.save_state(path, store.version(data))
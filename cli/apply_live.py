@@ -0,0 +1,83 @@
+import argparse
+import os
+import sys
+
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+import liveapply
+import store
+
+from rich.console import Console
+from rich.table import Table
+from rich.panel import Panel
+
+# Aplica los clientes habilitados de un servidor a su interfaz en marcha con los
+# mínimos 'wg set' (ver liveapply.py), sin 'wg-quick down/up'.
+# Uso: python cli/apply_live.py [--server ID] [--interface wg0] [--dry-run] [--file archivo]
+# Con --dry-run solo muestra los cambios y las órdenes que se lanzarían.
+# La interfaz es la del servidor ('wgInterface') o la de --interface; no hay
+# interfaz por defecto. No se aplica si otro servidor habilitado usa la misma.
+
+console = Console()
+
+def print_result(result):
+    """Muestra los cambios y las órdenes 'wg' de un servidor."""
+    changes = result["changes"]
+    if changes:
+        table = Table(title=f"Cambios en {result['interface']}", show_header=True, header_style="bold magenta")
+        table.add_column("Acción", style="bold")
+        table.add_column("Peer", style="cyan")
+        table.add_column("AllowedIPs")
+        table.add_column("Campos", style="dim")
+        for change in changes:
+            table.add_row(change.action, change.peer.public_key, ", ".join(change.peer.allowed_ips),
+                          ", ".join(change.fields))
+        console.print(table)
+        for args in result["commands"]:
+            console.print(f"[dim]{liveapply.WG_BIN} {' '.join(args)}[/dim]")
+    resumen = ", ".join(f"{action}: {count}" for action, count in liveapply.summary(changes).items())
+    title = "Simulación (no se aplicó nada)" if result["dry_run"] else "Aplicado"
+    console.print(Panel(f"{resumen}\nÓrdenes 'wg set': {len(result['commands'])}", title=title,
+                        border_style="yellow" if result["dry_run"] else "green"))
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python cli/apply_live.py",
+                                     description="Aplica los clientes de un servidor a su interfaz en marcha con 'wg set'.")
+    parser.add_argument("--server", metavar="ID", help="servidor a aplicar (obligatorio si hay varios)")
+    parser.add_argument("--interface", metavar="wg0", help="interfaz WireGuard (por defecto, la 'wgInterface' del servidor)")
+    parser.add_argument("--dry-run", action="store_true", help="solo muestra los cambios y las órdenes")
+    parser.add_argument("--file", default=store.DATA_FILE, metavar="archivo", help=f"datos (por defecto {store.DATA_FILE})")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    server_id, interface, dry_run, path = args.server, args.interface, args.dry_run, args.file
+    if not os.path.exists(path):
+        console.print(f"[red]El archivo '{path}' no existe.[/red]")
+        sys.exit(2)
+    servers = store.load(path).get("servers") or {}
+    if server_id is None:
+        if len(servers) != 1:
+            console.print("[red]Indica el servidor con --server ID (hay varios o ninguno).[/red]")
+            sys.exit(2)
+        server_id = next(iter(servers))
+    if server_id not in servers:
+        console.print(f"[red]El servidor '{server_id}' no existe.[/red]")
+        sys.exit(2)
+    interface = interface or liveapply.interface_name(servers[server_id])
+    if interface is None:
+        console.print(f"[red]El servidor '{server_id}' no tiene interfaz WireGuard ('wgInterface'); indícala con --interface.[/red]")
+        sys.exit(2)
+    others = [sid for sid in servers if sid != server_id and servers[sid].get("enable")
+              and liveapply.interface_name(servers[sid]) == interface]
+    if others:
+        console.print(f"[red]La interfaz '{interface}' también es del servidor {', '.join(others)}; "
+                      f"aplicar este quitaría sus peers.[/red]")
+        sys.exit(2)
+    try:
+        result = liveapply.apply(servers[server_id], interface, dry_run=dry_run)
+    except liveapply.ApplyError as e:
+        console.print(f"[bold red]Error:[/bold red] {e}")
+        sys.exit(1)
+    print_result(result)
@@ -0,0 +1,57 @@
+import argparse
+import os
+import sys
+
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+import keyaudit
+import store
+
+from rich.console import Console
+from rich.table import Table
+from rich.panel import Panel
+
+# Audita las claves de todos los servidores y clientes (ver keyaudit.py).
+# Uso: python cli/audit_keys.py [archivo] [--workers N]
+# Sale con código 1 si encuentra algún problema.
+
+console = Console()
+
+def print_report(findings, stats):
+    """Muestra los hallazgos en una tabla y el resumen con el rendimiento."""
+    if findings:
+        table = Table(title="Problemas de claves", show_header=True, header_style="bold magenta")
+        table.add_column("Tipo", style="bold red")
+        table.add_column("Servidor", style="cyan")
+        table.add_column("Cliente", style="cyan")
+        table.add_column("Campo")
+        table.add_column("Detalle", style="dim")
+        for finding in findings:
+            table.add_row(finding.kind, str(finding.server_id or "-"), str(finding.client_id or "(servidor)"),
+                          finding.field, finding.detail)
+        console.print(table)
+    counts = keyaudit.summary(findings)
+    resumen = ", ".join(f"{kind}: {count}" for kind, count in counts.items())
+    style = "red" if findings else "green"
+    console.print(Panel(
+        f"Registros: {stats['records']} · claves derivadas: {stats['derived']} "
+        f"en {stats['seconds']:.2f}s ({stats['rate']:.0f}/s)\n{resumen}",
+        title="Auditoría de claves", border_style=style))
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python cli/audit_keys.py",
+                                     description="Audita las claves de todos los servidores y clientes.")
+    parser.add_argument("archivo", nargs="?", default=store.DATA_FILE, help=f"datos (por defecto {store.DATA_FILE})")
+    parser.add_argument("--workers", type=int, metavar="N", help="procesos para derivar las claves públicas")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    path = args.archivo
+    if not os.path.exists(path):
+        console.print(f"[red]El archivo '{path}' no existe.[/red]")
+        sys.exit(2)
+    findings, stats = keyaudit.audit(store.load(path), workers=args.workers)
+    print_report(findings, stats)
+    sys.exit(1 if findings else 0)
@@ -0,0 +1,48 @@
+import os
+import sys
+import time
+
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+import netcheck
+import store
+
+from rich.console import Console
+from rich.table import Table
+from rich.panel import Panel
+
+# Comprueba solapes de subredes entre servidores, direcciones de cliente
+# duplicadas y clientes fuera de la red de su servidor (ver netcheck.py).
+# Uso: python cli/check_network.py [archivo]
+# Sale con código 1 si encuentra algún conflicto.
+
+console = Console()
+
+def print_report(conflicts, seconds):
+    """Muestra los conflictos en una tabla y un resumen."""
+    if conflicts:
+        table = Table(title="Conflictos de direcciones", show_header=True, header_style="bold magenta")
+        table.add_column("Tipo", style="bold red")
+        table.add_column("Servidor", style="cyan")
+        table.add_column("Cliente", style="cyan")
+        table.add_column("Dirección")
+        table.add_column("Detalle", style="dim")
+        for conflict in conflicts:
+            table.add_row(conflict.kind, str(conflict.server_id or "-"), str(conflict.client_id or "(servidor)"),
+                          conflict.address, conflict.detail)
+        console.print(table)
+    resumen = ", ".join(f"{kind}: {count}" for kind, count in netcheck.summary(conflicts).items())
+    console.print(Panel(f"{resumen}\nComprobado en {seconds:.3f}s", title="Comprobación de red",
+                        border_style="red" if conflicts else "green"))
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else store.DATA_FILE
+    if not os.path.exists(path):
+        console.print(f"[red]El archivo '{path}' no existe.[/red]")
+        sys.exit(2)
+    data = store.load(path)
+    start = time.perf_counter()
+    conflicts = netcheck.check(data)
+    print_report(conflicts, time.perf_counter() - start)
+    sys.exit(1 if conflicts else 0)
@@ -4,6 +4,14 @@ import json
 import datetime
 import ipaddress
 
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+import models
+import netcheck
+import store
+from editsession import EditSession
+
 try:
     from rich.console import Console
     from rich.table import Table
@@ -26,8 +34,7 @@ def load_config_data():
         console.print(f"[bold red]Error:[/bold red] El archivo de configuración '{WG_CONFIG_FILE}' no existe.")
         return None
     try:
-        with open(WG_CONFIG_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return store.load(WG_CONFIG_FILE)
     except json.JSONDecodeError:
         console.print(f"[bold red]Error:[/bold red] El archivo '{WG_CONFIG_FILE}' no contiene un JSON válido.")
         return None
@@ -38,8 +45,20 @@ def load_config_data():
 def save_config_data(data):
     """Guarda los datos completos en el archivo JSON de configuración."""
     try:
-        with open(WG_CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        store.save(WG_CONFIG_FILE, data)
+        console.print(f"[green]Datos guardados exitosamente en '{WG_CONFIG_FILE}'.[/green]")
+        return True
+    except Exception as e:
+        console.print(f"[bold red]Error al guardar los datos en '{WG_CONFIG_FILE}':[/bold red] {e}")
+        return False
+
+def apply_config_changes(ops, data):
+    """Persiste solo las operaciones indicadas (en modo diario se añaden al journal)."""
+    try:
+        if store.apply(WG_CONFIG_FILE, ops, data):
+            netcheck.reset() # Se fusionaron cambios de otro proceso
+        else:
+            netcheck.refresh(data, ops)
         console.print(f"[green]Datos guardados exitosamente en '{WG_CONFIG_FILE}'.[/green]")
         return True
     except Exception as e:
@@ -60,30 +79,21 @@ def edit_client_interactive(client_uuid_to_edit):
         console.print(f"[red]Error: Cliente con UUID '{client_uuid_to_edit}' no encontrado.[/red]")
         return False
 
-    client_to_edit = config_data["clients"][client_uuid_to_edit]
-
-    # Crear una copia de los datos del cliente SIN 'updatedAt' para la comparación de cambios.
-    # Esto asegura que solo los cambios en los datos reales del cliente activen un guardado.
-    original_client_comparable_data = client_to_edit.copy()
-    original_client_comparable_data.pop("updatedAt", None) # Quitar updatedAt para la comparación base
-    original_client_comparable_str = json.dumps(original_client_comparable_data, sort_keys=True)
-
-    editable_client = json.loads(json.dumps(client_to_edit)) # Copia profunda de trabajo
+    # Solo se registran los campos tocados; el registro en caché no se modifica hasta guardar.
+    session = EditSession(config_data["clients"][client_uuid_to_edit], ["clients", client_uuid_to_edit])
 
     editable_fields = {
         "1": {"key": "name", "prompt": "Nuevo nombre"},
         "2": {"key": "dns", "prompt": "Nuevos DNS (separados por coma, ej: 1.1.1.1,8.8.8.8 o dejar vacío para ninguno)"},
         "3": {"key": "address", "prompt": "Nueva Dirección IP completa con máscara (ej: 10.10.10.1/24)"},
         "4": {"key": "persistentKeepalive", "prompt": "Nuevo Persistent Keepalive (ej: 25 o 0 para desactivar)"},
-        "5": {"key": "enabled", "prompt": "Habilitado (s/n)"}
+        "5": {"key": "enable", "prompt": "Habilitado (s/n)"}
         # La opción de eliminar se manejará por separado en el menú de acciones.
     }
 
-    made_changes = False # Flag para indicar si el usuario intentó hacer algún cambio en un campo
-
     while True:
         console.clear()
-        console.print(Panel(f"[bold yellow]Editando Cliente: {editable_client.get('name', client_uuid_to_edit)}[/bold yellow]",
+        console.print(Panel(f"[bold yellow]Editando Cliente: {session.get('name', client_uuid_to_edit)}[/bold yellow]",
                           border_style="yellow", expand=False))
         
         current_values_table = Table(title="Valores Actuales y Opciones de Edición", show_header=False, box=None)
@@ -93,7 +103,7 @@ def edit_client_interactive(client_uuid_to_edit):
 
         for opt, field_info in editable_fields.items():
             key = field_info["key"]
-            value = editable_client.get(key)
+            value = session.get(key)
             if isinstance(value, list):
                 display_value = ", ".join(value) if value else "[italic dim]Ninguno[/italic dim]"
             elif value is None:
@@ -113,7 +123,7 @@ def edit_client_interactive(client_uuid_to_edit):
                             default="C").upper()
 
         if choice == "C":
-            if made_changes:
+            if session.dirty:
                 if Confirm.ask("[yellow]Tienes cambios sin guardar. ¿Estás seguro de que quieres cancelar y perder los cambios?", default=False):
                     console.print("[yellow]Cambios cancelados.[/yellow]")
                     return False
@@ -124,22 +134,25 @@ def edit_client_interactive(client_uuid_to_edit):
                 return False # No se hicieron cambios o se cancelaron
 
         elif choice == "S":
-            # Preparar la versión actual de editable_client para comparación (sin updatedAt)
-            current_editable_comparable_data = editable_client.copy()
-            current_editable_comparable_data.pop("updatedAt", None)
-            current_editable_comparable_str = json.dumps(current_editable_comparable_data, sort_keys=True)
-
-            if current_editable_comparable_str == original_client_comparable_str:
+            if not session.dirty:
                 console.print("[yellow]No se detectaron cambios para guardar.[/yellow]")
                 if not Confirm.ask("¿Deseas continuar editando?", default=True):
                     return False # Salir sin guardar
                 else:
                     continue # Volver al menú de edición
             
-            # Si hay cambios reales, actualizar 'updatedAt' y proceder a guardar
-            editable_client["updatedAt"] = datetime.datetime.utcnow().isoformat(timespec='milliseconds') + "Z"
-            config_data["clients"][client_uuid_to_edit] = editable_client
-            if save_config_data(config_data):
+            # Validar la dirección contra el resto de clientes y la red del servidor (netcheck).
+            if "address" in session.touched():
+                conflicts = netcheck.index_for(config_data).check_client(None, client_uuid_to_edit, session.get("address"))
+                if conflicts:
+                    for conflict in conflicts:
+                        console.print(f"[red]Dirección {conflict.address}: {conflict.detail}.[/red]")
+                    continue # Volver al menú de edición sin guardar
+
+            # Si hay cambios reales, actualizar 'updatedAt' y guardar solo los campos modificados
+            session.set("updatedAt", datetime.datetime.utcnow().isoformat(timespec='milliseconds') + "Z")
+            ops = session.ops()
+            if apply_config_changes(ops, store.apply_ops(config_data, ops)):
                 console.print("[green]Cliente actualizado exitosamente.[/green]")
                 return True # Cambios guardados
             else:
@@ -147,10 +160,10 @@ def edit_client_interactive(client_uuid_to_edit):
                 return False # Error al guardar
 
         elif choice == "D":
-            client_name_display = editable_client.get('name', client_uuid_to_edit)
+            client_name_display = session.get('name', client_uuid_to_edit)
             if Confirm.ask(f"[bold red]¿Estás ABSOLUTAMENTE SEGURO de que quieres eliminar al cliente '{client_name_display}' ({client_uuid_to_edit})?[/bold red]\nEsta acción no se puede deshacer.", default=False):
                 del config_data["clients"][client_uuid_to_edit]
-                if save_config_data(config_data):
+                if apply_config_changes([("del", ["clients", client_uuid_to_edit])], config_data):
                     console.print(f"[green]Cliente '{client_name_display}' eliminado exitosamente.[/green]")
                     return True # Indicar que se hizo un cambio (eliminación) y se guardó
                 else:
@@ -165,52 +178,44 @@ def edit_client_interactive(client_uuid_to_edit):
         elif choice in editable_fields:
             field_key = editable_fields[choice]["key"]
             prompt_text = editable_fields[choice]["prompt"]
-            current_value = editable_client.get(field_key)
-
-            # Guardar el valor serializado del campo ANTES de cualquier modificación
-            old_field_value_json = json.dumps(current_value)
+            current_value = session.get(field_key)
 
             new_value_str = Prompt.ask(f"{prompt_text} (actual: {current_value if current_value is not None else 'No establecido'})")
             
             try:
                 if field_key == "name":
                     if new_value_str.strip():
-                        editable_client[field_key] = new_value_str.strip()
+                        session.set(field_key, new_value_str.strip())
                     else:
                         console.print("[red]El nombre no puede estar vacío.[/red]")
                 elif field_key == "dns":
                     cleaned_dns_str = new_value_str.strip()
                     if cleaned_dns_str:
-                        editable_client[field_key] = cleaned_dns_str
+                        session.set(field_key, cleaned_dns_str)
                     else:
-                        editable_client[field_key] = None
+                        session.set(field_key, None)
                 elif field_key == "address":
                     if new_value_str.strip():
-                        editable_client[field_key] = new_value_str.strip()
+                        session.set(field_key, models.join_addresses(models.split_addresses(new_value_str)))
                     else:
                         console.print("[red]La dirección no puede estar vacía.[/red]")
                 elif field_key == "persistentKeepalive":
                     cleaned_value = new_value_str.strip()
                     if not cleaned_value or cleaned_value == "0":
-                        editable_client[field_key] = 0 
+                        session.set(field_key, 0)
                     else:
                         value_as_int = int(cleaned_value) 
                         if value_as_int < 0:
                             console.print("[red]Persistent Keepalive debe ser un entero no negativo.[/red]")
                         else:
-                            editable_client[field_key] = value_as_int # Guardar como entero
-                elif field_key == "enabled":
+                            session.set(field_key, value_as_int) # Guardar como entero
+                elif field_key == "enable":
                     if new_value_str.lower() in ['s', 'si', 'true', '1', 'y', 'yes']:
-                        editable_client[field_key] = True
+                        session.set(field_key, True)
                     elif new_value_str.lower() in ['n', 'no', 'false', '0']:
-                        editable_client[field_key] = False
+                        session.set(field_key, False)
                     else:
                         console.print("[red]Valor inválido para 'Habilitado'. Usa s/n.[/red]")
-                
-                # Comprobar si el valor del campo realmente cambió después de la operación
-                new_field_value_json = json.dumps(editable_client.get(field_key))
-                if old_field_value_json != new_field_value_json:
-                    made_changes = True # Se intentó un cambio que resultó en un valor diferente para este campo
 
             except ValueError:
                 console.print(f"[red]Valor inválido para {field_key}. Intenta de nuevo.[/red]")
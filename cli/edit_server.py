@@ -1,5 +1,13 @@
 import os
+import sys
 import json
+
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+import models
+import store
+
 from rich.console import Console
 from rich.prompt import Prompt, Confirm
 from rich.panel import Panel
@@ -13,9 +21,7 @@ def load_server_config():
         console.print(f"[bold red]Error:[/bold red] El archivo '{WG_CONFIG_FILE}' no existe.")
         return None
     try:
-        with open(WG_CONFIG_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            return data.get("server", {})
+        return store.load(WG_CONFIG_FILE).get("server", {})
     except json.JSONDecodeError:
         console.print(f"[bold red]Error:[/bold red] El archivo '{WG_CONFIG_FILE}' no contiene un JSON válido.")
         return None
@@ -26,11 +32,8 @@ def load_server_config():
 def save_server_config(server_config):
     """Guarda la configuración del servidor en el archivo JSON."""
     try:
-        with open(WG_CONFIG_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        data["server"] = server_config
-        with open(WG_CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        # Solo se escribe la sección 'server': si otro proceso añadió clientes, se conservan.
+        store.apply(WG_CONFIG_FILE, [("set", ["server"], server_config)])
         console.print(f"[green]Configuración del servidor guardada exitosamente en '{WG_CONFIG_FILE}'.[/green]")
     except Exception as e:
         console.print(f"[bold red]Error al guardar la configuración del servidor:[/bold red] {e}")
@@ -40,6 +43,7 @@ def edit_server_config():
     server_config = load_server_config()
     if not server_config:
         return
+    server_config = dict(server_config) # Copia de trabajo: el documento en caché es compartido
 
     editable_fields = {
         "1": {"key": "address", "prompt": "Nueva dirección IP completa con máscara (ej: 10.0.10.1/24)"},
@@ -80,6 +84,8 @@ def edit_server_config():
                 server_config[field_key] = int(new_value)
             except ValueError:
                 console.print(f"[red]Valor inválido para {field_key}. Debe ser un número.[/red]")
+        elif field_key == "address":
+            server_config[field_key] = models.join_addresses(models.split_addresses(new_value))
         else:
             server_config[field_key] = new_value
 
@@ -0,0 +1,63 @@
+import argparse
+import os
+import sys
+
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+import export
+import store
+
+from rich.console import Console
+from rich.panel import Panel
+
+# Exporta el .conf (y opcionalmente el QR) de todos los clientes de un servidor
+# o de todos los servidores a un directorio o a un .zip (ver export.py).
+# Uso: python cli/export_clients.py destino [--server ID] [--qr png,svg] [--workers N] [--file archivo]
+
+console = Console()
+
+def print_progress(done, total):
+    """Línea de progreso que se reescribe en el sitio."""
+    percent = 100 * done // total if total else 100
+    console.print(f"\r{done}/{total} clientes ({percent}%)", end="")
+
+def run_export(data, server_ids, target, qr_formats=(), workers=None):
+    """Exporta y muestra el resumen con el rendimiento. Devuelve True si terminó bien."""
+    try:
+        stats = export.export_clients(data, server_ids, target, qr_formats, workers=workers, progress=print_progress)
+    except (ValueError, RuntimeError, OSError) as e:
+        console.print(f"\n[bold red]Error:[/bold red] {e}")
+        return False
+    console.print()
+    per_file = 1000 * stats["seconds"] / stats["files"] if stats["files"] else 0.0
+    console.print(Panel(
+        f"Clientes: {stats['clients']} · archivos: {stats['files']} ({stats['bytes'] / 1024:.0f} KiB)\n"
+        f"{stats['seconds']:.2f}s · {stats['rate']:.0f} archivos/s · {per_file:.2f} ms por archivo",
+        title=f"Exportado en {target}", border_style="green"))
+    return True
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python cli/export_clients.py",
+                                     description="Exporta el .conf (y el QR) de los clientes a un directorio o a un .zip.")
+    parser.add_argument("destino", help="directorio o archivo .zip de destino")
+    parser.add_argument("--server", metavar="ID", help="solo los clientes de este servidor (por defecto, todos)")
+    parser.add_argument("--qr", default="", metavar="png,svg", help="formatos de QR junto a cada .conf")
+    parser.add_argument("--workers", type=int, metavar="N", help="procesos para generar los archivos")
+    parser.add_argument("--file", default=store.DATA_FILE, metavar="archivo", help=f"datos (por defecto {store.DATA_FILE})")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    qr_formats = [fmt.strip().lower() for fmt in args.qr.split(",") if fmt.strip()]
+    if not os.path.exists(args.file):
+        console.print(f"[red]El archivo '{args.file}' no existe.[/red]")
+        sys.exit(2)
+    data = store.load(args.file)
+    servers = data.get("servers") or {}
+    if args.server is not None and args.server not in servers:
+        console.print(f"[red]El servidor '{args.server}' no existe.[/red]")
+        sys.exit(2)
+    server_ids = [args.server] if args.server is not None else list(servers)
+    ok = run_export(data, server_ids, args.destino, qr_formats, workers=args.workers)
+    sys.exit(0 if ok else 1)
@@ -1,21 +1,72 @@
 import uuid
 import json 
 import os
+import sys
+
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+import headers
+import jsonstream
+import models
+import store
+
 from rich.console import Console
 from rich.prompt import Prompt
 from rich.panel import Panel
 
-WG_CONFIG_FILE = "wg_data.json"
+WG_CONFIG_FILE = store.DATA_FILE
 console = Console()
 
-def load_data(server_id=None):
-    """Carga los datos de los clientes de un servidor específico desde wg_data.json."""
+def _client_record(client_uuid, client_info, headers_only):
+    """Registro de listado: el cliente con su 'uuid' (o solo las cabeceras)."""
+    current_client_data = {'uuid': client_uuid}
+    if headers_only and not headers.is_stub(client_info):
+        client_info = headers.ClientStub.from_client(client_uuid, client_info)
+    if headers.is_stub(client_info):
+        current_client_data.update((field, client_info.get(field)) for field in headers.HEADER_FIELDS)
+    else:
+        # Los registros leídos con jsonstream no pasan por store: normalizar aquí.
+        current_client_data.update(models.normalize_client(client_info))
+    return current_client_data
+
+def load_data_streaming(server_id=None, headers_only=False):
+    """Como load_data, pero leyendo el archivo de forma incremental con jsonstream.
+
+    Solo se construyen los clientes del servidor pedido, uno a uno; el resto de
+    servidores se salta sin materializarlos.
+    """
+    if server_id is None:
+        servers = {sid: {"name": name} for sid, name in jsonstream.iter_servers(WG_CONFIG_FILE)}
+        if not servers:
+            console.print(f"[yellow]No hay servidores definidos en '{WG_CONFIG_FILE}'.[/yellow]")
+            return []
+        server_id = select_server_interactive(servers)
+        if not server_id:
+            return []
+    processed_clients = []
+    try:
+        for client_uuid, client_info in jsonstream.iter_clients(WG_CONFIG_FILE, server_id):
+            if isinstance(client_info, dict):
+                processed_clients.append(_client_record(client_uuid, client_info, headers_only))
+    except KeyError:
+        console.print(f"[red]Servidor '{server_id}' no encontrado.[/red]")
+        return []
+    return processed_clients
+
+def load_data(server_id=None, headers_only=False):
+    """Carga los datos de los clientes de un servidor específico desde wg_data.json.
+
+    Con headers_only=True solo se devuelven los campos de cabecera (uuid, name,
+    address, enable, publicKey, dns); el registro completo se pide con store.load_client.
+    """
     if not os.path.exists(WG_CONFIG_FILE):
         console.print(f"[yellow]Advertencia: El archivo '{WG_CONFIG_FILE}' no existe. No se pueden cargar clientes.[/yellow]")
         return []
     try:
-        with open(WG_CONFIG_FILE, 'r', encoding='utf-8') as f:
-            data_from_file = json.load(f)
+        if store.streamable(WG_CONFIG_FILE):
+            return load_data_streaming(server_id, headers_only)
+        data_from_file = store.load_headers(WG_CONFIG_FILE) if headers_only else store.load(WG_CONFIG_FILE)
         servers = data_from_file.get("servers", {})
         if not servers:
             console.print(f"[yellow]No hay servidores definidos en '{WG_CONFIG_FILE}'.[/yellow]")
@@ -35,10 +86,8 @@ def load_data(server_id=None):
             return []
         processed_clients = []
         for client_uuid, client_info in clients_dict.items():
-            if isinstance(client_info, dict):
-                current_client_data = {'uuid': client_uuid}
-                current_client_data.update(client_info)
-                processed_clients.append(current_client_data)
+            if headers.is_stub(client_info) or isinstance(client_info, dict):
+                processed_clients.append(_client_record(client_uuid, client_info, headers_only))
         return processed_clients
     except json.JSONDecodeError:
         console.print(f"[red]El archivo '{WG_CONFIG_FILE}' no contiene un JSON válido o está vacío.[/red]")
@@ -52,12 +101,12 @@ def select_server_interactive(servers_dict):
     if not servers_dict:
         console.print("[yellow]No hay servidores disponibles.[/yellow]")
         return None
-    server_ids = list(servers_dict.keys())
+    names = store.server_names(servers_dict)
+    server_ids = [sid for _, sid in names]
     if len(server_ids) == 1:
         return server_ids[0]
     console.print(Panel("[bold cyan]Selecciona un servidor:[/bold cyan]", border_style="cyan"))
-    for idx, sid in enumerate(server_ids, 1):
-        name = servers_dict[sid].get("name", sid)
+    for idx, (name, sid) in enumerate(names, 1):
         console.print(f"{idx}. [green]{name}[/green] (ID: {sid})")
     while True:
         choice = Prompt.ask(f"Introduce el número del servidor (1-{len(server_ids)}) o Enter para cancelar")
@@ -77,8 +126,7 @@ if __name__ == "__main__":
     if not os.path.exists(WG_CONFIG_FILE):
         console.print(f"[red]El archivo '{WG_CONFIG_FILE}' no existe.[/red]")
         exit(1)
-    with open(WG_CONFIG_FILE, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    data = store.load(WG_CONFIG_FILE)
     servers = data.get("servers", {})
     server_id = select_server_interactive(servers)
     if not server_id:
@@ -10,6 +10,14 @@ import signal
 current_dir = os.path.dirname(os.path.abspath(__file__))
 if current_dir not in sys.path:
     sys.path.append(current_dir)
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+import allocator
+import models
+from export import client_config_text
+import netcheck
+import store
 
 try:
     from rich.console import Console
@@ -24,11 +32,14 @@ except ImportError:
 try:
     from list_clients import load_data as list_load_data # load_data de list_clients devuelve lista de clientes
     from add_client import add_new_client as add_client_add_new_client
+    from add_client import add_new_clients
     from add_client import generate_wg_keys
     from add_client import WG_CONFIG_FILE
     from add_client import load_data
+    from add_client import save_allocator_state
     from edit_clients import edit_client_interactive # Nueva importación
     from edit_server import view_server_config
+    from export_clients import run_export
 except ImportError as e:
     if 'Console' in globals():
         console = Console()
@@ -49,20 +60,10 @@ def handle_exit_signal(signum, frame):
 signal.signal(signal.SIGINT, handle_exit_signal)
 
 def get_display_ip(address_field):
-    if not address_field:
+    addresses = models.split_addresses(address_field)
+    if not addresses:
         return "[italic dim]N/A[/italic dim]"
-    ip_to_display = ""
-    if isinstance(address_field, list):
-        if address_field:
-            ip_to_display = address_field[0]
-        else:
-            return "[italic dim]N/A (lista vacía)[/italic dim]"
-    elif isinstance(address_field, str):
-        ip_to_display = address_field
-    else:
-        return "[italic dim]Formato desconocido[/italic dim]"
-    return ip_to_display.split('/')[0]
-
+    return addresses[0].split('/')[0]
 
 
 def display_clients(server_id):
@@ -71,7 +72,7 @@ def display_clients(server_id):
     while True:  # Bucle para permitir refrescar la lista después de editar
         console.clear()
         console.print(Panel("[bold cyan]Listado de Clientes (Resumen)[/bold cyan]", expand=False, border_style="cyan"))
-        clientes = list_load_data(server_id)  # Cargar/Recargar clientes
+        clientes = list_load_data(server_id, headers_only=True)  # Solo cabeceras; el detalle se lee al abrir un cliente
         if not clientes:
             console.clear()
             console.print("[yellow]No se encontraron datos de clientes para mostrar o se produjo un error durante la carga.[/yellow]")
@@ -115,6 +116,13 @@ def display_clients(server_id):
                     Prompt.ask("[dim]No es posible editar este cliente.[/dim]")
                     continue
                 
+                full_client_data = store.load_client(WG_CONFIG_FILE, server_id, client_uuid_for_edit)
+                if full_client_data is None:
+                    console.clear()
+                    Prompt.ask("[red]Error: El cliente ya no existe en el archivo de configuración.[/red]")
+                    continue
+                selected_client_data = {'uuid': client_uuid_for_edit}
+                selected_client_data.update(full_client_data)
                 edited = display_single_client_details_and_edit_option(selected_client_data, client_num, client_uuid_for_edit)
                 if edited:
                     needs_refresh = True # Marcar para recargar la lista de clientes
@@ -181,20 +189,7 @@ def display_single_client_details_and_edit_option(client_data, client_number, cl
             console.clear()
             # Generar configuración para QR
             server_config = load_data(WG_CONFIG_FILE).get("server", {})
-            qr_config = (
-                f"[Interface]\n"
-                f"PrivateKey = {client_data.get('privateKey')}\n"
-                f"Address = {client_data.get('address')}\n"
-                f"DNS = {server_config.get('dns')}\n\n"
-                f"[Peer]\n"
-                f"PublicKey = {server_config.get('publicKey')}\n"
-                f"Endpoint = {server_config.get('endpoint')}:{server_config.get('port')}\n"
-                f"AllowedIPs = 0.0.0.0/0, ::/0\n"
-            )
-
-            preshared_key = client_data.get('PresharedKey')
-            if preshared_key:
-                qr_config += f"PresharedKey = {preshared_key}\n"
+            qr_config = client_config_text(client_data, server_config)
 
             # Mostrar QR en consola con un marco blanco
             qr = qrcode.QRCode(border=4)  # Ajustar el tamaño del borde
@@ -207,20 +202,7 @@ def display_single_client_details_and_edit_option(client_data, client_number, cl
             console.clear()
             # Generar archivo de configuración
             server_config = load_data(WG_CONFIG_FILE).get("server", {})
-            qr_config = (
-                f"[Interface]\n"
-                f"PrivateKey = {client_data.get('PrivateKey')}\n"
-                f"Address = {client_data.get('address')}\n"
-                f"DNS = {server_config.get('dns')}\n\n"
-                f"[Peer]\n"
-                f"PublicKey = {server_config.get('publicKey')}\n"
-                f"Endpoint = {server_config.get('endpoint')}:{server_config.get('port')}\n"
-                f"AllowedIPs = 0.0.0.0/0, ::/0\n"
-            )
-
-            preshared_key = client_data.get('PresharedKey')
-            if preshared_key:
-                qr_config += f"PresharedKey = {preshared_key}\n"
+            qr_config = client_config_text(client_data, server_config)
 
             config_file_path = f"{client_name}.conf"
             with open(config_file_path, "w") as config_file:
@@ -252,18 +234,20 @@ def prompt_add_new_client():
 
 def generate_keys():
     """Genera una clave privada y su correspondiente clave pública."""
-    try:
-        private_key = subprocess.check_output(['wg', 'genkey']).decode('utf-8').strip()
-        public_key = subprocess.check_output(['wg', 'pubkey'], input=private_key.encode('utf-8')).decode('utf-8').strip()
-        return private_key, public_key
-    except FileNotFoundError:
-        console.print("[bold yellow]Advertencia:[/bold yellow] Comando 'wg' no encontrado. Usando placeholders para las claves.")
-        console.print("Por favor, asegúrate de que las herramientas de WireGuard estén instaladas y en el PATH para generar claves reales.")
-        return "PLACEHOLDER_PRIVATE_KEY_wg_not_found", "PLACEHOLDER_PUBLIC_KEY_wg_not_found"
-    except subprocess.CalledProcessError as e:
-        console.print(f"[bold red]Error ejecutando el comando 'wg':[/bold red] {e}")
-        console.print("[yellow]Usando placeholders para las claves.[/yellow]")
-        return "PLACEHOLDER_PRIVATE_KEY_wg_error", "PLACEHOLDER_PUBLIC_KEY_wg_error"
+    return generate_wg_keys()
+
+def prompt_ipv6_prefix():
+    """Pide un prefijo IPv6 opcional para doble pila (p. ej. fd00:10::1/64). Devuelve "" si se omite."""
+    while True:
+        prefix = Prompt.ask("Prefijo IPv6 del servidor para doble pila (vacío para solo IPv4)", default="")
+        if not prefix.strip():
+            return ""
+        try:
+            if ipaddress.ip_interface(prefix.strip()).version == 6:
+                return prefix.strip()
+        except ValueError:
+            pass
+        console.print("[bold red]Error:[/bold red] Prefijo IPv6 inválido. Intenta de nuevo.")
 
 def list_network_interfaces():
     """Lista las interfaces de red disponibles en el sistema."""
@@ -282,6 +266,7 @@ def create_wg0_json():
             break
         except ValueError:
             console.print("[bold red]Error:[/bold red] Dirección IP inválida. Intenta de nuevo.")
+    address = models.join_addresses([address] + models.split_addresses(prompt_ipv6_prefix()))
 
     dns = Prompt.ask("Introduce el servidor DNS", default="1.1.1.1")
     port = Prompt.ask("Introduce el puerto", default="51820")
@@ -310,17 +295,18 @@ def create_wg0_json():
 
     # Crear el contenido del archivo wg0.json
     wg0_data = {
-        "server": {
-            "privateKey": private_key,
-            "publicKey": public_key,
-            "address": address,
-            "dns": dns,
-            "port": int(port),
-            "PresharedKey": str(pre_shared_key),
-            "endpoint": endpoint,
-            "persistentKeepalive": int(persistent_keepalive),
-            "interface": selected_interface
-        },
+        "server": models.Server(
+            private_key=private_key,
+            public_key=public_key,
+            address=address,
+            dns=dns,
+            port=models.to_int(port, 51820),
+            generate_psk=pre_shared_key,
+            endpoint=endpoint,
+            persistent_keepalive=models.to_int(persistent_keepalive),
+            interface=selected_interface,
+            enable=True,
+        ).to_dict(with_clients=False),
         "clients": {}
     }
 
@@ -337,8 +323,9 @@ if not os.path.exists("wg0.json"):
 def cargar_configuracion():
     if not os.path.exists(WG_CONFIG_FILE):
         return {"servers": {}}
-    with open(WG_CONFIG_FILE, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    config = store.load(WG_CONFIG_FILE)
+    allocator.load_state(WG_CONFIG_FILE, store.version(config))
+    return config
 
 def seleccionar_servidor():
     config = cargar_configuracion()
@@ -346,10 +333,10 @@ def seleccionar_servidor():
     if not servers:
         console.print("[yellow]No hay servidores configurados. Debes agregar uno primero.[/yellow]")
         return None, config
-    server_ids = list(servers.keys())
+    nombres = store.server_names(servers) # Solo el manifiesto si los datos están fragmentados
+    server_ids = [sid for _, sid in nombres]
     console.print("[bold cyan]Servidores disponibles:[/bold cyan]")
-    for idx, sid in enumerate(server_ids, 1):
-        nombre = servers[sid].get('name', sid)
+    for idx, (nombre, sid) in enumerate(nombres, 1):
         console.print(f"{idx}. [green]{nombre}[/green] (ID: {sid})")
     idx_str = Prompt.ask(f"Selecciona el número del servidor (1-{len(server_ids)})", default="1")
     try:
@@ -370,26 +357,87 @@ def agregar_servidor():
         return
     private_key, public_key = generate_keys()
     address = Prompt.ask("Dirección IP/máscara del servidor", default="10.10.10.1/24")
+    address = models.join_addresses([address] + models.split_addresses(prompt_ipv6_prefix()))
     dns = Prompt.ask("DNS del servidor", default="1.1.1.1")
     port = Prompt.ask("Puerto", default="51820")
     endpoint = Prompt.ask("Endpoint", default="0.0.0.0")
     persistent_keepalive = Prompt.ask("PersistentKeepalive", default="0")
-    servers[server_id_name] = {
-        "publicKey": public_key,
-        "privateKey": private_key,
-        "name": server_id_name,
-        "address": address,
-        "dns": dns,
-        "port": int(port),
-        "endpoint": endpoint,
-        "persistentKeepalive": int(persistent_keepalive),
-        "clients": {}
-    }
-    with open(WG_CONFIG_FILE, 'w', encoding='utf-8') as f:
-        json.dump(config, f, indent=2, ensure_ascii=False)
+    conflicts = netcheck.index_for(config, all_servers=True).check_server(server_id_name, address)
+    if conflicts:
+        for conflict in conflicts:
+            console.print(f"[bold red]Conflicto:[/bold red] {conflict.address}: {conflict.detail}")
+        Prompt.ask("Presiona Enter para continuar...")
+        return
+    new_server = models.Server(
+        public_key=public_key,
+        private_key=private_key,
+        name=server_id_name,
+        address=address,
+        dns=dns,
+        port=models.to_int(port, 51820),
+        endpoint=endpoint,
+        persistent_keepalive=models.to_int(persistent_keepalive),
+        enable=True,
+    ).to_dict()
+    ops = [("set", ["servers", server_id_name], new_server)]
+    store.apply_ops(config, ops)
+    save_allocator_state(WG_CONFIG_FILE, ops, config, store.apply(WG_CONFIG_FILE, ops, config))
     console.print(f"[green]Servidor '{server_id_name}' añadido correctamente.[/green]")
     Prompt.ask("Presiona Enter para continuar...")
 
+def editar_pools(server_id, config):
+    """Añade o quita pools de direcciones del servidor (se usan, en orden, al llenarse 'address')."""
+    server = models.Server.from_dict(server_id, config["servers"][server_id], with_clients=False)
+    console.print(f"Dirección: [green]{server.address}[/green]")
+    console.print(f"Pools: [green]{server.pools or '(ninguno)'}[/green]")
+    try:
+        for usage in allocator.utilization(config, server_id):
+            console.print(f"  {allocator.format_usage(usage)}")
+    except ValueError as e:
+        console.print(f"[yellow]{e}[/yellow]")
+    pools = Prompt.ask("Pools (dirección del servidor en cada subred, separados por comas)", default=server.pools)
+    pools = models.join_addresses(models.split_addresses(pools))
+    try:
+        for item in models.split_addresses(pools):
+            ipaddress.ip_interface(item)
+    except ValueError as e:
+        console.print(f"[bold red]Error:[/bold red] {e}")
+        Prompt.ask("Presiona Enter para continuar...")
+        return
+    conflicts = netcheck.index_for(config, all_servers=True).check_server(server_id, server.address, pools)
+    if conflicts:
+        for conflict in conflicts:
+            console.print(f"[bold red]Conflicto:[/bold red] {conflict.address}: {conflict.detail}")
+        Prompt.ask("Presiona Enter para continuar...")
+        return
+    path = ["servers", server_id, "pools"]
+    ops = [("set", path, pools)] if pools else [("del", path)]
+    store.apply_ops(config, ops)
+    save_allocator_state(WG_CONFIG_FILE, ops, config, store.apply(WG_CONFIG_FILE, ops, config))
+    console.print("[green]Pools actualizados. Regenera la configuración del servidor para enrutarlos.[/green]")
+    Prompt.ask("Presiona Enter para continuar...")
+
+def exportar_clientes():
+    """Exporta los clientes de un servidor (o de todos) a un directorio o a un .zip."""
+    config = cargar_configuracion()
+    servers = config.get("servers", {})
+    if not servers:
+        console.print("[yellow]No hay servidores configurados.[/yellow]")
+        Prompt.ask("Presiona Enter para continuar...")
+        return
+    if Confirm.ask("¿Exportar los clientes de todos los servidores?", default=False):
+        server_ids = list(servers)
+    else:
+        server_id, _ = seleccionar_servidor()
+        if not server_id:
+            return
+        server_ids = [server_id]
+    target = Prompt.ask("Directorio o archivo .zip de destino", default="clientes_export")
+    qr = Prompt.ask("QR junto a cada .conf", choices=["ninguno", "png", "svg", "ambos"], default="ninguno")
+    qr_formats = {"ninguno": (), "png": ("png",), "svg": ("svg",), "ambos": ("png", "svg")}[qr]
+    run_export(config, server_ids, target, qr_formats)
+    Prompt.ask("Presiona Enter para continuar...")
+
 def eliminar_servidor():
     server_id, config = seleccionar_servidor()
     if not server_id:
@@ -397,8 +445,8 @@ def eliminar_servidor():
     nombre = config['servers'][server_id].get('name', server_id)
     if Confirm.ask(f"¿Seguro que deseas eliminar el servidor '{nombre}' (ID: {server_id})? Esta acción es irreversible.", default=False):
         del config['servers'][server_id]
-        with open(WG_CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=2, ensure_ascii=False)
+        ops = [("del", ["servers", server_id])]
+        save_allocator_state(WG_CONFIG_FILE, ops, config, store.apply(WG_CONFIG_FILE, ops, config))
         console.print(f"[red]Servidor '{nombre}' eliminado.[/red]")
         Prompt.ask("Presiona Enter para continuar...")
 
@@ -414,11 +462,12 @@ def main_menu():
         console.print("1. [bold cyan]Listar/Editar clientes de un servidor[/bold cyan]")
         console.print("2. [bold cyan]Añadir un nuevo cliente a un servidor[/bold cyan]")
         console.print("3. [bold cyan]Agregar un nuevo servidor[/bold cyan]")
-        console.print("4. [bold cyan]Editar configuración de un servidor[/bold cyan]")
+        console.print("4. [bold cyan]Editar pools de direcciones de un servidor[/bold cyan]")
         console.print("5. [bold cyan]Eliminar un servidor[/bold cyan]")
-        console.print("6. [bold red]Salir[/bold red]")
+        console.print("6. [bold cyan]Exportar clientes (.conf y QR)[/bold cyan]")
+        console.print("7. [bold red]Salir[/bold red]")
         console.rule(style="dim blue")
-        opcion = Prompt.ask("Selecciona una opción", choices=["1","2","3","4","5","6"], default="6")
+        opcion = Prompt.ask("Selecciona una opción", choices=["1","2","3","4","5","6","7"], default="7")
         if opcion == "1":
             server_id, _ = seleccionar_servidor()
             if server_id:
@@ -426,19 +475,22 @@ def main_menu():
         elif opcion == "2":
             server_id, _ = seleccionar_servidor()
             if server_id:
-                nombre_cliente = Prompt.ask("Nombre del nuevo cliente")
-                if nombre_cliente:
+                nombre_cliente = Prompt.ask("Nombre del nuevo cliente (varios separados por comas)")
+                if nombre_cliente and "," in nombre_cliente:
+                    add_new_clients(nombre_cliente.split(","), server_id)
+                elif nombre_cliente:
                     add_client_add_new_client(nombre_cliente, server_id)
         elif opcion == "3":
             agregar_servidor()
         elif opcion == "4":
-            server_id, _ = seleccionar_servidor()
+            server_id, config = seleccionar_servidor()
             if server_id:
-                # Llama a la función de edición de servidor
-                pass
+                editar_pools(server_id, config)
         elif opcion == "5":
             eliminar_servidor()
         elif opcion == "6":
+            exportar_clientes()
+        elif opcion == "7":
             console.print("[yellow]Saliendo...[/yellow]")
             break
 
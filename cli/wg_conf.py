@@ -1,6 +1,14 @@
 import os
 import sys
 import json
+import tempfile
+
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+import models
+import peerconf
+import store
 
 try:
     from rich.console import Console
@@ -16,6 +24,7 @@ console = Console()
 # Definición de WG_CONFIG_FILE (debe ser consistente con tus otros scripts)
 WG_CONFIG_FILE = "wg0.json"
 DEFAULT_SERVER_CONFIG_FILENAME = "wg_server.conf"
+STREAM_BUFFER_BYTES = 1024 * 1024 # Búfer de escritura del .conf en streaming
 
 def load_config_data():
     """Carga los datos completos desde el archivo JSON de configuración."""
@@ -23,8 +32,7 @@ def load_config_data():
         console.print(f"[bold red]Error:[/bold red] El archivo de configuración '{WG_CONFIG_FILE}' no existe.")
         return None
     try:
-        with open(WG_CONFIG_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return store.load(WG_CONFIG_FILE)
     except json.JSONDecodeError:
         console.print(f"[bold red]Error:[/bold red] El archivo '{WG_CONFIG_FILE}' no contiene un JSON válido.")
         return None
@@ -43,113 +51,131 @@ def save_text_to_file(filepath, content):
         console.print(f"[bold red]Error al guardar el archivo '{filepath}':[/bold red] {e}")
         return False
 
-def generate_wg_config_string(server_config, clients_data, server_interface_name="wg0"):
-    """Genera la cadena de configuración de WireGuard para el servidor."""
+def interface_lines(server_config, server_interface_name="wg0"):
+    """Líneas de la sección [Interface] del servidor (con la línea en blanco final), o None si falta la privateKey."""
     config_lines = []
+    server = models.Server.from_dict(server_interface_name, server_config, with_clients=False)
 
     # --- [Interface] section for the server ---
     config_lines.append("[Interface]")
     
-    server_private_key = server_config.get("privateKey")
-    if not server_private_key:
+    if not server.private_key:
         console.print(f"[bold red]Error Crítico:[/bold red] 'privateKey' del servidor no encontrado en '{WG_CONFIG_FILE}' bajo la sección 'server'.")
         console.print("Este campo es esencial para la sección [Interface] del servidor.")
         console.print(f"Por favor, añade 'privateKey': 'SU_CLAVE_PRIVADA_DE_SERVIDOR' a la sección 'server' en '{WG_CONFIG_FILE}'.")
         return None
-    config_lines.append(f"PrivateKey = {server_private_key}")
+    config_lines.append(f"PrivateKey = {server.private_key}")
 
-    # Determinar la IP y subred de la interfaz del servidor
-    server_address_config = server_config.get("address")
-    if server_address_config:
-        config_lines.append(f"Address = {server_address_config}")
+    # Determinar la IP y subred de la interfaz del servidor. Cada pool adicional
+    # va también en Address: wg-quick añade la ruta de cada subred a la interfaz.
+    if server.address:
+        config_lines.append(f"Address = {models.join_addresses(server.interface_addresses)}")
     else:
         console.print(f"[bold red]Error Crítico:[/bold red] No se encontró 'address' en la configuración del servidor en '{WG_CONFIG_FILE}'.")
         config_lines.append("# Address = <SERVER_WG_IP/SUBNET_EJ_10.10.10.1/24>  <-- ¡¡CRÍTICO!! Por favor, establece esto manualmente.")
 
-    listen_port = server_config.get("port", 51820)
+    listen_port = server.port
     config_lines.append(f"ListenPort = {listen_port}")
 
     # Obtener la interfaz dye red desde la configuración
-    network_interface = server_config.get("interface", "<YOUR_PUBLIC_INTERFACE_eg_eth0>")
+    network_interface = server.interface or "<YOUR_PUBLIC_INTERFACE_eg_eth0>"
 
-    # Determinar la subred completa para las reglas PostUp/PostDown
-    server_subnet = server_address_config.split('/')[0] + '/' + server_address_config.split('/')[1]
+    # Subredes para las reglas PostUp/PostDown: la de 'address' y la de cada pool.
+    # En doble pila, las subredes IPv6 se enmascaran igual con ip6tables.
+    interface_addresses = server.interface_addresses
+    server_subnets = [item for item in interface_addresses if ":" not in item] or ["<SERVER_WG_SUBNET>"]
+    server_subnets6 = [item for item in interface_addresses if ":" in item]
 
     # Reglas PostUp/PostDown (ejemplos, el usuario debe adaptarlas)
-    config_lines.append(f"PostUp =  iptables -t nat -A POSTROUTING -s {server_subnet} -o {network_interface} -j MASQUERADE; iptables -A INPUT -p udp -m udp --dport {listen_port} -j ACCEPT; iptables -A FORWARD -i %i -j ACCEPT; iptables -A FORWARD -o %i -j ACCEPT;")
-    config_lines.append(f"PostDown =  iptables -t nat -D POSTROUTING -s {server_subnet} -o {network_interface} -j MASQUERADE; iptables -D INPUT -p udp -m udp --dport {listen_port} -j ACCEPT; iptables -D FORWARD -i %i -j ACCEPT; iptables -D FORWARD -o %i -j ACCEPT;")
-    """
-    config_lines.append(f"# PostUp = iptables -A FORWARD -i %i -j ACCEPT; iptables -t nat -A POSTROUTING -o {public_interface_placeholder} -j MASQUERADE")
-    config_lines.append(f"# PostUp = ip6tables -A FORWARD -i %i -j ACCEPT; ip6tables -t nat -A POSTROUTING -o {public_interface_placeholder} -j MASQUERADE")
-    config_lines.append(f"# PostDown = iptables -D FORWARD -i %i -j ACCEPT; iptables -t nat -D POSTROUTING -o {public_interface_placeholder} -j MASQUERADE")
-    config_lines.append(f"# PostDown = ip6tables -D FORWARD -i %i -j ACCEPT; ip6tables -t nat -D POSTROUTING -o {public_interface_placeholder} -j MASQUERADE")
-    config_lines.append("SaveConfig = false # O true si deseas que wg-quick guarde cambios en este archivo")
-    """
+    post_up = "".join(f"iptables -t nat -A POSTROUTING -s {subnet} -o {network_interface} -j MASQUERADE; " for subnet in server_subnets)
+    post_up += f"iptables -A INPUT -p udp -m udp --dport {listen_port} -j ACCEPT; iptables -A FORWARD -i %i -j ACCEPT; iptables -A FORWARD -o %i -j ACCEPT;"
+    post_down = "".join(f"iptables -t nat -D POSTROUTING -s {subnet} -o {network_interface} -j MASQUERADE; " for subnet in server_subnets)
+    post_down += f"iptables -D INPUT -p udp -m udp --dport {listen_port} -j ACCEPT; iptables -D FORWARD -i %i -j ACCEPT; iptables -D FORWARD -o %i -j ACCEPT;"
+    if server_subnets6:
+        post_up += "".join(f" ip6tables -t nat -A POSTROUTING -s {subnet} -o {network_interface} -j MASQUERADE;" for subnet in server_subnets6)
+        post_up += " ip6tables -A FORWARD -i %i -j ACCEPT; ip6tables -A FORWARD -o %i -j ACCEPT;"
+        post_down += "".join(f" ip6tables -t nat -D POSTROUTING -s {subnet} -o {network_interface} -j MASQUERADE;" for subnet in server_subnets6)
+        post_down += " ip6tables -D FORWARD -i %i -j ACCEPT; ip6tables -D FORWARD -o %i -j ACCEPT;"
+    config_lines.append(f"PostUp =  {post_up}")
+    config_lines.append(f"PostDown =  {post_down}")
     config_lines.append("")
-    # --- [Peer] sections for enabled clients ---
+    return config_lines
+
+def peer_lines(clients_data, cache=None, report=None):
+    """Líneas de las secciones [Peer] de los clientes habilitados, generadas de una en una.
+
+    `cache` (peerconf.PeerCache) reutiliza los bloques que no cambiaron. Al
+    terminar se muestran los avisos agrupados y, si se pasa, `report` recibe
+    {"peers": número de bloques, "warnings": {aviso: [clientes]}}.
+    """
     if not clients_data:
         console.print("[yellow]Advertencia: No hay datos de clientes en el archivo de configuración.[/yellow]")
-    
-    enabled_clients_count = 0
-    for client_uuid, client_details in clients_data.items():
-        if client_details.get("enabled", False): # Solo añadir clientes habilitados
-            # Esta condición asegura que solo los clientes con "enabled": true en wg0.json sean procesados.
-            # Si "enabled" es false, o si la clave "enabled" falta para un cliente
-            # (.get() devolverá False como valor por defecto), la sección [Peer] de ese cliente se omitirá.
-            # Esto asume que "enabled" se almacena como un valor booleano en wg0.json,
-            # lo cual es consistente con cómo add_client.py y edit_clients.py lo manejan.
-            enabled_clients_count += 1
-            config_lines.append("[Peer]")
-            config_lines.append(f"# Client Name: {client_details.get('name', 'N/A')}")
-            config_lines.append(f"# Client UUID: {client_uuid}")
-            
-            public_key = client_details.get("publicKey")
-            if public_key:
-                config_lines.append(f"PublicKey = {public_key}")
-            else:
-                config_lines.append("# PublicKey = <CLAVE_PUBLICA_DEL_CLIENTE_FALTA>")
-                console.print(f"[yellow]Advertencia:[/yellow] Cliente '{client_details.get('name', client_uuid)}' no tiene 'publicKey'.")
-
-            preshared_key = client_details.get("PresharedKey")
-            if preshared_key: # Se añade la PresharedKey solo si existe y tiene un valor.
-                              # Si client_details.get("PresharedKey") devuelve None (ej. null en JSON) o una cadena vacía,
-                              # la línea PresharedKey no se incluirá para este peer.
-                config_lines.append(f"PresharedKey = {preshared_key}")
-
-            # AllowedIPs para la configuración del servidor es la IP WireGuard del cliente
-            client_wg_address = client_details.get("address") # Debería ser como "10.10.10.2/32"
-            
-            # El campo 'address' puede ser una cadena o una lista (aunque add_client.py lo guarda como cadena)
-            allowed_ip_to_use = None
-            if isinstance(client_wg_address, str):
-                allowed_ip_to_use = client_wg_address
-            elif isinstance(client_wg_address, list):
-                if client_wg_address: # Tomar el primero si es una lista
-                    allowed_ip_to_use = client_wg_address[0] 
-                else:
-                    console.print(f"[yellow]Advertencia:[/yellow] Cliente '{client_details.get('name', client_uuid)}' tiene una lista de 'address' vacía.")
-            
-            if allowed_ip_to_use:
-                config_lines.append(f"AllowedIPs = {allowed_ip_to_use}")
-            else:
-                config_lines.append("# AllowedIPs = <IP_WIREGUARD_DEL_CLIENTE_FALTA>")
-                console.print(f"[yellow]Advertencia:[/yellow] Cliente '{client_details.get('name', client_uuid)}' no tiene 'address' para AllowedIPs.")
-
-            # PersistentKeepalive (opcional en la sección Peer del servidor, más común en el cliente)
-            # client_persistent_keepalive = client_details.get("persistentKeepalive")
-            # if isinstance(client_persistent_keepalive, int) and client_persistent_keepalive > 0:
-            #     config_lines.append(f"PersistentKeepalive = {client_persistent_keepalive}")
-            config_lines.append("") # Nueva línea después de cada [Peer]
-    
-    if enabled_clients_count == 0:
-        console.print("[yellow]Advertencia: No se encontraron clientes habilitados ('enabled: true') para añadir a la configuración.[/yellow]")
-        if not clients_data: # Si no había clientes en absoluto
-             pass # Ya se advirtió antes
-        else: # Si había clientes pero ninguno habilitado
-             console.print("[info]Asegúrate de que los clientes que deseas incluir tengan 'enabled: true' en el archivo JSON.[/info]")
+    warnings = {}
+    peers = 0
+    for block in peerconf.iter_blocks(clients_data, warnings, cache):
+        peers += 1
+        yield block
+        yield "" # Nueva línea después de cada [Peer]
+    for kind, names in warnings.items():
+        shown = ", ".join(str(name) for name in names[:5]) + (", …" if len(names) > 5 else "")
+        console.print(f"[yellow]Advertencia:[/yellow] {len(names)} cliente(s) {peerconf.WARNINGS[kind]}: {shown}")
+    if not peers:
+        console.print("[yellow]Advertencia: No se encontraron clientes habilitados ('enable: true') para añadir a la configuración.[/yellow]")
+        if clients_data: # Si había clientes pero ninguno habilitado
+             console.print("[info]Asegúrate de que los clientes que deseas incluir tengan 'enable: true' en el archivo JSON.[/info]")
+    if report is not None:
+        report.update(peers=peers, warnings=warnings)
+
+def iter_wg_config(header, clients_data, cache=None, report=None):
+    """Trozos de texto del .conf del servidor, equivalentes a "\n".join(líneas).
+
+    `header` son las líneas de interface_lines(); los peers se generan al
+    consumir el iterador.
+    """
+    first = True
+    for lines in (header, peer_lines(clients_data, cache, report)):
+        for line in lines:
+            yield line if first else "\n" + line
+            first = False
 
+def generate_wg_config_string(server_config, clients_data, server_interface_name="wg0", cache=None):
+    """Genera la cadena de configuración de WireGuard para el servidor.
 
-    return "\n".join(config_lines)
+    `cache` (peerconf.PeerCache) copia del .conf anterior (`cache.source`) los
+    bloques [Peer] que no cambiaron.
+    """
+    header = interface_lines(server_config, server_interface_name)
+    if header is None:
+        return None
+    return "".join(iter_wg_config(header, clients_data, cache))
+
+def write_wg_config(filepath, header, clients_data, cache=None, report=None):
+    """Escribe el .conf del servidor en streaming: temporal en el mismo directorio y renombrado atómico.
+
+    `header` son las líneas de interface_lines(). La configuración no se
+    construye nunca completa en memoria (la memoria no depende del número de
+    peers). Devuelve False si no se pudo escribir; el archivo
+    anterior queda intacto.
+    """
+    chunks = iter_wg_config(header, clients_data, cache, report)
+    directory = os.path.dirname(os.path.abspath(filepath))
+    fd, tmp_path = tempfile.mkstemp(prefix=".wg_server.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", buffering=STREAM_BUFFER_BYTES) as f:
+            for chunk in chunks:
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, filepath)
+        console.print(f"[green]Configuración guardada exitosamente en '{filepath}'.[/green]")
+        return True
+    except Exception as e:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        console.print(f"[bold red]Error al guardar el archivo '{filepath}':[/bold red] {e}")
+        return False
 
 def main_generate_config():
     """Función principal para generar el archivo de configuración del servidor WireGuard."""
@@ -192,10 +218,17 @@ def main_generate_config():
         clients_conf = {} # Tratar como vacío si no existe para evitar errores
 
     console.print("\n[cyan]Generando configuración del servidor WireGuard...[/cyan]")
-    wg_config_content = generate_wg_config_string(server_conf, clients_conf)
-
-    if wg_config_content:
-        if save_text_to_file(final_output_filename, wg_config_content):
+    cache = peerconf.load_cache(final_output_filename)
+    header = interface_lines(server_conf)
+    if header is not None:
+        # Se escribe en streaming directamente al archivo (temporal + renombrado atómico).
+        if write_wg_config(final_output_filename, header, clients_conf, cache=cache):
+            stats = cache.stats()
+            console.print(f"[dim]Bloques [Peer]: {stats['reused']} reutilizados, {stats['rebuilt']} regenerados.[/dim]")
+            try:
+                peerconf.save_cache(final_output_filename, cache)
+            except OSError as e:
+                console.print(f"[yellow]No se pudo guardar la caché de bloques: {e}[/yellow]")
             console.print(f"\n[info]Recuerda revisar y personalizar las reglas 'PostUp' y 'PostDown' en '{final_output_filename}' según la interfaz de red pública de tu servidor.[/info]")
             if "privateKey" not in server_conf or not server_conf["privateKey"]:
                  console.print(f"[bold yellow]¡IMPORTANTE![/bold yellow] La 'privateKey' del servidor no estaba definida en '{WG_CONFIG_FILE}'. La configuración generada es incompleta y no funcionará sin ella.")
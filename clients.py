@@ -9,9 +9,12 @@ from textual.containers import Vertical, Horizontal
 from textual.widgets import Button, Label, Input, Select, Switch
 
 import json
-import ipaddress
 
-import works
+import allocator
+import headers
+import models
+import netcheck
+import store
 
 class Add_edit_client(ModalScreen):
     """A widget to edit a client."""
@@ -75,41 +78,46 @@ class Add_edit_client(ModalScreen):
         if self.verify == True:
             """Carga los datos del cliente."""
             valor = self.app_ref.wg_data.get("servers", {}).get(self.id_server, {}).get("clients", {}).get(self.id_client, {})
-            self.query_one("#name", Input).value = valor.get("name", "") or ""
-            self.query_one("#input_address", Input).value = valor.get("address", "") or ""
-            self.query_one("#input_private_key", Input).value = valor.get("privateKey", "") or ""
-            self.query_one("#input_public_key", Input).value = valor.get("publicKey", "") or ""
-            if valor.get("presharedKey",False):
-                self.query_one("#input_preshared_key", Input).value = valor.get("presharedKey")
+            if headers.is_stub(valor):
+                # Solo tenemos la cabecera: escribir lo pendiente y leer el registro completo.
+                self.app_ref.writer.flush()
+                valor = store.load_client(store.DATA_FILE, self.id_server, self.id_client) or {}
+            client = models.Client.from_dict(self.id_client, valor)
+            self.query_one("#name", Input).value = client.name or ""
+            self.query_one("#input_address", Input).value = client.address
+            self.query_one("#input_private_key", Input).value = client.private_key or ""
+            self.query_one("#input_public_key", Input).value = client.public_key or ""
+            if client.preshared_key:
+                self.query_one("#input_preshared_key", Input).value = client.preshared_key
                 self.query_one("#input_preshared_key", Input).disabled = False
                 self.query_one("#pshk_switch",Switch).value = True
             else:
                 self.query_one("#input_preshared_key", Input).value = ""
                 self.query_one("#input_preshared_key", Input).disabled = True
                 self.query_one("#pshk_switch",Switch).value = False
-            self.query_one("#input_dns", Input).value = valor.get("dns", "") or ""
-            self.query_one("#input_persistent_keepalive", Input).value = str(valor.get("persistentKeepalive", "")) or ""
-            self.query_one("#input_allowed_ips", Input).value = valor.get("allowedIPs", "") or ""
-            self.query_one("#select_enabled", Select).value = valor.get("enable", False)
+            self.query_one("#input_dns", Input).value = client.dns or ""
+            self.query_one("#input_persistent_keepalive", Input).value = str(client.persistent_keepalive)
+            self.query_one("#input_allowed_ips", Input).value = client.allowed_ips or ""
+            self.query_one("#select_enabled", Select).value = client.enable
         else:
             # Si es un nuevo cliente, se generan claves y se obtiene una dirección IP disponible.
             server_data = self.app_ref.wg_data.get("servers").get(self.id_server)
             cliens_data = self.app_ref.wg_data.get("servers").get(self.id_server).get("clients",{})
             #clients = server_data.get("clients",{})
-            new_address_client = self.get_next_available_ip(cliens_data,server_data.get("address",{}))
+            new_address_client = self.get_next_available_ip(cliens_data, server_data.get("address") or "", server_data.get("pools"))
             #Genera una clave precompartida y la muestra en el campo correspondiente.
-            psk = works.generate_preshared_key()
-            priv_key, pub_key = works.generate_keys()
+            psk = self.app.key_pool.take_psk()
+            priv_key, pub_key = self.app.key_pool.take_keypair()
             self.query_one("#input_private_key", Input).value = priv_key
             self.query_one("#input_public_key", Input).value = pub_key
             self.query_one("#input_preshared_key", Input).value = psk
-            self.query_one("#input_address", Input).value = new_address_client
+            self.query_one("#input_address", Input).value = new_address_client or "" # Sin dirección: se indica a mano
             self.query_one("#input_dns", Input).value = server_data.get("dns", "") or ""
     @on(Switch.Changed, "#pshk_switch")
     def pshk_switch(self, event:Switch.Changed) -> None:
         if self.query_one("#pshk_switch",Switch).value:
             self.query_one("#input_preshared_key", Input).disabled = False
-            psk = works.generate_preshared_key()
+            psk = self.app.key_pool.take_psk()
             self.query_one("#input_preshared_key", Input).value = psk
         else:
             self.query_one("#input_preshared_key", Input).value = ""
@@ -120,14 +128,14 @@ class Add_edit_client(ModalScreen):
     @on(Button.Pressed, "#btn_gen_key")
     def btn_gen_key(self, event: Button.Pressed) -> None:
         """Generar claves y mostrarlas en los campos correspondientes."""
-        priv_key, pub_key = works.generate_keys()
+        priv_key, pub_key = self.app.key_pool.take_keypair()
         self.query_one("#input_private_key", Input).value = priv_key
         self.query_one("#input_public_key", Input).value = pub_key
         
     @on(Button.Pressed, "#btn_show_preshared_key")
     def btn_show_preshared_key(self, event: Button.Pressed) -> None:
         """Generar una clave precompartida y mostrarla en el campo correspondiente."""
-        psk = works.generate_preshared_key()
+        psk = self.app.key_pool.take_psk()
         self.query_one("#input_preshared_key", Input).value = psk
         
     @on(Button.Pressed, "#btn_cancel")
@@ -155,6 +163,16 @@ class Add_edit_client(ModalScreen):
         #if self.query_one("#input_address", Input).value == "" or self.query_one("#port",Input).value == "" or self.query_one("#endpoint", Input).value == "" or self.query_one("#input_private_key", Input).value == "" or self.query_one("#input_public_key", Input).value == "":
         #    self.notify("Los siguientes camposs no pueden quedar vacios: \n - privateKey\n - publicKey\n - address\n - port\n - dns\n - endpoint",severity="warning")
         #    return
+        # Validación rápida: dirección repetida o fuera de la red del servidor.
+        address = models.join_addresses(models.split_addresses(self.query_one("#input_address", Input).value))
+        if not address:
+            self.notify("Debe proporcionar una dirección para el cliente.", severity="warning")
+            return
+        conflicts = netcheck.index_for(self.app_ref.wg_data, self.id_server).check_client(self.id_server, self.id_client, address)
+        if conflicts:
+            self.notify("\n".join(f"{c.address}: {c.detail}" for c in conflicts),
+                        title="Conflicto de direcciones", severity="error")
+            return
         if self.save_data():
             await self.app_ref.refresh_server_select()
             self.notify(f"Se guardo correctamente la configutacion de {self.query_one("#name", Input).value}",severity="information",title="Guardado")
@@ -165,59 +183,42 @@ class Add_edit_client(ModalScreen):
         
     def save_data(self):
         try:
-            client_new={
-                "name":self.query_one("#name", Input).value,
-                "privateKey":self.query_one("#input_private_key", Input).value,
-                "publicKey":self.query_one("#input_public_key", Input).value,
-                "presharedKey":self.query_one("#input_preshared_key", Input).value,
-                "persistentKeepalive":self.query_one("#input_persistent_keepalive", Input).value or 0,
-                "address":self.query_one("#input_address", Input).value,
-                "dns":self.query_one("#input_dns", Input).value,
-                "allowedIPs":self.query_one("#input_allowed_ips", Input).value,
-                "enable":self.query_one("#select_enabled", Select).value
-                }
-            if "clients" not in self.app_ref.wg_data["servers"][self.id_server]:
-                self.app_ref.wg_data["servers"][self.id_server]["clients"]={}
-            self.app_ref.wg_data["servers"][self.id_server]["clients"][self.id_client] = client_new
-        
-            with open("wg_data.json", 'w', encoding='utf-8') as f:
-                json.dump(self.app_ref.wg_data, f, indent=2, ensure_ascii=False)
+            client_new = models.Client(
+                id=self.id_client,
+                name=self.query_one("#name", Input).value,
+                private_key=self.query_one("#input_private_key", Input).value,
+                public_key=self.query_one("#input_public_key", Input).value,
+                preshared_key=self.query_one("#input_preshared_key", Input).value,
+                persistent_keepalive=models.to_int(self.query_one("#input_persistent_keepalive", Input).value),
+                address=models.join_addresses(models.split_addresses(self.query_one("#input_address", Input).value)),
+                dns=self.query_one("#input_dns", Input).value,
+                allowed_ips=self.query_one("#input_allowed_ips", Input).value,
+                enable=self.query_one("#select_enabled", Select).value,
+                ).to_dict()
+            self.app_ref.persist([("set", ["servers", self.id_server, "clients", self.id_client], client_new)])
             return True # Indicar éxito
         except Exception as e:
             return False
             
     
-    def get_next_available_ip(self, clients_data, server_address):
-        """Obtiene la siguiente dirección IP disponible en la subred especificada por el servidor."""
+    def get_next_available_ip(self, clients_data, server_address, pools=None):
+        """Obtiene la siguiente dirección IP disponible en la subred del servidor (o en sus pools).
+
+        Devuelve None (con un aviso y sin cerrar el modal) si la dirección del
+        servidor no es válida o no queda sitio en ninguna de sus subredes.
+        """
         try:
-            # Crear el objeto de red a partir de la dirección del servidor
-            network = ipaddress.ip_network(server_address, strict=False)
-            server_ip = ipaddress.ip_address(server_address.split('/')[0])  # Extraer solo la IP del servidor
+            # Asignador de la subred (una dirección por familia en doble pila), sincronizado
+            # solo con los clientes que cambiaron. Si se llena se pasa al siguiente pool.
+            next_ip = allocator.next_client_address(self.id_server, server_address, clients_data or {}, pools)
         except ValueError:
             self.notify (f"[bold red]Error:[/bold red] No se pudo generar una ip de forma automatica para este cliente a partir de la ip del del seridor: {server_address}",
                          title="Dirección del servidor inválida", severity="warning")
-            self.app.pop_screen()
-            return "0.0.0.0/32"
-        used_ips = set()
-        if clients_data:
-            for client_details in clients_data.values():
-                client_address = client_details.get("address")
-                if client_address:
-                    try:
-                        ip = ipaddress.ip_address(client_address.split('/')[0])  # Extraer solo la IP
-                        used_ips.add(ip)
-                    except ValueError:
-                        self.notify(f"[bold red]Error:[/bold red] Dirección IP inválida del cliente: {client_address}",
-                                    title="Dirección IP inválida", severity="warning")
-                        self.app.pop_screen()
-                        return "0.0.0.0/32"  # Retornar una IP inválida si hay un error en la dirección del cliente
-                        #self.notify(f"[yellow]Advertencia:[/yellow] Dirección IP inválida: {client_address}",severity="warning")
-                        
-        # Iterar sobre todas las IPs posibles en la subred, excluyendo la del servidor
-        for ip in network.hosts():
-            if ip != server_ip and ip not in used_ips:
-                return f"{ip}/32"  # Devuelve la IP con máscara /32
-        self.notify(f"[bold red]Error:[/bold red] No hay direcciones IP disponibles en la subred {server_address}",
-                    title="Sin IPs disponibles", severity="warning")
-        self.app.pop_screen()
-        return "0.0.0.0/32"  # No hay IPs disponibles
\ No newline at end of file
+            return None
+        for client_address in allocator.invalid_addresses(self.id_server, server_address, pools=pools).values():
+            self.notify(f"[bold red]Error:[/bold red] Dirección IP inválida del cliente: {client_address}",
+                        title="Dirección IP inválida", severity="warning")
+        if next_ip is None:
+            self.notify(f"[bold red]Error:[/bold red] No hay direcciones IP disponibles en la subred {server_address} ni en sus pools. Añade un pool al servidor.",
+                        title="Sin IPs disponibles", severity="warning")
+        return next_ip  # IP con máscara /32 (y /128 en doble pila), o None
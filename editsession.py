@@ -0,0 +1,63 @@
+# Sesión de edición de un registro (cliente o servidor).
+# En lugar de copiar el registro completo y compararlo serializado en cada
+# vuelta, se guardan solo los campos que el usuario cambió. Si un campo vuelve a
+# su valor original deja de contar como cambio, así que `dirty` es exacto y se
+# consulta en O(1). Al guardar se persisten solo esas claves como operaciones
+# ("set", ruta + [campo], valor) del almacén (store.apply).
+
+_MISSING = object()
+
+
+class EditSession:
+    """Cambios pendientes sobre `record`, que no se modifica (puede ser el documento en caché)."""
+
+    __slots__ = ("record", "path", "_changes")
+
+    def __init__(self, record, path=()):
+        self.record = record
+        self.path = list(path) # Ruta del registro en el documento, p. ej. ["clients", uuid]
+        self._changes = {}
+
+    def get(self, field, default=None):
+        """Valor actual del campo: el editado si lo hay, si no el original."""
+        value = self._changes.get(field, _MISSING)
+        if value is _MISSING:
+            return self.record.get(field, default)
+        return value
+
+    def set(self, field, value):
+        """Registra un cambio; volver al valor original lo descarta."""
+        original = self.record.get(field, _MISSING)
+        if original is not _MISSING and original == value:
+            self._changes.pop(field, None)
+        else:
+            self._changes[field] = value
+
+    def discard(self, field=None):
+        """Olvida el cambio de `field` (o todos)."""
+        if field is None:
+            self._changes.clear()
+        else:
+            self._changes.pop(field, None)
+
+    @property
+    def dirty(self):
+        return bool(self._changes)
+
+    def touched(self):
+        """Campos modificados, en el orden en que se tocaron."""
+        return list(self._changes)
+
+    def patch(self):
+        """Parche mínimo {campo: valor nuevo}."""
+        return dict(self._changes)
+
+    def ops(self):
+        """El parche como operaciones del almacén."""
+        return [("set", self.path + [field], value) for field, value in self._changes.items()]
+
+    def result(self):
+        """Registro resultante (copia superficial del original con el parche aplicado)."""
+        merged = dict(self.record)
+        merged.update(self._changes)
+        return merged
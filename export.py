@@ -0,0 +1,212 @@
+import concurrent.futures
+import io
+import os
+import re
+import tempfile
+import time
+import zipfile
+
+import models
+
+try:
+    import qrcode
+    import qrcode.image.svg
+except ImportError: # Opcional: sin qrcode solo se exportan los .conf
+    qrcode = None
+
+# Exportación masiva de la configuración de los clientes.
+# export_clients() escribe el <nombre>.conf de cada cliente de uno o varios
+# servidores en un directorio o en un único .zip, con su QR en PNG y/o SVG al
+# lado si se pide. Codificar el QR es lo caro, así que los clientes se reparten
+# en lotes entre un pool de procesos; el proceso principal solo escribe los
+# archivos (o el zip) y va informando del progreso.
+#
+# CLI: python cli/export_clients.py destino [--server ID] [--qr png,svg] [--workers N]
+
+QR_FORMATS = ("png", "svg")
+CHUNK_SIZE = 64 # Clientes por lote enviado a cada proceso
+FILE_MODE = 0o600 # Los .conf llevan la clave privada del cliente
+QR_MISSING = "La biblioteca 'qrcode' no está instalada: pip install qrcode[pil]"
+
+
+def client_config_text(client_data, server_data):
+    """Texto .conf de un cliente (el mismo para el QR y para el archivo)."""
+    client = models.Client.from_dict(None, client_data)
+    server = models.Server.from_dict(None, server_data, with_clients=False)
+    config = (
+        f"[Interface]\n"
+        f"PrivateKey = {client.private_key}\n"
+        f"Address = {client.address}\n"
+        f"DNS = {server.dns}\n\n"
+        f"[Peer]\n"
+        f"PublicKey = {server.public_key}\n"
+        f"Endpoint = {server.endpoint}:{server.port}\n"
+        f"AllowedIPs = 0.0.0.0/0, ::/0\n"
+    )
+    if client.preshared_key:
+        config += f"PresharedKey = {client.preshared_key}\n"
+    return config
+
+
+def qr_image(text, fmt):
+    """Bytes del QR de `text` en formato "png" (requiere Pillow) o "svg"."""
+    if qrcode is None:
+        raise RuntimeError(QR_MISSING)
+    qr = qrcode.QRCode(border=4)
+    qr.add_data(text)
+    qr.make(fit=True)
+    if fmt == "svg":
+        image = qr.make_image(image_factory=qrcode.image.svg.SvgPathImage)
+    else:
+        image = qr.make_image()
+    buf = io.BytesIO()
+    image.save(buf)
+    return buf.getvalue()
+
+
+def _render_chunk(items, qr_formats):
+    """[(ruta relativa, bytes)] de un lote de (ruta base, texto .conf). Se ejecuta en el pool."""
+    files = []
+    for base, text in items:
+        files.append((base + ".conf", text.encode("utf-8")))
+        for fmt in qr_formats:
+            files.append((f"{base}.{fmt}", qr_image(text, fmt)))
+    return files
+
+
+def _safe_name(name, taken):
+    """Nombre de archivo válido y único dentro de `taken` (que se actualiza)."""
+    base = re.sub(r"[^\w.-]+", "_", str(name)).strip("._") or "cliente"
+    candidate, n = base, 1
+    while candidate.lower() in taken:
+        n += 1
+        candidate = f"{base}-{n}"
+    taken.add(candidate.lower())
+    return candidate
+
+
+def iter_items(data, server_ids):
+    """(ruta base, texto .conf) de cada cliente de `server_ids`, con una carpeta por servidor si hay varios."""
+    servers = data.get("servers") or {}
+    folders = set()
+    for server_id in server_ids:
+        server = servers[server_id]
+        prefix = ""
+        if len(server_ids) > 1:
+            prefix = _safe_name(server.get("name") or server_id, folders) + "/"
+        taken = set()
+        for client_id, client in (server.get("clients") or {}).items():
+            yield prefix + _safe_name(client.get("name") or client_id, taken), client_config_text(client, server)
+
+
+class _DirectoryWriter:
+    def __init__(self, target):
+        self.target = target
+        os.makedirs(target, exist_ok=True)
+
+    def write(self, relpath, content):
+        path = os.path.join(self.target, *relpath.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, FILE_MODE)
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+
+    def close(self, ok):
+        pass
+
+
+class _ZipWriter:
+    """Zip escrito en un temporal y renombrado al terminar (no queda un zip a medias)."""
+
+    def __init__(self, target):
+        self.target = target
+        fd, self.tmp_path = tempfile.mkstemp(prefix=".wg_export.", suffix=".tmp",
+                                             dir=os.path.dirname(os.path.abspath(target)))
+        os.close(fd)
+        self.zip = zipfile.ZipFile(self.tmp_path, "w", zipfile.ZIP_DEFLATED)
+
+    def write(self, relpath, content):
+        info = zipfile.ZipInfo(relpath, date_time=time.localtime()[:6])
+        info.external_attr = (0o100000 | FILE_MODE) << 16
+        info.compress_type = zipfile.ZIP_DEFLATED
+        self.zip.writestr(info, content)
+
+    def close(self, ok):
+        self.zip.close()
+        if ok:
+            os.chmod(self.tmp_path, FILE_MODE)
+            os.replace(self.tmp_path, self.target)
+        else:
+            os.unlink(self.tmp_path)
+
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def export_clients(data, server_ids, target, qr_formats=(), workers=None, progress=None, chunk_size=CHUNK_SIZE):
+    """Exporta los clientes de `server_ids` a `target` (directorio, o zip si termina en .zip).
+
+    `qr_formats` es una secuencia con "png" y/o "svg". `progress(hechos, total)`
+    se llama tras cada lote. Devuelve {"clients", "files", "bytes", "seconds",
+    "rate"} (rate = archivos por segundo). Lanza ValueError si un formato no
+    existe y RuntimeError si se piden QR sin la biblioteca qrcode.
+    """
+    qr_formats = tuple(qr_formats)
+    unknown = [fmt for fmt in qr_formats if fmt not in QR_FORMATS]
+    if unknown:
+        raise ValueError(f"Formato de QR desconocido: {', '.join(unknown)} (válidos: {', '.join(QR_FORMATS)})")
+    if qr_formats and qrcode is None:
+        raise RuntimeError(QR_MISSING)
+    servers = data.get("servers") or {}
+    total = sum(len(servers[server_id].get("clients") or {}) for server_id in server_ids)
+    chunks = _chunks(iter_items(data, server_ids), chunk_size)
+    writer = _ZipWriter(target) if target.lower().endswith(".zip") else _DirectoryWriter(target)
+    stats = {"clients": 0, "files": 0, "bytes": 0}
+    start = time.perf_counter()
+
+    def consume(files, count):
+        for relpath, content in files:
+            writer.write(relpath, content)
+            stats["files"] += 1
+            stats["bytes"] += len(content)
+        stats["clients"] += count
+        if progress is not None:
+            progress(stats["clients"], total)
+
+    ok = False
+    try:
+        workers = workers or os.cpu_count() or 1
+        if not qr_formats or workers < 2 or total <= chunk_size:
+            for chunk in chunks: # Sin QR no compensa repartir: solo es formatear texto
+                consume(_render_chunk(chunk, qr_formats), len(chunk))
+        else:
+            try:
+                with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+                    pending = {}
+                    for chunk in chunks:
+                        pending[pool.submit(_render_chunk, chunk, qr_formats)] = len(chunk)
+                        if len(pending) >= workers * 2: # Acota la memoria: como mucho 2 lotes por proceso en vuelo
+                            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                            for future in done:
+                                consume(future.result(), pending.pop(future))
+                    for future in concurrent.futures.as_completed(pending):
+                        consume(future.result(), pending[future])
+            except (OSError, concurrent.futures.process.BrokenProcessPool):
+                if stats["clients"]:
+                    raise
+                for chunk in _chunks(iter_items(data, server_ids), chunk_size):
+                    consume(_render_chunk(chunk, qr_formats), len(chunk))
+        ok = True
+    finally:
+        writer.close(ok)
+    stats["seconds"] = time.perf_counter() - start
+    stats["rate"] = stats["files"] / stats["seconds"] if stats["seconds"] else 0.0
+    return stats
@@ -0,0 +1,117 @@
+import models
+import shards
+
+# Carga "solo cabeceras" de clientes.
+# Los selectores del TUI y el listado de la CLI solo necesitan unos pocos campos
+# de cada cliente. ClientStub guarda únicamente esos campos (con __slots__) y
+# el registro completo, con privateKey/presharedKey/allowedIPs, se pide al
+# almacén (store.load_client) solo cuando se abre o exporta un cliente.
+
+HEADER_FIELDS = ("name", "address", "enable", "publicKey", "dns")
+
+
+class ClientStub:
+    """Cabecera ligera de un cliente: id, name, address, enable, publicKey y dns."""
+
+    __slots__ = ("id", "name", "address", "enable", "publicKey", "dns")
+
+    def __init__(self, client_id, name=None, address=None, enable=False, publicKey=None, dns=None):
+        self.id = client_id
+        self.name = name
+        self.address = address
+        self.enable = enable
+        self.publicKey = publicKey
+        self.dns = dns
+
+    @classmethod
+    def from_client(cls, client_id, client):
+        enable = client.get("enable")
+        if enable is None:
+            enable = client.get("enabled", False)
+        address = models.join_addresses(models.split_addresses(client.get("address")))
+        return cls(client_id, client.get("name"), address, bool(enable),
+                   client.get("publicKey"), client.get("dns"))
+
+    @staticmethod
+    def _field(key):
+        # 'enabled' es el nombre antiguo del campo en algunos archivos.
+        return "enable" if key == "enabled" else key
+
+    def get(self, key, default=None):
+        key = self._field(key)
+        if key in self.__slots__:
+            value = getattr(self, key)
+            return default if value is None else value
+        return default
+
+    def __getitem__(self, key):
+        key = self._field(key)
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        # Los campos que no son de cabecera solo existen en disco.
+        key = self._field(key)
+        if key in HEADER_FIELDS:
+            setattr(self, key, value)
+
+    def pop(self, key, default=None):
+        key = self._field(key)
+        if key in HEADER_FIELDS:
+            value = getattr(self, key)
+            setattr(self, key, None)
+            return value
+        return default
+
+    def __contains__(self, key):
+        key = self._field(key)
+        return key in HEADER_FIELDS and getattr(self, key) is not None
+
+    def __repr__(self):
+        return f"ClientStub({self.id!r}, name={self.name!r}, address={self.address!r}, enable={self.enable!r})"
+
+
+def is_stub(client):
+    return isinstance(client, ClientStub)
+
+
+def stub_server(server):
+    """Copia superficial del servidor con sus clientes reducidos a ClientStub."""
+    server = dict(server)
+    clients = server.get("clients") or {}
+    server["clients"] = {
+        client_id: client if is_stub(client) else ClientStub.from_client(client_id, client)
+        for client_id, client in clients.items()
+    }
+    return server
+
+
+def stub_document(doc):
+    """Convierte un documento completo en uno de cabeceras (el original se puede liberar)."""
+    servers = doc.get("servers", {})
+    if isinstance(servers, shards.LazyServers):
+        previous = servers.transform
+        servers.transform = stub_server if previous is None else (lambda server: stub_server(previous(server)))
+        return doc
+    doc["servers"] = {server_id: stub_server(server) for server_id, server in servers.items()}
+    return doc
+
+
+def absorb(doc, ops):
+    """Tras aplicar `ops` a un documento de cabeceras, reduce los registros completos a ClientStub.
+
+    Los valores de las operaciones no se modifican (siguen en la cola del escritor).
+    """
+    servers = doc.get("servers", {})
+    for op in ops:
+        path = op[1]
+        if op[0] != "set" or len(path) < 2 or path[0] != "servers" or path[1] not in servers:
+            continue
+        if len(path) == 2:
+            servers[path[1]] = stub_server(op[2])
+        elif len(path) == 3 and path[2] == "clients":
+            servers[path[1]]["clients"] = stub_server({"clients": op[2]})["clients"]
+        elif len(path) == 4 and path[2] == "clients" and isinstance(op[2], dict):
+            servers[path[1]]["clients"][path[3]] = ClientStub.from_client(path[3], op[2])
+    return doc
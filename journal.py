@@ -0,0 +1,81 @@
+import json
+import os
+
+# Diario de cambios (append-only) para el almacén JSON (store.py).
+# Junto a wg_data.json se guarda wg_data.json.journal: una línea JSON por
+# operación ({"op": "set", "path": [...], "value": ...} o {"op": "del", "path": [...]}).
+# El documento real es la instantánea base con el diario aplicado encima, así
+# que el coste de escribir un cambio depende del tamaño del cambio y no del
+# número de servidores/clientes.
+#
+# Las operaciones set/del son idempotentes: si el proceso se interrumpe después
+# de escribir una instantánea nueva pero antes de vaciar el diario, volver a
+# aplicarlo produce el mismo resultado.
+
+SUFFIX = ".journal"
+
+
+def journal_path(path):
+    return path + SUFFIX
+
+
+def size(path):
+    """Tamaño en bytes del diario de `path` (0 si no existe)."""
+    try:
+        return os.path.getsize(journal_path(path))
+    except FileNotFoundError:
+        return 0
+
+
+def encode(ops):
+    """Serializa las operaciones como líneas JSONL."""
+    lines = []
+    for op in ops:
+        record = {"op": op[0], "path": list(op[1])}
+        if op[0] == "set":
+            record["value"] = op[2]
+        lines.append(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+    return "".join(lines)
+
+
+def append(path, ops):
+    """Añade las operaciones al final del diario y hace fsync."""
+    with open(journal_path(path), "a", encoding="utf-8") as f:
+        f.write(encode(ops))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def read_ops(path):
+    """Devuelve las operaciones del diario en orden.
+
+    Una última línea incompleta (escritura interrumpida) se ignora.
+    """
+    ops = []
+    try:
+        f = open(journal_path(path), "r", encoding="utf-8")
+    except FileNotFoundError:
+        return ops
+    with f:
+        for line in f:
+            if not line.endswith("\n"):
+                break
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                break
+            if record.get("op") == "set":
+                ops.append(("set", record["path"], record.get("value")))
+            else:
+                ops.append(("del", record["path"]))
+    return ops
+
+
+def truncate(path):
+    """Vacía el diario después de incorporar su contenido a la instantánea."""
+    try:
+        with open(journal_path(path), "w", encoding="utf-8") as f:
+            f.flush()
+            os.fsync(f.fileno())
+    except FileNotFoundError:
+        pass
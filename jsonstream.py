@@ -0,0 +1,184 @@
+import json
+import re
+
+# Lector incremental de wg_data.json.
+# Recorre el archivo por bloques y solo construye objetos Python para los
+# clientes del servidor pedido; el resto de servidores (y sus claves) se saltan
+# a nivel de caracteres sin materializarlos. Útil para listar o exportar un
+# servidor de un archivo muy grande sin cargar el árbol completo.
+
+CHUNK_SIZE = 64 * 1024
+
+_WS = " \t\r\n"
+_STRUCT = re.compile(r'["{}\[\]]')
+_STRING_STOP = re.compile(r'["\\]')
+_SCALAR_END = re.compile(r'[,}\]\s]')
+
+
+class StreamError(ValueError):
+    """El archivo no tiene la forma JSON esperada."""
+
+
+class _Scanner:
+    def __init__(self, f, chunk_size=CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.mark = None # Inicio del valor que se está capturando (no se descarta del búfer)
+
+    def _more(self):
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            return False
+        keep = self.pos if self.mark is None else self.mark
+        self.buf = self.buf[keep:] + chunk
+        self.pos -= keep
+        if self.mark is not None:
+            self.mark = 0
+        return True
+
+    def peek(self):
+        """Siguiente carácter que no sea espacio (sin consumirlo)."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WS:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._more():
+                raise StreamError("Fin de archivo inesperado")
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise StreamError(f"Se esperaba '{char}' en la posición {self.pos}")
+        self.pos += 1
+
+    def _skip_string(self):
+        self.pos += 1 # comilla de apertura
+        while True:
+            m = _STRING_STOP.search(self.buf, self.pos)
+            if m is None:
+                self.pos = len(self.buf)
+                if not self._more():
+                    raise StreamError("Cadena sin cerrar")
+                continue
+            self.pos = m.start()
+            if m.group() == '"':
+                self.pos += 1
+                return
+            # Escape: asegurar que el carácter escapado está en el búfer.
+            while self.pos + 1 >= len(self.buf):
+                if not self._more():
+                    raise StreamError("Cadena sin cerrar")
+            self.pos += 2
+
+    def read_string(self):
+        self.peek()
+        self.mark = self.pos
+        self._skip_string()
+        raw = self.buf[self.mark:self.pos]
+        self.mark = None
+        return json.loads(raw)
+
+    def skip_value(self):
+        char = self.peek()
+        if char == '"':
+            self._skip_string()
+        elif char in "{[":
+            depth = 0
+            while True:
+                m = _STRUCT.search(self.buf, self.pos)
+                if m is None:
+                    self.pos = len(self.buf)
+                    if not self._more():
+                        raise StreamError("Objeto sin cerrar")
+                    continue
+                self.pos = m.start()
+                if m.group() == '"':
+                    self._skip_string()
+                    continue
+                self.pos += 1
+                depth += 1 if m.group() in "{[" else -1
+                if depth == 0:
+                    return
+        else:
+            while True:
+                m = _SCALAR_END.search(self.buf, self.pos)
+                if m is not None:
+                    self.pos = m.start()
+                    return
+                self.pos = len(self.buf)
+                if not self._more():
+                    return
+
+    def read_value(self):
+        self.peek()
+        self.mark = self.pos
+        self.skip_value()
+        raw = self.buf[self.mark:self.pos]
+        self.mark = None
+        return json.loads(raw)
+
+    def iter_keys(self):
+        """Recorre las claves del objeto actual; quien llama debe consumir cada valor."""
+        self.expect("{")
+        first = True
+        while True:
+            char = self.peek()
+            if char == "}":
+                self.pos += 1
+                return
+            if not first:
+                self.expect(",")
+            first = False
+            key = self.read_string()
+            self.expect(":")
+            yield key
+
+
+def _open(path):
+    return open(path, "r", encoding="utf-8")
+
+
+def iter_servers(path, chunk_size=CHUNK_SIZE):
+    """Genera (id_servidor, nombre) sin leer los clientes de ningún servidor."""
+    with _open(path) as f:
+        scanner = _Scanner(f, chunk_size)
+        for key in scanner.iter_keys():
+            if key != "servers":
+                scanner.skip_value()
+                continue
+            for server_id in scanner.iter_keys():
+                name = server_id
+                for field in scanner.iter_keys():
+                    if field == "name":
+                        name = scanner.read_value()
+                    else:
+                        scanner.skip_value()
+                yield server_id, name
+            return
+
+
+def iter_clients(path, server_id, chunk_size=CHUNK_SIZE):
+    """Genera (id_cliente, datos) de los clientes de `server_id`, uno a uno.
+
+    Lanza KeyError si el servidor no existe en el archivo.
+    """
+    with _open(path) as f:
+        scanner = _Scanner(f, chunk_size)
+        for key in scanner.iter_keys():
+            if key != "servers":
+                scanner.skip_value()
+                continue
+            for current_id in scanner.iter_keys():
+                if current_id != server_id:
+                    scanner.skip_value()
+                    continue
+                for field in scanner.iter_keys():
+                    if field != "clients" or scanner.peek() != "{":
+                        scanner.skip_value()
+                        continue
+                    for client_id in scanner.iter_keys():
+                        yield client_id, scanner.read_value()
+                return
+    raise KeyError(server_id)
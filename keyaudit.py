@@ -0,0 +1,123 @@
+import time
+
+import keys
+import models
+
+# Auditoría de coherencia de claves de todos los servidores y clientes.
+# Las claves se pueden editar a mano en el TUI y versiones antiguas guardaban
+# marcadores como "PLACEHOLDER_PRIVATE_KEY_wg_not_found" cuando faltaba 'wg'.
+# audit() recorre el documento una vez, deriva en lote (y en varios procesos,
+# ver keys.derive_public_keys) la pública de cada privada y señala:
+#   - "placeholder": valor marcador en lugar de una clave
+#   - "malformed":   base64 inválido o longitud distinta de 32 bytes
+#   - "mismatch":    la pública guardada no corresponde a la privada
+#   - "reused":      la misma clave aparece en más de un registro
+# Los clientes se leen con los mismos alias que models.Client (p. ej. la PSK
+# como 'presharedKey' o el antiguo 'PresharedKey' de wg0.json). En un servidor
+# 'PresharedKey' es el antiguo indicador generatePresharedKey, no una clave.
+#
+# CLI: python cli/audit_keys.py [archivo]
+
+KINDS = ("placeholder", "malformed", "mismatch", "reused")
+KEY_FIELDS = ("privateKey", "publicKey", "presharedKey")
+PLACEHOLDER_VALUES = ("no_wg", "error")
+CLIENT_FIELD_NAMES = models.field_names(models.Client.ALIASES)
+
+
+def is_placeholder(value):
+    return value.startswith("PLACEHOLDER") or value in PLACEHOLDER_VALUES
+
+
+class Finding:
+    """Problema detectado en una clave. `client_id` es None para el propio servidor."""
+
+    __slots__ = ("kind", "server_id", "client_id", "field", "detail")
+
+    def __init__(self, kind, server_id, client_id, field, detail=""):
+        self.kind = kind
+        self.server_id = server_id
+        self.client_id = client_id
+        self.field = field
+        self.detail = detail
+
+    def __repr__(self):
+        return f"Finding({self.kind!r}, {self.server_id!r}, {self.client_id!r}, {self.field!r})"
+
+
+def iter_records(data):
+    """(id_servidor, id_cliente o None, registro) de cada servidor y cliente del documento."""
+    servers = data.get("servers")
+    if hasattr(servers, "items"): # dict o shards.LazyServers
+        for server_id in servers:
+            server = servers[server_id]
+            yield server_id, None, server
+            for client_id, client in (server.get("clients") or {}).items():
+                yield server_id, client_id, client
+    if isinstance(data.get("server"), dict): # Antiguo wg0.json
+        yield None, None, data["server"]
+        for client_id, client in (data.get("clients") or {}).items():
+            yield None, client_id, client
+
+
+def audit(data, workers=None):
+    """Audita las claves de `data`.
+
+    Devuelve (hallazgos, estadísticas), con estadísticas = {"records",
+    "derived", "seconds", "rate"} (rate = claves públicas derivadas por segundo).
+    """
+    findings = []
+    seen = {} # valor de la clave -> primer (servidor, cliente, campo)
+    to_derive = [] # (servidor, cliente, privada, pública guardada)
+    records = 0
+    for server_id, client_id, record in iter_records(data):
+        records += 1
+        names = CLIENT_FIELD_NAMES if client_id is not None else {}
+        values = {field: models.first_value(record, names.get(field, (field,))) for field in KEY_FIELDS}
+        for field in KEY_FIELDS:
+            value = values[field]
+            if field == "presharedKey" and not value:
+                continue # La PSK es opcional
+            value = "" if value is None else str(value).strip()
+            if not value:
+                if field == "privateKey" or client_id is None:
+                    continue # Peers importados pueden no tener privada
+                findings.append(Finding("malformed", server_id, client_id, field, "vacía"))
+                continue
+            if is_placeholder(value):
+                findings.append(Finding("placeholder", server_id, client_id, field, value))
+                continue
+            try:
+                keys.decode_key(value)
+            except ValueError as e:
+                findings.append(Finding("malformed", server_id, client_id, field, str(e)))
+                continue
+            first = seen.setdefault(value, (server_id, client_id, field))
+            if first != (server_id, client_id, field):
+                findings.append(Finding("reused", server_id, client_id, field,
+                                        f"también en servidor={first[0]} cliente={first[1]} ({first[2]})"))
+        private_key = str(values["privateKey"] or "").strip()
+        public_key = str(values["publicKey"] or "").strip()
+        if private_key and public_key and not is_placeholder(private_key) and not is_placeholder(public_key):
+            to_derive.append((server_id, client_id, private_key, public_key))
+
+    start = time.perf_counter()
+    derived = keys.derive_public_keys([item[2] for item in to_derive], workers=workers)
+    seconds = time.perf_counter() - start
+    for (server_id, client_id, _, public_key), expected in zip(to_derive, derived):
+        if expected is not None and expected != public_key:
+            findings.append(Finding("mismatch", server_id, client_id, "publicKey", f"esperada {expected}"))
+    stats = {
+        "records": records,
+        "derived": len(derived),
+        "seconds": seconds,
+        "rate": len(derived) / seconds if seconds else 0.0,
+    }
+    return findings, stats
+
+
+def summary(findings):
+    """{tipo: número de hallazgos} para todos los tipos."""
+    counts = dict.fromkeys(KINDS, 0)
+    for finding in findings:
+        counts[finding.kind] += 1
+    return counts
@@ -0,0 +1,93 @@
+import collections
+import threading
+import time
+
+import keys
+
+# Reserva de claves pre-generadas para el TUI.
+# Generar un par X25519 en Python puro lleva unos milisegundos; hacerlo dentro de
+# un manejador de Textual congela la interfaz. KeyPool mantiene una cola acotada
+# de pares de claves y de claves precompartidas que un hilo en segundo plano
+# rellena cuando bajan del umbral `low_water`, de modo que los modales las toman
+# al instante. Si la reserva se agota se genera en el momento (nunca se espera
+# al hilo).
+
+
+class KeyPool:
+    """Cola acotada de pares de claves y PSK con relleno en segundo plano."""
+
+    def __init__(self, capacity=32, low_water=8):
+        self.capacity = capacity
+        self.low_water = low_water
+        self.keypairs = collections.deque()
+        self.psks = collections.deque()
+        self.generated = 0 # Pares generados por el hilo desde el inicio
+        self.misses = 0 # Peticiones atendidas en el momento por estar vacía la reserva
+        self.rate = 0.0 # Pares por segundo en la última tanda de relleno
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="wg-key-pool", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=2)
+
+    def take_keypair(self):
+        """Devuelve (clave_privada, clave_pública) sin esperar al hilo de relleno."""
+        try:
+            pair = self.keypairs.popleft()
+        except IndexError:
+            self.misses += 1
+            pair = keys.generate_keypair()
+        self._check_low_water()
+        return pair
+
+    def take_psk(self):
+        """Devuelve una clave precompartida sin esperar al hilo de relleno."""
+        try:
+            psk = self.psks.popleft()
+        except IndexError:
+            self.misses += 1
+            psk = keys.generate_preshared_key()
+        self._check_low_water()
+        return psk
+
+    @property
+    def depth(self):
+        return len(self.keypairs)
+
+    def status(self):
+        """Texto corto para la interfaz: profundidad de la reserva y ritmo de relleno."""
+        return f"Claves: {self.depth}/{self.capacity} ({len(self.psks)} PSK) · {self.rate:.0f} pares/s"
+
+    def _check_low_water(self):
+        if len(self.keypairs) < self.low_water or len(self.psks) < self.low_water:
+            self._wakeup.set()
+
+    def _run(self):
+        # Al arrancar se llena por completo; después solo al cruzar el umbral.
+        self._wakeup.set()
+        while not self._stop.is_set():
+            self._wakeup.wait()
+            self._wakeup.clear()
+            self._refill()
+
+    def _refill(self):
+        start = time.perf_counter()
+        made = 0
+        # deque.append/popleft son atómicas: no hace falta cerrojo con los consumidores.
+        while not self._stop.is_set() and len(self.keypairs) < self.capacity:
+            self.keypairs.append(keys.generate_keypair())
+            made += 1
+        while not self._stop.is_set() and len(self.psks) < self.capacity:
+            self.psks.append(keys.generate_preshared_key())
+        elapsed = time.perf_counter() - start
+        if made:
+            self.generated += made
+            self.rate = made / elapsed if elapsed else 0.0
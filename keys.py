@@ -0,0 +1,361 @@
+import base64
+import concurrent.futures
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+try:
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+except ImportError: # Opcional: sin 'cryptography' se usa la implementación en Python puro
+    X25519PrivateKey = None
+
+# Claves de WireGuard generadas en el propio proceso.
+# Genera claves privadas, deriva la pública (X25519, RFC 7748) y claves
+# precompartidas sin lanzar 'wg genkey'/'wg pubkey'/'wg genpsk'. El resultado es
+# el mismo que el de 'wg': 32 bytes en base64 estándar (44 caracteres), con la
+# clave privada ya "clampeada" como hace 'wg genkey'.
+#
+# Backend (WG_KEY_BACKEND): "auto" usa 'cryptography' si está instalado y, si
+# no, la implementación en Python puro; "python" fuerza esta última y "wg"
+# vuelve a usar los subprocesos de wireguard-tools.
+#
+# En Python puro la clave pública se calcula como multiplicación de base fija en
+# la forma de Edwards (tabla precalculada de 64x16 puntos, 64 sumas por clave) y
+# se convierte a la coordenada u de Montgomery; es varias veces más rápido que la
+# escalera genérica, que se mantiene para puntos arbitrarios.
+#
+# Para altas masivas generate_keypairs(n) reparte el trabajo en un pool de
+# procesos cuando n es grande y hay más de un núcleo.
+#
+# Benchmark: python keys.py bench [n]
+
+KEY_BYTES = 32
+BACKEND_ENV = os.environ.get("WG_KEY_BACKEND", "auto")
+
+_P = 2 ** 255 - 19
+_A24 = 121665
+_BASE_POINT = 9
+# Edwards25519: -x^2 + y^2 = 1 + d*x^2*y^2, equivalente birracional de Curve25519.
+_D2 = 2 * (-121665 * pow(121666, _P - 2, _P)) % _P
+_ED_BASE = (15112221349535400772501151409588531511454012693041857206046113283949847762202,
+            46316835694926478169428394003475163141307993866256225615783033603165251855960)
+_base_table = None
+
+POOL_THRESHOLD = 512 # A partir de cuántos pares se usa el pool de procesos
+
+
+class KeyGenerationError(RuntimeError):
+    """No se pudo generar o derivar una clave."""
+
+
+def encode_key(raw):
+    return base64.b64encode(raw).decode("ascii")
+
+
+def decode_key(key):
+    """Bytes de una clave en base64. Lanza ValueError si no son 32 bytes válidos."""
+    try:
+        raw = base64.b64decode(key, validate=True)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Clave con base64 inválido: {key!r}") from e
+    if len(raw) != KEY_BYTES:
+        raise ValueError(f"La clave debe tener {KEY_BYTES} bytes (tiene {len(raw)}).")
+    return raw
+
+
+def _clamp(raw):
+    scalar = bytearray(raw)
+    scalar[0] &= 248
+    scalar[31] &= 127
+    scalar[31] |= 64
+    return bytes(scalar)
+
+
+def _x25519(scalar, u):
+    """Multiplicación escalar en Curve25519 (escalera de Montgomery, RFC 7748 §5).
+
+    No es de tiempo constante: pensada para generar claves localmente, no para
+    operar con secretos ante un atacante que mida tiempos.
+    """
+    k = int.from_bytes(_clamp(scalar), "little")
+    x1, x2, z2, x3, z3 = u, 1, 0, u, 1
+    swap = 0
+    for t in range(254, -1, -1):
+        bit = (k >> t) & 1
+        if swap ^ bit:
+            x2, x3, z2, z3 = x3, x2, z3, z2
+        swap = bit
+        a = x2 + z2
+        aa = a * a % _P
+        b = x2 - z2
+        bb = b * b % _P
+        e = aa - bb
+        c = x3 + z3
+        d = x3 - z3
+        da = d * a % _P
+        cb = c * b % _P
+        x3 = (da + cb) ** 2 % _P
+        z3 = x1 * (da - cb) ** 2 % _P
+        x2 = aa * bb % _P
+        z2 = e * (aa + _A24 * e) % _P
+    if swap:
+        x2, z2 = x3, z3
+    return (x2 * pow(z2, _P - 2, _P) % _P).to_bytes(KEY_BYTES, "little")
+
+
+def _ed_add(p, q):
+    """Suma en coordenadas extendidas (X, Y, Z, T) de Edwards con a = -1."""
+    x1, y1, z1, t1 = p
+    x2, y2, z2, t2 = q
+    a = (y1 - x1) * (y2 - x2) % _P
+    b = (y1 + x1) * (y2 + x2) % _P
+    c = t1 * _D2 % _P * t2 % _P
+    d = 2 * z1 * z2 % _P
+    e, f, g, h = b - a, d - c, d + c, b + a
+    return (e * f % _P, g * h % _P, f * g % _P, e * h % _P)
+
+
+def _table():
+    """Tabla [i][j] = j * 16^i * B, en forma (y - x, y + x, 2*d*x*y) con Z = 1."""
+    global _base_table
+    if _base_table is None:
+        x, y = _ED_BASE
+        point = (x, y, 1, x * y % _P)
+        rows = []
+        for _ in range(64):
+            row = [None]
+            multiple = point
+            for j in range(1, 16):
+                if j > 1:
+                    multiple = _ed_add(multiple, point)
+                mx, my, mz, _ = multiple
+                zinv = pow(mz, _P - 2, _P)
+                ax, ay = mx * zinv % _P, my * zinv % _P
+                row.append(((ay - ax) % _P, (ay + ax) % _P, _D2 * ax % _P * ay % _P))
+            rows.append(row)
+            point = _ed_add(multiple, point) # 16^(i+1) * B
+        _base_table = rows
+    return _base_table
+
+
+def _ed_base_mult(scalar):
+    """k*B en coordenadas extendidas para el escalar (ya clampeado) `scalar`."""
+    table = _table()
+    x1, y1, z1, t1 = 0, 1, 1, 0
+    k = int.from_bytes(scalar, "little")
+    for row in table:
+        nibble = k & 15
+        k >>= 4
+        if nibble:
+            ym, yp, t2d = row[nibble]
+            a = (y1 - x1) * ym % _P
+            b = (y1 + x1) * yp % _P
+            c = t1 * t2d % _P
+            d = 2 * z1
+            e, f, g, h = b - a, d - c, d + c, b + a
+            x1, y1, z1, t1 = e * f % _P, g * h % _P, f * g % _P, e * h % _P
+    return x1, y1, z1, t1
+
+
+def _public_python_many(raws):
+    """Claves públicas (bytes) de varias privadas con una sola inversión modular.
+
+    u = (1 + y) / (1 - y) = (Z + Y) / (Z - Y); los denominadores se invierten
+    juntos con el truco de Montgomery.
+    """
+    points = [_ed_base_mult(_clamp(raw)) for raw in raws]
+    numerators = [(z + y) % _P for _, y, z, _ in points]
+    denominators = [(z - y) % _P for _, y, z, _ in points]
+    prefix = []
+    acc = 1
+    for den in denominators:
+        prefix.append(acc)
+        acc = acc * den % _P
+    inv = pow(acc, _P - 2, _P)
+    result = [None] * len(points)
+    for i in range(len(points) - 1, -1, -1):
+        result[i] = (numerators[i] * inv % _P * prefix[i] % _P).to_bytes(KEY_BYTES, "little")
+        inv = inv * denominators[i] % _P
+    return result
+
+
+def _public_python(raw):
+    return _public_python_many([raw])[0]
+
+
+def _public_cryptography(raw):
+    key = X25519PrivateKey.from_private_bytes(raw)
+    return key.public_key().public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+
+
+def _wg(args, stdin=None):
+    try:
+        return subprocess.run(["wg", *args], input=stdin, capture_output=True, text=True,
+                              check=True, encoding="utf-8").stdout.strip()
+    except FileNotFoundError as e:
+        raise KeyGenerationError("Comando 'wg' no encontrado.") from e
+    except subprocess.CalledProcessError as e:
+        raise KeyGenerationError(f"Error ejecutando 'wg {args[0]}': {e.stderr.strip() or e}") from e
+
+
+def backend():
+    """Backend efectivo: "cryptography", "python" o "wg"."""
+    if BACKEND_ENV in ("python", "wg"):
+        return BACKEND_ENV
+    return "cryptography" if X25519PrivateKey is not None else "python"
+
+
+def generate_private_key():
+    """Clave privada nueva en base64 (como 'wg genkey')."""
+    if backend() == "wg":
+        return _wg(["genkey"])
+    return encode_key(_clamp(os.urandom(KEY_BYTES)))
+
+
+def public_key(private_key):
+    """Clave pública en base64 de una privada en base64 (como 'wg pubkey')."""
+    current = backend()
+    if current == "wg":
+        return _wg(["pubkey"], private_key + "\n")
+    raw = decode_key(private_key)
+    if current == "cryptography":
+        return encode_key(_public_cryptography(raw))
+    return encode_key(_public_python(raw))
+
+
+def generate_keypair():
+    """Devuelve (clave_privada, clave_pública) en base64."""
+    private_key = generate_private_key()
+    return private_key, public_key(private_key)
+
+
+def generate_preshared_key():
+    """Clave precompartida nueva en base64 (como 'wg genpsk')."""
+    if backend() == "wg":
+        return _wg(["genpsk"])
+    return encode_key(os.urandom(KEY_BYTES))
+
+
+def _keypair_chunk(count):
+    """Genera `count` pares (se ejecuta también en los procesos del pool)."""
+    current = backend()
+    if current == "wg":
+        return [_wg_keypair() for _ in range(count)]
+    raws = [_clamp(os.urandom(KEY_BYTES)) for _ in range(count)]
+    if current == "cryptography":
+        publics = [_public_cryptography(raw) for raw in raws]
+    else:
+        publics = _public_python_many(raws)
+    return [(encode_key(raw), encode_key(pub)) for raw, pub in zip(raws, publics)]
+
+
+def generate_keypairs(n, workers=None):
+    """Devuelve una lista de `n` tuplas (clave_privada, clave_pública) en base64.
+
+    Con n >= POOL_THRESHOLD y varios núcleos el trabajo se reparte en un pool de
+    procesos; si el pool no puede arrancar se genera en este proceso.
+    """
+    if n <= 0:
+        return []
+    workers = workers or os.cpu_count() or 1
+    if n < POOL_THRESHOLD or workers < 2:
+        return _keypair_chunk(n)
+    size, extra = divmod(n, workers)
+    chunks = [size + (1 if i < extra else 0) for i in range(workers)]
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            return [pair for chunk in pool.map(_keypair_chunk, chunks) for pair in chunk]
+    except (OSError, concurrent.futures.process.BrokenProcessPool):
+        return _keypair_chunk(n)
+
+
+def _derive_chunk(private_keys):
+    """Claves públicas en base64 de `private_keys` (None si la privada no es válida)."""
+    raws = []
+    for key in private_keys:
+        try:
+            raws.append(decode_key(key))
+        except ValueError:
+            raws.append(None)
+    valid = [raw for raw in raws if raw is not None]
+    if X25519PrivateKey is not None and BACKEND_ENV != "python":
+        publics = iter([_public_cryptography(raw) for raw in valid])
+    else:
+        publics = iter(_public_python_many(valid) if valid else [])
+    return [None if raw is None else encode_key(next(publics)) for raw in raws]
+
+
+def derive_public_keys(private_keys, workers=None, chunk_size=2048):
+    """Deriva las claves públicas de una lista de privadas, en paralelo si es larga.
+
+    Devuelve una lista alineada con `private_keys` con la pública en base64 o
+    None para las privadas mal formadas. Siempre se calcula en el propio proceso
+    (nunca con 'wg'), porque se usa para auditar lo que 'wg' u otros guardaron.
+    """
+    private_keys = list(private_keys)
+    workers = workers or os.cpu_count() or 1
+    if len(private_keys) < POOL_THRESHOLD or workers < 2:
+        return _derive_chunk(private_keys)
+    chunks = [private_keys[i:i + chunk_size] for i in range(0, len(private_keys), chunk_size)]
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            return [pub for chunk in pool.map(_derive_chunk, chunks) for pub in chunk]
+    except (OSError, concurrent.futures.process.BrokenProcessPool):
+        return _derive_chunk(private_keys)
+
+
+def generate_psks(n):
+    """Devuelve una lista de `n` claves precompartidas en base64."""
+    if backend() == "wg":
+        return [_wg(["genpsk"]) for _ in range(n)]
+    block = os.urandom(KEY_BYTES * n)
+    return [encode_key(block[i:i + KEY_BYTES]) for i in range(0, len(block), KEY_BYTES)]
+
+
+def _bench_rate(keypair, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        keypair()
+    elapsed = time.perf_counter() - start
+    return n / elapsed if elapsed else float("inf")
+
+
+def _wg_keypair():
+    private_key = _wg(["genkey"])
+    return private_key, _wg(["pubkey"], private_key + "\n")
+
+
+def bench(n=200):
+    """Imprime pares de claves por segundo de cada backend disponible y compara con 'wg'."""
+    paths = [("python", lambda: _public_python(_clamp(os.urandom(KEY_BYTES))))]
+    if X25519PrivateKey is not None:
+        paths.append(("cryptography", lambda: _public_cryptography(_clamp(os.urandom(KEY_BYTES)))))
+    has_wg = shutil.which("wg") is not None
+    if has_wg:
+        paths.append(("wg (subproceso)", _wg_keypair))
+    for name, keypair in paths:
+        print(f"{name:<16} {_bench_rate(keypair, n):>10.1f} pares/s  (n={n})")
+    start = time.perf_counter()
+    generate_keypairs(n)
+    elapsed = time.perf_counter() - start
+    print(f"{'lote (' + backend() + ')':<16} {n / elapsed if elapsed else float('inf'):>10.1f} pares/s  (n={n})")
+    if not has_wg:
+        print("'wg' no está en el PATH: se omite el subproceso y la comprobación cruzada.")
+        return
+    for _ in range(5):
+        private_key = generate_private_key()
+        if _wg(["pubkey"], private_key + "\n") != encode_key(_public_python(decode_key(private_key))):
+            print(f"DISCREPANCIA con 'wg pubkey' para {private_key}")
+            return
+    print("Claves públicas idénticas a 'wg pubkey' (5 de 5).")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "bench":
+        bench(int(sys.argv[2]) if len(sys.argv) > 2 else 200)
+    else:
+        print("Uso: python keys.py bench [n]")
+        sys.exit(1)
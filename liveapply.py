@@ -0,0 +1,284 @@
+import ipaddress
+import os
+import re
+import subprocess
+import threading
+
+import models
+
+# Aplicación en caliente de los peers de un servidor a su interfaz en marcha.
+# En lugar de 'wg-quick down/up' (que corta todas las sesiones) se lee el estado
+# real con 'wg show <interfaz> dump', se compara con los clientes habilitados y
+# se lanzan solo los 'wg set' necesarios:
+#   - "add":    cliente habilitado que la interfaz no tiene
+#   - "remove": peer de la interfaz que ya no está (borrado o deshabilitado)
+#   - "update": peer cuyas AllowedIPs o PresharedKey cambiaron
+# Los peers sin PSK se agrupan en un solo 'wg set' por lote; la PSK se pasa por
+# la entrada estándar (preshared-key /dev/stdin), nunca en la línea de órdenes.
+#
+# El ejecutable es WG_BIN ("wg" por defecto), así que se puede probar con un
+# 'wg' falso que registre las llamadas. Con dry_run=True solo se lee el estado y
+# se devuelven las órdenes que se lanzarían.
+#
+# La interfaz de un servidor es su campo 'wgInterface' (se define en el
+# formulario del servidor o con --interface en la CLI); no hay interfaz por
+# defecto: un servidor sin ella no se aplica en caliente. Dos servidores
+# habilitados con la misma interfaz tampoco (ver shared_interfaces), porque
+# aplicar uno quitaría de la interfaz los peers del otro.
+# 'interface' es la tarjeta de salida que usan las reglas PostUp/PostDown.
+#
+# CLI: python cli/apply_live.py [--server ID] [--interface wg0] [--dry-run]
+# TUI: con WG_LIVE_APPLY=1 cada cambio guardado se aplica a la interfaz (en cola
+# por interfaz, ver apply_async).
+#
+# Pruebas: tests/test_liveapply.py con el 'wg' falso de tests/fake_wg.py.
+
+WG_BIN = os.environ.get("WG_BIN", "wg")
+LIVE_APPLY = os.environ.get("WG_LIVE_APPLY", "") == "1"
+BATCH_PEERS = 128 # Peers por invocación de 'wg set' (sin PSK)
+NONE = "(none)"
+INTERFACE_RE = re.compile(r"^[A-Za-z0-9_=+.-]{1,15}$") # Nombre de interfaz de red de Linux
+ACTIONS = ("add", "remove", "update")
+
+_lock = threading.Lock()
+_pending = {} # interfaz -> (peers deseados, on_done, wg) de la última aplicación sin empezar
+_workers = {} # interfaz -> hilo que aplica sus cambios
+
+
+class ApplyError(RuntimeError):
+    """No se pudo leer o modificar la interfaz."""
+
+
+class Peer:
+    """Lo que la interfaz sabe de un peer: clave pública, PSK y AllowedIPs normalizadas."""
+
+    __slots__ = ("public_key", "preshared_key", "allowed_ips")
+
+    def __init__(self, public_key, preshared_key=None, allowed_ips=()):
+        self.public_key = public_key
+        self.preshared_key = preshared_key or None
+        self.allowed_ips = normalize_allowed_ips(allowed_ips)
+
+    def __repr__(self):
+        return f"Peer({self.public_key!r}, allowed_ips={','.join(self.allowed_ips)!r})"
+
+
+class Change:
+    """Cambio a aplicar en un peer; `fields` indica qué difiere en un "update"."""
+
+    __slots__ = ("action", "peer", "fields")
+
+    def __init__(self, action, peer, fields=()):
+        self.action = action
+        self.peer = peer
+        self.fields = tuple(fields)
+
+    def __repr__(self):
+        return f"Change({self.action!r}, {self.peer.public_key!r}, {self.fields!r})"
+
+
+def normalize_allowed_ips(value):
+    """Tupla ordenada de redes ("10.0.0.2/32") a partir de "a, b", "a,b" o una lista."""
+    networks = set()
+    for item in models.split_addresses(value):
+        try:
+            networks.add(str(ipaddress.ip_network(item, strict=False)))
+        except ValueError:
+            networks.add(item)
+    return tuple(sorted(networks))
+
+
+def interface_name(server):
+    """Interfaz WireGuard de `server` ('wgInterface') o None si no la tiene."""
+    name = server.get("wgInterface") if hasattr(server, "get") else None
+    if not name:
+        return None
+    return str(name).strip() or None
+
+
+def valid_interface(name):
+    return bool(name) and INTERFACE_RE.match(name) is not None and name not in (".", "..")
+
+
+def shared_interfaces(servers):
+    """{interfaz: [ids de servidor]} de las interfaces que usan varios servidores habilitados."""
+    users = {}
+    for server_id in servers:
+        server = servers[server_id]
+        name = interface_name(server)
+        if name is not None and server.get("enable"):
+            users.setdefault(name, []).append(server_id)
+    return {name: ids for name, ids in users.items() if len(ids) > 1}
+
+
+def _interface(server, interface):
+    """`interface` o la del servidor; lanza ApplyError si no hay o no es un nombre válido."""
+    interface = interface or interface_name(server)
+    if interface is None:
+        raise ApplyError("El servidor no tiene interfaz WireGuard ('wgInterface'); indícala en el servidor o con --interface.")
+    if not valid_interface(interface):
+        raise ApplyError(f"Nombre de interfaz no válido: {interface!r}")
+    return interface
+
+
+def _run(args, stdin=None, wg=None):
+    try:
+        return subprocess.run([wg or WG_BIN, *args], input=stdin, capture_output=True, text=True,
+                              check=True, encoding="utf-8").stdout
+    except FileNotFoundError as e:
+        raise ApplyError(f"Comando '{wg or WG_BIN}' no encontrado.") from e
+    except subprocess.CalledProcessError as e:
+        raise ApplyError(f"Error ejecutando 'wg {' '.join(args[:3])}': {e.stderr.strip() or e}") from e
+
+
+def parse_dump(text):
+    """{clave pública: Peer} de la salida de 'wg show <interfaz> dump'.
+
+    La primera línea es la propia interfaz; cada peer es una línea con
+    clave, psk, endpoint, allowed-ips, último handshake, rx, tx y keepalive
+    separados por tabuladores.
+    """
+    peers = {}
+    for line in text.splitlines()[1:]:
+        fields = line.split("\t")
+        if len(fields) < 4:
+            continue
+        public_key, psk, _, allowed_ips = fields[:4]
+        peers[public_key] = Peer(public_key, None if psk == NONE else psk,
+                                 "" if allowed_ips == NONE else allowed_ips)
+    return peers
+
+
+def read_peers(interface, wg=None):
+    """Peers en marcha de `interface`. Lanza ApplyError si 'wg' falla (interfaz caída, permisos...)."""
+    return parse_dump(_run(["show", interface, "dump"], wg=wg))
+
+
+def desired_peers(server):
+    """{clave pública: Peer} de los clientes habilitados de `server` (como en el .conf generado)."""
+    peers = {}
+    for client_id, client_data in (server.get("clients") or {}).items():
+        client = models.Client.from_dict(client_id, client_data)
+        if client.enable and client.public_key:
+            peers[client.public_key] = Peer(client.public_key, client.preshared_key, client.address)
+    return peers
+
+
+def diff(live, desired):
+    """Lista de Change para llevar `live` a `desired` (los dos {clave: Peer})."""
+    changes = [Change("remove", peer) for key, peer in live.items() if key not in desired]
+    for key, peer in desired.items():
+        current = live.get(key)
+        if current is None:
+            changes.append(Change("add", peer))
+            continue
+        fields = []
+        if current.allowed_ips != peer.allowed_ips:
+            fields.append("allowed-ips")
+        if current.preshared_key != peer.preshared_key:
+            fields.append("preshared-key")
+        if fields:
+            changes.append(Change("update", peer, fields))
+    return changes
+
+
+def _peer_args(change):
+    args = ["peer", change.peer.public_key]
+    if change.action == "remove":
+        return args + ["remove"]
+    return args + ["allowed-ips", ",".join(change.peer.allowed_ips)]
+
+
+def commands(changes, interface):
+    """[(argumentos de 'wg', entrada estándar o None)] mínimos para aplicar `changes`."""
+    batched = []
+    with_psk = []
+    for change in changes:
+        if (change.action == "add" and change.peer.preshared_key) or "preshared-key" in change.fields:
+            args = ["set", interface] + _peer_args(change)
+            if change.peer.preshared_key:
+                with_psk.append((args + ["preshared-key", "/dev/stdin"], change.peer.preshared_key + "\n"))
+            else:
+                with_psk.append((args + ["preshared-key", "/dev/null"], None)) # Quita la PSK
+        else:
+            batched.append(change)
+    result = []
+    for i in range(0, len(batched), BATCH_PEERS): # Las bajas van primero (diff las pone al principio)
+        args = ["set", interface]
+        for change in batched[i:i + BATCH_PEERS]:
+            args += _peer_args(change)
+        result.append((args, None))
+    return result + with_psk
+
+
+def summary(changes):
+    """{acción: número de cambios} para todas las acciones."""
+    counts = dict.fromkeys(ACTIONS, 0)
+    for change in changes:
+        counts[change.action] += 1
+    return counts
+
+
+def apply(server, interface=None, dry_run=False, wg=None):
+    """Aplica a la interfaz en marcha los peers de `server` con los mínimos 'wg set'.
+
+    Devuelve {"interface", "changes", "commands", "dry_run"}; "commands" son
+    los argumentos de cada 'wg set' (con la PSK fuera, por la entrada estándar).
+    Lanza ApplyError si el servidor no tiene interfaz o no se puede leer o
+    modificar.
+    """
+    return apply_peers(desired_peers(server), _interface(server, interface), dry_run, wg)
+
+
+def apply_peers(desired, interface, dry_run=False, wg=None):
+    """Como apply() con los peers deseados ya calculados ({clave: Peer})."""
+    changes = diff(read_peers(interface, wg=wg), desired)
+    planned = commands(changes, interface)
+    if not dry_run:
+        for args, stdin in planned:
+            _run(args, stdin=stdin, wg=wg)
+    return {"interface": interface, "changes": changes, "commands": [args for args, _ in planned], "dry_run": dry_run}
+
+
+def apply_async(server, on_done, interface=None, wg=None):
+    """Como apply() en segundo plano; llama a on_done(resultado, error) al terminar.
+
+    Los peers deseados se calculan antes de encolar, sobre el `server` actual.
+    Las aplicaciones de una misma interfaz se hacen de una en una en un único
+    hilo: si llega otra mientras hay una pendiente (aún sin empezar), la
+    sustituye y la anterior se descarta sin llamar a su on_done, así que el
+    estado que queda en la interfaz es siempre el último pedido.
+    Devuelve el hilo que atiende la interfaz. Lanza ApplyError (sin encolar
+    nada) si el servidor no tiene interfaz.
+    """
+    interface = _interface(server, interface)
+    desired = desired_peers(server)
+    with _lock:
+        _pending[interface] = (desired, on_done, wg)
+        thread = _workers.get(interface)
+        if thread is None:
+            thread = _workers[interface] = threading.Thread(target=_drain, args=(interface,),
+                                                            name=f"wg-live-apply-{interface}", daemon=True)
+            thread.start()
+    return thread
+
+
+def _drain(interface):
+    try:
+        while True:
+            with _lock:
+                job = _pending.pop(interface, None)
+                if job is None:
+                    del _workers[interface]
+                    return
+            desired, on_done, wg = job
+            try:
+                result = apply_peers(desired, interface, wg=wg)
+            except ApplyError as e:
+                on_done(None, e)
+            else:
+                on_done(result, None)
+    finally:
+        with _lock:
+            if _workers.get(interface) is threading.current_thread():
+                del _workers[interface] # Salida por una excepción: la próxima aplicación lanza otro hilo
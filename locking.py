@@ -0,0 +1,69 @@
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError: # Windows: solo se sincronizan los hilos del propio proceso
+    fcntl = None
+
+# Cerrojo consultivo entre procesos para el almacén (store.py).
+# El TUI y los scripts de cli/ pueden trabajar a la vez sobre el mismo archivo de
+# datos: cada escritura toma un flock exclusivo sobre <archivo>.lock mientras
+# compara la versión del documento con la del disco y escribe.
+#
+# flock pertenece al descriptor abierto, así que dentro de un mismo proceso el
+# cerrojo es reentrante: se abre un único descriptor por archivo y se cuenta la
+# profundidad; los hilos se serializan con un RLock.
+
+SUFFIX = ".lock"
+
+_locks = {}
+_registry_lock = threading.Lock()
+
+
+class FileLock:
+    """Cerrojo reentrante: RLock entre hilos + flock(LOCK_EX) entre procesos."""
+
+    def __init__(self, path):
+        self.path = path + SUFFIX
+        self._rlock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def acquire(self):
+        self._rlock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            try:
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            except Exception:
+                self._rlock.release()
+                raise
+            self._fd = fd
+        self._depth += 1
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            finally:
+                os.close(self._fd)
+                self._fd = None
+        self._rlock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+def lock_for(path):
+    """Devuelve el cerrojo (compartido en el proceso) de la ruta absoluta `path`."""
+    with _registry_lock:
+        lock = _locks.get(path)
+        if lock is None:
+            lock = _locks[path] = FileLock(path)
+        return lock
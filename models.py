@@ -0,0 +1,310 @@
+# Modelo tipado y compacto para servidores y clientes.
+# Server y Client usan __slots__ (sin __dict__ por instancia) y son el único
+# punto donde se normaliza el esquema, que ha ido derivando con el tiempo:
+#   - 'enabled'  -> 'enable'
+#   - 'PresharedKey' (clave del cliente) -> 'presharedKey'
+#   - 'PresharedKey' del servidor ("True"/"False") -> 'generatePresharedKey' (bool)
+#   - 'port' / 'persistentKeepalive' como cadena -> int
+#   - 'address' como lista -> cadena separada por comas (formato de WireGuard)
+#   - 'pools' (subredes adicionales del servidor) igual que 'address'; solo se
+#     escribe si el servidor tiene alguna
+# from_dict() acepta cualquiera de las variantes y to_dict() produce siempre la
+# serialización canónica. normalize_document() aplica lo mismo a un documento
+# completo (wg_data.json con "servers" o el antiguo wg0.json con "server").
+#
+# Un registro leído con from_dict() recuerda qué campos traía: to_dict() solo
+# escribe esos y los que cambiaron respecto al valor por defecto, así que
+# normalizar no añade privateKey "", presharedKey null, etc. a cada registro
+# (ni hace que la primera escritura toque todos los clientes). Los objetos
+# creados con el constructor son registros nuevos y se escriben completos.
+# Un registro sin 'enable' está deshabilitado (ENABLE_DEFAULT), en todas partes.
+# Los valores que se repiten en muchos clientes ('allowedIPs', 'dns') se
+# comparten entre registros en lugar de guardar una copia por cliente.
+
+DEFAULT_ALLOWED_IPS = "0.0.0.0/0, ::/0"
+ENABLE_DEFAULT = False
+SHARED_VALUES_MAX = 1024 # Valores distintos de 'allowedIPs'/'dns' que se comparten
+_shared_values = {}
+
+
+def to_int(value, default=0):
+    """Convierte a int valores como "25" o 25; devuelve `default` si no es posible."""
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, int):
+        return value
+    try:
+        return int(str(value).strip())
+    except (TypeError, ValueError):
+        return default
+
+
+def to_bool(value, default=False):
+    """Convierte a bool valores como True, "True", "true", "1" o "si"."""
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return bool(value)
+    return str(value).strip().lower() in ("true", "1", "s", "si", "sí", "y", "yes")
+
+
+def split_addresses(value):
+    """Lista de direcciones a partir de una cadena "a, b" o de una lista."""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(",")
+    return [str(item).strip() for item in value if item and str(item).strip()]
+
+
+def join_addresses(addresses):
+    return ", ".join(addresses)
+
+
+def _share(value):
+    """Mismo objeto para cadenas iguales de campos que se repiten en muchos clientes."""
+    if not isinstance(value, str):
+        return value
+    if len(_shared_values) < SHARED_VALUES_MAX:
+        return _shared_values.setdefault(value, value)
+    return _shared_values.get(value, value)
+
+
+def _present(data, aliases):
+    """Campos canónicos presentes en `data` (`aliases`: nombre antiguo -> canónico)."""
+    return frozenset(aliases.get(key, key) for key in data)
+
+
+def _pop_first(data, *keys, default=None):
+    """Devuelve el primer valor no None entre `keys` y los quita de `data`."""
+    found = default
+    for key in keys:
+        if key in data:
+            value = data.pop(key)
+            if found is default and value is not None:
+                found = value
+    return found
+
+
+def field_names(aliases):
+    """{nombre canónico: (canónico, nombres antiguos...)} en el orden en que los lee from_dict()."""
+    names = {}
+    for old, canonical in aliases.items():
+        names[canonical] = names.get(canonical, (canonical,)) + (old,)
+    return names
+
+
+def first_value(data, keys, default=None):
+    """Como _pop_first() pero sin modificar `data`."""
+    for key in keys:
+        value = data.get(key)
+        if value is not None:
+            return value
+    return default
+
+
+class Client:
+    """Cliente (peer) de un servidor WireGuard."""
+
+    __slots__ = ("id", "name", "private_key", "public_key", "preshared_key", "persistent_keepalive",
+                 "address", "dns", "allowed_ips", "enable", "created_at", "updated_at", "extra", "present")
+
+    ALIASES = {"PrivateKey": "privateKey", "PublicKey": "publicKey", "PresharedKey": "presharedKey", "enabled": "enable"}
+
+    def __init__(self, id=None, name="", private_key="", public_key="", preshared_key="",
+                 persistent_keepalive=0, address="", dns="", allowed_ips=DEFAULT_ALLOWED_IPS,
+                 enable=ENABLE_DEFAULT, created_at=None, updated_at=None, extra=None, present=None):
+        self.id = id
+        self.name = name
+        self.private_key = private_key
+        self.public_key = public_key
+        self.preshared_key = preshared_key
+        self.persistent_keepalive = persistent_keepalive
+        self.address = address
+        self.dns = dns
+        self.allowed_ips = allowed_ips
+        self.enable = enable
+        self.created_at = created_at
+        self.updated_at = updated_at
+        self.extra = extra
+        self.present = present # Campos que traía el registro leído (None: registro nuevo, se escribe completo)
+
+    @property
+    def addresses(self):
+        return split_addresses(self.address)
+
+    @classmethod
+    def from_dict(cls, client_id, data):
+        data = dict(data or {})
+        present = _present(data, cls.ALIASES)
+        return cls(
+            id=client_id,
+            name=_pop_first(data, "name", default=""),
+            private_key=_pop_first(data, "privateKey", "PrivateKey", default=""),
+            public_key=_pop_first(data, "publicKey", "PublicKey", default=""),
+            preshared_key=_pop_first(data, "presharedKey", "PresharedKey"),
+            persistent_keepalive=to_int(_pop_first(data, "persistentKeepalive", default=0)),
+            address=join_addresses(split_addresses(_pop_first(data, "address"))),
+            dns=_share(_pop_first(data, "dns")),
+            allowed_ips=_share(_pop_first(data, "allowedIPs", default=DEFAULT_ALLOWED_IPS)),
+            enable=to_bool(_pop_first(data, "enable", "enabled"), ENABLE_DEFAULT),
+            created_at=_pop_first(data, "createdAt"),
+            updated_at=_pop_first(data, "updatedAt"),
+            extra=data or None,
+            present=present,
+        )
+
+    def to_dict(self):
+        # (campo, valor, valor que from_dict() da si falta): se omite si faltaba y no cambió.
+        fields = (
+            ("name", self.name, ""),
+            ("privateKey", self.private_key, ""),
+            ("publicKey", self.public_key, ""),
+            ("presharedKey", self.preshared_key, None),
+            ("persistentKeepalive", self.persistent_keepalive, 0),
+            ("address", self.address, ""),
+            ("dns", self.dns, None),
+            ("allowedIPs", self.allowed_ips, DEFAULT_ALLOWED_IPS),
+            ("enable", self.enable, ENABLE_DEFAULT),
+        )
+        present = self.present
+        data = {key: value for key, value, default in fields
+                if present is None or key in present or value != default}
+        if self.created_at is not None:
+            data["createdAt"] = self.created_at
+        if self.updated_at is not None:
+            data["updatedAt"] = self.updated_at
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+
+class Server:
+    """Servidor (interfaz) WireGuard con sus clientes."""
+
+    __slots__ = ("id", "name", "private_key", "public_key", "address", "pools", "port", "dns", "endpoint",
+                 "enable", "persistent_keepalive", "interface", "wg_interface", "generate_psk", "clients", "extra",
+                 "present")
+
+    ALIASES = {"listenPort": "port", "enabled": "enable"}
+
+    def __init__(self, id=None, name="", private_key="", public_key="", address="", pools="", port=51820,
+                 dns="", endpoint="", enable=ENABLE_DEFAULT, persistent_keepalive=None, interface=None,
+                 wg_interface="", generate_psk=None, clients=None, extra=None, present=None):
+        self.id = id
+        self.name = name
+        self.private_key = private_key
+        self.public_key = public_key
+        self.address = address
+        self.pools = pools # Subredes adicionales ("10.0.1.1/24, 10.0.2.1/24"): se usan al llenarse la de 'address'
+        self.port = port
+        self.dns = dns
+        self.endpoint = endpoint
+        self.enable = enable
+        self.persistent_keepalive = persistent_keepalive
+        self.interface = interface # Tarjeta de salida de las reglas PostUp/PostDown
+        self.wg_interface = wg_interface # Interfaz WireGuard en marcha ("wg0"), ver liveapply.py
+        self.generate_psk = generate_psk
+        self.clients = clients if clients is not None else {}
+        self.extra = extra
+        self.present = present # Como en Client
+
+    @property
+    def addresses(self):
+        return split_addresses(self.address)
+
+    @property
+    def pool_addresses(self):
+        return split_addresses(self.pools)
+
+    @property
+    def interface_addresses(self):
+        """Direcciones de la interfaz: las de 'address' seguidas de las de cada pool."""
+        return self.addresses + [item for item in self.pool_addresses if item not in self.addresses]
+
+    @classmethod
+    def from_dict(cls, server_id, data, with_clients=True):
+        data = dict(data or {})
+        present = _present(data, cls.ALIASES)
+        clients = _pop_first(data, "clients", default={}) or {}
+        keepalive = _pop_first(data, "persistentKeepalive")
+        generate_psk = _pop_first(data, "generatePresharedKey", "PresharedKey")
+        return cls(
+            id=server_id,
+            name=_pop_first(data, "name", default=server_id),
+            private_key=_pop_first(data, "privateKey", default=""),
+            public_key=_pop_first(data, "publicKey", default=""),
+            address=join_addresses(split_addresses(_pop_first(data, "address"))),
+            pools=join_addresses(split_addresses(_pop_first(data, "pools"))),
+            port=to_int(_pop_first(data, "port", "listenPort", default=51820), 51820),
+            dns=_pop_first(data, "dns", default=""),
+            endpoint=_pop_first(data, "endpoint", default=""),
+            enable=to_bool(_pop_first(data, "enable", "enabled"), ENABLE_DEFAULT),
+            persistent_keepalive=None if keepalive is None else to_int(keepalive),
+            interface=_pop_first(data, "interface"),
+            wg_interface=_pop_first(data, "wgInterface", default=""),
+            generate_psk=None if generate_psk is None else to_bool(generate_psk),
+            clients={cid: Client.from_dict(cid, c) for cid, c in clients.items()} if with_clients else {},
+            extra=data or None,
+            present=present,
+        )
+
+    def to_dict(self, with_clients=True):
+        # Como en Client.to_dict(); el antiguo wg0.json no tiene nombre (name None).
+        fields = (
+            ("name", self.name, self.id),
+            ("privateKey", self.private_key, ""),
+            ("publicKey", self.public_key, ""),
+            ("address", self.address, ""),
+            ("port", self.port, 51820),
+            ("dns", self.dns, ""),
+            ("enable", self.enable, ENABLE_DEFAULT),
+            ("endpoint", self.endpoint, ""),
+        )
+        present = self.present
+        data = {key: value for key, value, default in fields
+                if (present is None or key in present or value != default) and not (key == "name" and value is None)}
+        if self.pools:
+            data["pools"] = self.pools
+        if self.persistent_keepalive is not None:
+            data["persistentKeepalive"] = self.persistent_keepalive
+        if self.interface is not None:
+            data["interface"] = self.interface
+        if self.wg_interface:
+            data["wgInterface"] = self.wg_interface
+        if self.generate_psk is not None:
+            data["generatePresharedKey"] = self.generate_psk
+        if self.extra:
+            data.update(self.extra)
+        if with_clients:
+            data["clients"] = {cid: client.to_dict() for cid, client in self.clients.items()}
+        return data
+
+
+def normalize_client(data):
+    """Registro de cliente en su forma canónica."""
+    return Client.from_dict(None, data).to_dict()
+
+
+def normalize_server(data):
+    """Registro de servidor (con sus clientes) en su forma canónica."""
+    return Server.from_dict(None, data).to_dict()
+
+
+def normalize_document(doc):
+    """Normaliza en sitio un documento completo y lo devuelve.
+
+    Acepta el formato multi-servidor ({"servers": {...}}) y el antiguo wg0.json
+    ({"server": {...}, "clients": {...}}).
+    """
+    servers = doc.get("servers")
+    if isinstance(servers, dict):
+        for server_id in list(servers):
+            servers[server_id] = normalize_server(servers[server_id])
+    if isinstance(doc.get("server"), dict):
+        doc["server"] = Server.from_dict(None, doc["server"]).to_dict(with_clients=False)
+    if isinstance(doc.get("clients"), dict):
+        doc["clients"] = {cid: normalize_client(c) for cid, c in doc["clients"].items()}
+    return doc
@@ -0,0 +1,426 @@
+import bisect
+import socket
+
+import models
+
+# Comprobación de direcciones: subredes de servidores que se solapan, clientes
+# con la misma dirección (o la del servidor) y clientes fuera de la red de su
+# servidor. Las subredes de un servidor son las de 'address' y las de 'pools'.
+#
+# Los bloques CIDR tienen una propiedad útil: dos bloques o son disjuntos o uno
+# contiene al otro. NetIndex guarda los bloques ordenados por inicio; la
+# comprobación completa es un barrido con una pila de bloques abiertos
+# (O(n log n) por la ordenación, sin comparar por parejas) y la consulta de un
+# bloque nuevo busca sus "ancestros" por prefijo en un diccionario y sus
+# "descendientes" por bisección.
+#
+# Las comprobaciones al guardar usan un índice compartido (index_for) que se
+# actualiza con las operaciones de cada guardado (refresh), en lugar de
+# reconstruirlo con todos los clientes; con fragmentos (shards.LazyServers)
+# solo incluye los servidores ya cargados.
+#
+# CLI: python cli/check_network.py [archivo]
+
+KINDS = ("overlap", "duplicate", "outside", "invalid")
+
+
+class Conflict:
+    """Conflicto de direcciones. `client_id` es None cuando afecta a un servidor."""
+
+    __slots__ = ("kind", "server_id", "client_id", "address", "detail")
+
+    def __init__(self, kind, server_id, client_id, address, detail=""):
+        self.kind = kind
+        self.server_id = server_id
+        self.client_id = client_id
+        self.address = address
+        self.detail = detail
+
+    def __repr__(self):
+        return f"Conflict({self.kind!r}, {self.server_id!r}, {self.client_id!r}, {self.address!r})"
+
+
+def _owner_text(owner):
+    server_id, client_id = owner
+    return f"servidor {server_id}" if client_id is None else f"cliente {client_id} (servidor {server_id})"
+
+
+def _parse(item):
+    """(versión, inicio, fin, prefijo, ip) del bloque CIDR `item` usando inet_pton (sin ipaddress).
+
+    Los bits de host se ignoran (10.0.0.1/24 -> 10.0.0.0/24), como
+    ipaddress.ip_network(strict=False). Lanza ValueError si no es válido.
+    """
+    host, _, prefix = str(item).strip().partition("/")
+    for version, family, bits in ((4, socket.AF_INET, 32), (6, socket.AF_INET6, 128)):
+        try:
+            ip = int.from_bytes(socket.inet_pton(family, host), "big")
+        except OSError:
+            continue
+        prefixlen = int(prefix) if prefix.isdigit() else (bits if not prefix else -1)
+        if not 0 <= prefixlen <= bits:
+            break
+        size = 1 << (bits - prefixlen)
+        start = ip & ~(size - 1)
+        return version, start, start + size - 1, prefixlen, ip
+    raise ValueError(f"Dirección inválida: {item!r}")
+
+
+class _Block:
+    __slots__ = ("version", "start", "end", "prefixlen", "address", "owner")
+
+    def __init__(self, version, start, end, prefixlen, address, owner):
+        self.version = version
+        self.start = start
+        self.end = end
+        self.prefixlen = prefixlen
+        self.address = address
+        self.owner = owner # (id_servidor, id_cliente o None)
+
+    @classmethod
+    def parse(cls, item, owner):
+        version, start, end, prefixlen, _ = _parse(item)
+        return cls(version, start, end, prefixlen, item, owner)
+
+    @property
+    def key(self):
+        return (self.version, self.start, -self.end)
+
+
+def _sweep(blocks, same_group):
+    """Pares (bloque, bloque que lo contiene o lo solapa) de una lista de bloques CIDR.
+
+    `same_group(a, b)` indica pares que no cuentan como conflicto (p. ej. dos
+    direcciones del mismo cliente).
+    """
+    pairs = []
+    stack = []
+    for block in sorted(blocks, key=lambda b: b.key):
+        while stack and (stack[-1].version != block.version or stack[-1].end < block.start):
+            stack.pop()
+        for opened in reversed(stack):
+            if not same_group(opened, block):
+                pairs.append((block, opened))
+                break
+        stack.append(block)
+    return pairs
+
+
+class NetIndex:
+    """Índice de subredes de servidores y direcciones de clientes de un documento.
+
+    Se puede construir vacío e ir añadiendo servidores (prepare) y mantenerlo al
+    día con las operaciones que se guardan (refresh), sin reconstruirlo.
+    """
+
+    def __init__(self, data=None):
+        self.clear()
+        if data is not None:
+            for server_id, server in _iter_servers(data):
+                self.add_server(server_id, server)
+
+    def clear(self):
+        self._server_blocks = {} # id_servidor -> bloques de sus subredes
+        self._networks = {} # id_servidor -> [redes]
+        self._clients = {} # id_servidor -> ids de cliente indexados
+        self._owned = {} # (id_servidor, id_cliente o None) -> bloques de host
+        self._invalid = {} # (id_servidor, id_cliente o None) -> [Conflict]
+        self._sorted = [] # Bloques de host ordenados por (versión, inicio)
+        self._keys = []
+        self._exact = {} # (versión, inicio, prefijo) -> bloques
+        self._prefix_count = {}
+        self._prefixes = []
+        self._bulk = None # Durante add_server: bloques pendientes de ordenar
+
+    @property
+    def servers(self):
+        return [block for blocks in self._server_blocks.values() for block in blocks]
+
+    @property
+    def hosts(self):
+        """Direcciones de clientes y la IP propia de cada servidor."""
+        return [block for blocks in self._owned.values() for block in blocks]
+
+    @property
+    def invalid(self):
+        return [conflict for conflicts in self._invalid.values() for conflict in conflicts]
+
+    def add_server(self, server_id, server):
+        """Indexa (o vuelve a indexar) un servidor con sus clientes."""
+        self.remove_server(server_id)
+        self._set_server_blocks(server_id, server)
+        self._clients[server_id] = set()
+        self._bulk = [] # Los bloques de todos los clientes se ordenan juntos al final
+        try:
+            for client_id, client in (server.get("clients") or {}).items():
+                self.set_client(server_id, client_id, client.get("address"))
+        finally:
+            blocks, self._bulk = self._bulk, None
+            if blocks:
+                self._sorted.extend(blocks)
+                self._sorted.sort(key=lambda b: (b.version, b.start))
+                self._keys = [(b.version, b.start) for b in self._sorted]
+
+    def remove_server(self, server_id):
+        for client_id in self._clients.pop(server_id, ()):
+            self._remove_owner((server_id, client_id))
+        self._remove_owner((server_id, None))
+        self._server_blocks.pop(server_id, None)
+        self._networks.pop(server_id, None)
+
+    def _set_server_blocks(self, server_id, server):
+        self._remove_owner((server_id, None))
+        networks = []
+        blocks = []
+        for item in _server_addresses(server.get("address"), server.get("pools")):
+            try:
+                version, start, end, prefixlen, ip = _parse(item)
+            except ValueError:
+                self._invalid.setdefault((server_id, None), []).append(
+                    Conflict("invalid", server_id, None, item, "dirección de servidor inválida"))
+                continue
+            networks.append((version, start, end))
+            blocks.append(_Block(version, start, end, prefixlen, item, (server_id, None)))
+            host = item.split("/")[0].strip()
+            self._add_host(_Block(version, ip, ip, 32 if version == 4 else 128, host, (server_id, None)))
+        self._networks[server_id] = networks
+        self._server_blocks[server_id] = blocks
+
+    def set_client(self, server_id, client_id, address):
+        """Indexa la dirección actual de un cliente (sustituye a la anterior)."""
+        owner = (server_id, client_id)
+        self._remove_owner(owner)
+        self._clients.setdefault(server_id, set()).add(client_id)
+        for item in models.split_addresses(address):
+            try:
+                self._add_host(_Block.parse(item, owner))
+            except ValueError:
+                self._invalid.setdefault(owner, []).append(
+                    Conflict("invalid", server_id, client_id, item, "dirección de cliente inválida"))
+
+    def remove_client(self, server_id, client_id):
+        self._remove_owner((server_id, client_id))
+        self._clients.get(server_id, set()).discard(client_id)
+
+    def _add_host(self, block):
+        self._owned.setdefault(block.owner, []).append(block)
+        if self._bulk is not None:
+            self._bulk.append(block)
+        else:
+            position = bisect.bisect_right(self._keys, (block.version, block.start))
+            self._keys.insert(position, (block.version, block.start))
+            self._sorted.insert(position, block)
+        self._exact.setdefault((block.version, block.start, block.prefixlen), []).append(block)
+        prefix = (block.version, block.prefixlen)
+        self._prefix_count[prefix] = self._prefix_count.get(prefix, 0) + 1
+        if self._prefix_count[prefix] == 1:
+            bisect.insort(self._prefixes, prefix)
+
+    def _remove_owner(self, owner):
+        self._invalid.pop(owner, None)
+        for block in self._owned.pop(owner, ()):
+            low = bisect.bisect_left(self._keys, (block.version, block.start))
+            high = bisect.bisect_right(self._keys, (block.version, block.start))
+            for position in range(low, high):
+                if self._sorted[position] is block:
+                    del self._sorted[position]
+                    del self._keys[position]
+                    break
+            exact_key = (block.version, block.start, block.prefixlen)
+            same = [other for other in self._exact.get(exact_key, ()) if other is not block]
+            if same:
+                self._exact[exact_key] = same
+            else:
+                self._exact.pop(exact_key, None)
+            prefix = (block.version, block.prefixlen)
+            self._prefix_count[prefix] -= 1
+            if not self._prefix_count[prefix]:
+                del self._prefix_count[prefix]
+                self._prefixes.remove(prefix)
+
+    def prepare(self, data, server_id=None, all_servers=False):
+        """Indexa los servidores de `data` que hacen falta para comprobar `server_id`.
+
+        Con un documento normal (o all_servers=True, para comprobar subredes de
+        servidores) se indexan todos, una sola vez. Con shards.LazyServers solo
+        los fragmentos ya cargados y el de `server_id`, para no leer el resto.
+        """
+        servers = data.get("servers")
+        if hasattr(servers, "items"):
+            lazy = hasattr(servers, "is_loaded") and not all_servers
+            for sid in servers:
+                if sid not in self._networks and (not lazy or sid == server_id or servers.is_loaded(sid)):
+                    self.add_server(sid, servers[sid])
+        if isinstance(data.get("server"), dict) and None not in self._networks:
+            self.add_server(None, _legacy_server(data))
+        return self
+
+    def refresh(self, data, ops):
+        """Aplica al índice las operaciones ya aplicadas a `data` (solo en servidores indexados)."""
+        for op in ops:
+            path = list(op[1])
+            if not path or path == ["servers"]:
+                self.clear() # Se sustituyó el documento o la sección completa
+                continue
+            if path[0] == "servers":
+                server_id, rest = path[1], path[2:]
+            elif path[0] == "server": # Antiguo wg0.json
+                server_id, rest = None, path[1:]
+            elif path[0] == "clients":
+                server_id, rest = None, path
+            else:
+                continue # 'version' y otras claves raíz
+            if server_id not in self._networks:
+                continue
+            server = _server_of(data, server_id)
+            if server is None:
+                self.remove_server(server_id)
+            elif not rest or rest == ["clients"]:
+                self.add_server(server_id, server)
+            elif rest[0] in ("address", "pools") and len(rest) == 1:
+                self._set_server_blocks(server_id, server)
+            elif rest[0] == "clients" and (len(rest) == 2 or rest[2] == "address"):
+                client = (server.get("clients") or {}).get(rest[1])
+                if client is None:
+                    self.remove_client(server_id, rest[1])
+                else:
+                    self.set_client(server_id, rest[1], client.get("address"))
+        return self
+
+    def _outside(self, block):
+        return not any(version == block.version and start <= block.start and block.end <= end
+                       for version, start, end in self._networks.get(block.owner[0], ()))
+
+    def conflicts(self):
+        """Todos los conflictos del documento."""
+        found = list(self.invalid)
+        for block, other in _sweep(self.servers, lambda a, b: a.owner == b.owner):
+            found.append(Conflict("overlap", block.owner[0], None, block.address,
+                                  f"se solapa con {other.address} del {_owner_text(other.owner)}"))
+        for block, other in _sweep(self.hosts, lambda a, b: a.owner == b.owner):
+            found.append(Conflict("duplicate", block.owner[0], block.owner[1], block.address,
+                                  f"coincide con {other.address} del {_owner_text(other.owner)}"))
+        for block in self.hosts:
+            if block.owner[1] is not None and self._outside(block):
+                found.append(Conflict("outside", block.owner[0], block.owner[1], block.address,
+                                      "fuera de la red del servidor"))
+        return found
+
+    def _overlapping(self, block):
+        """Bloques de `hosts` que contienen a `block` o están contenidos en él."""
+        found = []
+        for version, prefixlen in self._prefixes:
+            if version != block.version or prefixlen > block.prefixlen:
+                continue
+            bits = 32 if version == 4 else 128
+            start = block.start >> (bits - prefixlen) << (bits - prefixlen)
+            found.extend(self._exact.get((version, start, prefixlen), ()))
+        low = bisect.bisect_left(self._keys, (block.version, block.start))
+        high = bisect.bisect_right(self._keys, (block.version, block.end))
+        found.extend(b for b in self._sorted[low:high] if b.prefixlen > block.prefixlen)
+        return found
+
+    def check_client(self, server_id, client_id, address):
+        """Conflictos de asignar `address` al cliente `client_id`, sin recorrer todo el índice."""
+        found = []
+        for item in models.split_addresses(address):
+            try:
+                block = _Block.parse(item, (server_id, client_id))
+            except ValueError:
+                found.append(Conflict("invalid", server_id, client_id, item, "dirección de cliente inválida"))
+                continue
+            for other in self._overlapping(block):
+                if other.owner != block.owner:
+                    found.append(Conflict("duplicate", server_id, client_id, item,
+                                          f"coincide con {other.address} del {_owner_text(other.owner)}"))
+            if self._outside(block):
+                found.append(Conflict("outside", server_id, client_id, item, "fuera de la red del servidor"))
+        return found
+
+    def check_server(self, server_id, address, pools=None):
+        """Conflictos de usar `address` (y las subredes `pools`) en el servidor `server_id`."""
+        found = []
+        blocks = []
+        for item in _server_addresses(address, pools):
+            try:
+                block = _Block.parse(item, (server_id, None))
+            except ValueError:
+                found.append(Conflict("invalid", server_id, None, item, "dirección de servidor inválida"))
+                continue
+            for other in self.servers + blocks:
+                if other.owner[0] != server_id and other.version == block.version \
+                        and other.start <= block.end and block.start <= other.end:
+                    found.append(Conflict("overlap", server_id, None, item,
+                                          f"se solapa con {other.address} del {_owner_text(other.owner)}"))
+                elif other in blocks and other.version == block.version \
+                        and other.start <= block.end and block.start <= other.end:
+                    found.append(Conflict("overlap", server_id, None, item,
+                                          f"se solapa con {other.address} del mismo servidor"))
+            blocks.append(block)
+        return found
+
+
+def _server_addresses(address, pools=None):
+    """Direcciones de 'address' seguidas de las de 'pools' (sin repetir)."""
+    items = models.split_addresses(address)
+    return items + [item for item in models.split_addresses(pools) if item not in items]
+
+
+def _legacy_server(data):
+    return {**data["server"], "clients": data.get("clients") or {}}
+
+
+def _server_of(data, server_id):
+    if server_id is None:
+        return _legacy_server(data) if isinstance(data.get("server"), dict) else None
+    servers = data.get("servers") or {}
+    return servers[server_id] if server_id in servers else None
+
+
+def _iter_servers(data):
+    servers = data.get("servers")
+    if hasattr(servers, "items"): # dict o shards.LazyServers
+        for server_id in servers:
+            yield server_id, servers[server_id]
+    if isinstance(data.get("server"), dict): # Antiguo wg0.json
+        yield None, _legacy_server(data)
+
+
+def check(data):
+    """Comprobación completa de `data`: lista de Conflict."""
+    return NetIndex(data).conflicts()
+
+
+_shared = None # (documento, NetIndex) del índice compartido
+
+
+def index_for(data, server_id=None, all_servers=False):
+    """NetIndex compartido de `data`, preparado para comprobar `server_id` (ver NetIndex.prepare).
+
+    Se construye la primera vez y después se actualiza con refresh(data, ops)
+    en cada guardado; si `data` es otro documento se empieza de nuevo.
+    """
+    global _shared
+    if _shared is None or _shared[0] is not data:
+        _shared = (data, NetIndex())
+    return _shared[1].prepare(data, server_id, all_servers)
+
+
+def refresh(data, ops):
+    """Anota en el índice compartido las operaciones ya aplicadas a `data`."""
+    if _shared is not None and _shared[0] is data:
+        _shared[1].refresh(data, ops)
+
+
+def reset():
+    """Olvida el índice compartido (p. ej. tras fusionar cambios de otro proceso)."""
+    global _shared
+    _shared = None
+
+
+def summary(conflicts):
+    """{tipo: número de conflictos} para todos los tipos."""
+    counts = dict.fromkeys(KINDS, 0)
+    for conflict in conflicts:
+        counts[conflict.kind] += 1
+    return counts
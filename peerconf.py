@@ -0,0 +1,238 @@
+import hashlib
+import json
+import os
+
+import models
+import store
+
+# Generación incremental de los bloques [Peer] del .conf del servidor.
+# La caché (<archivo>.peers.json, junto al .conf) guarda solo un resumen
+# (blake2b) por cliente de los campos que aparecen en su bloque, nunca el texto
+# ni las claves. Al regenerar, el texto de los peers cuyo resumen no cambió se
+# copia del .conf anterior (se localiza por su línea "# Client UUID:") y solo
+# se vuelven a generar los que cambiaron: tras editar un cliente de un servidor
+# con 20k peers se reconstruye un bloque. La caché recuerda el tamaño y la fecha
+# del .conf que describe; si el .conf se tocó a mano se descarta entera.
+#
+# Los avisos (cliente sin publicKey o sin address) se guardan en la caché y se
+# devuelven agrupados en lugar de imprimirse uno por peer.
+#
+# iter_blocks() entrega los bloques de uno en uno para escribirlos en streaming
+# (ver cli/wg_conf.write_wg_config); ni con caché se guarda el texto en memoria.
+
+CACHE_SUFFIX = ".peers.json"
+CACHE_FORMAT = 2
+WARNINGS = {
+    "no_public_key": "sin 'publicKey'",
+    "no_address": "sin 'address' para AllowedIPs",
+}
+
+
+def _digest(client_id, client):
+    """Resumen de los campos de `client` que intervienen en su bloque [Peer]."""
+    fields = (
+        client_id,
+        client.get("name"),
+        client.get("publicKey"),
+        client.get("presharedKey", client.get("PresharedKey")),
+        client.get("address"),
+        client.get("enable", client.get("enabled")),
+    )
+    return hashlib.blake2b(repr(fields).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def render_block(client_id, client_data):
+    """(texto del bloque [Peer] o None si el cliente está deshabilitado, avisos)."""
+    # models.Client acepta tanto 'enable' como el antiguo 'enabled', y 'presharedKey'/'PresharedKey'.
+    client = models.Client.from_dict(client_id, client_data)
+    if not client.enable: # Solo se añaden clientes habilitados
+        return None, []
+    warnings = []
+    lines = ["[Peer]", f"# Client Name: {client.name or 'N/A'}", f"# Client UUID: {client_id}"]
+    if client.public_key:
+        lines.append(f"PublicKey = {client.public_key}")
+    else:
+        lines.append("# PublicKey = <CLAVE_PUBLICA_DEL_CLIENTE_FALTA>")
+        warnings.append("no_public_key")
+    if client.preshared_key: # Se añade la PresharedKey solo si existe y tiene un valor.
+        lines.append(f"PresharedKey = {client.preshared_key}")
+    # AllowedIPs para la configuración del servidor son las IPs WireGuard del cliente
+    if client.address:
+        lines.append(f"AllowedIPs = {client.address}")
+    else:
+        lines.append("# AllowedIPs = <IP_WIREGUARD_DEL_CLIENTE_FALTA>")
+        warnings.append("no_address")
+    return "\n".join(lines), warnings
+
+
+class PeerCache:
+    """Resumen de los campos de cada cliente y posición de su bloque en el .conf anterior.
+
+    `source` es el .conf que describe la caché; de él se copian los bloques que
+    no cambiaron. Sin `source` todos los bloques se generan de nuevo.
+    """
+
+    def __init__(self, source=None):
+        self.digests = {} # id de cliente -> resumen
+        self.disabled = set() # ids de clientes deshabilitados (sin bloque)
+        self.warnings = {} # id de cliente -> avisos, solo los que tienen alguno
+        self.source = source
+        self._offsets = None # id de cliente -> (inicio, longitud) en `source`
+        self._file = None
+        self.reused = 0
+        self.rebuilt = 0
+
+    def render(self, client_id, client):
+        """(texto o None, avisos) del bloque de `client`, regenerándolo solo si cambió."""
+        digest = _digest(client_id, client)
+        if self.digests.get(client_id) == digest:
+            if client_id in self.disabled:
+                self.reused += 1
+                return None, []
+            text = self._previous(client_id)
+            if text is not None:
+                self.reused += 1
+                return text, self.warnings.get(client_id, [])
+        text, warnings = render_block(client_id, client)
+        self.digests[client_id] = digest
+        if text is None:
+            self.disabled.add(client_id)
+        else:
+            self.disabled.discard(client_id)
+        if warnings:
+            self.warnings[client_id] = warnings
+        else:
+            self.warnings.pop(client_id, None)
+        self.rebuilt += 1
+        return text, warnings
+
+    def _previous(self, client_id):
+        """Texto del bloque de `client_id` en el .conf anterior, o None si no está."""
+        if self.source is None:
+            return None
+        try:
+            if self._offsets is None:
+                self._offsets = _index_blocks(self.source)
+                self._file = open(self.source, "rb")
+            position = self._offsets.get(client_id)
+            if position is None:
+                return None
+            self._file.seek(position[0])
+            return self._file.read(position[1]).decode("utf-8").replace("\r\n", "\n")
+        except (OSError, UnicodeDecodeError):
+            self.close()
+            self.source = None
+            return None
+
+    def close(self):
+        """Cierra el .conf anterior. Se llama al terminar de generar los bloques."""
+        if self._file is not None:
+            self._file.close()
+        self._file = None
+        self._offsets = None
+
+    def prune(self, clients):
+        """Descarta los resúmenes de clientes que ya no existen."""
+        if len(self.digests) > len(clients):
+            for client_id in [cid for cid in self.digests if cid not in clients]:
+                del self.digests[client_id]
+                self.disabled.discard(client_id)
+                self.warnings.pop(client_id, None)
+
+    def stats(self):
+        return {"reused": self.reused, "rebuilt": self.rebuilt, "cached": len(self.digests)}
+
+
+UUID_PREFIX = b"# Client UUID: "
+
+
+def _index_blocks(conf_path):
+    """{id de cliente: (inicio, longitud)} de los bloques [Peer] de `conf_path`.
+
+    Un bloque va de su línea "[Peer]" a la línea en blanco que lo cierra (o al
+    final del archivo), sin el salto de línea final, igual que render_block().
+    """
+    offsets = {}
+    start = client_id = None
+    offset = 0
+    end = 0 # Fin de la última línea no vacía del bloque, sin el salto de línea
+    with open(conf_path, "rb") as f:
+        for line in f:
+            if line.startswith(b"[Peer]"):
+                start, client_id = offset, None
+            elif start is not None and not line.strip():
+                if client_id is not None:
+                    offsets[client_id] = (start, end - start)
+                start = None
+            elif start is not None and client_id is None and line.startswith(UUID_PREFIX):
+                client_id = line[len(UUID_PREFIX):].rstrip(b"\r\n").decode("utf-8")
+            end = offset + len(line.rstrip(b"\r\n"))
+            offset += len(line)
+    if start is not None and client_id is not None:
+        offsets[client_id] = (start, end - start)
+    return offsets
+
+
+def iter_blocks(clients, warnings, cache=None):
+    """Bloques [Peer] de los clientes habilitados, en orden, de uno en uno.
+
+    Los avisos se acumulan en `warnings` ({aviso: [nombre o id]}). Ningún
+    bloque se guarda en memoria, con o sin `cache`.
+    """
+    try:
+        for client_id, client in clients.items():
+            if cache is not None:
+                text, found = cache.render(client_id, client)
+            else:
+                text, found = render_block(client_id, client)
+            for kind in found:
+                warnings.setdefault(kind, []).append(client.get("name") or client_id)
+            if text is not None:
+                yield text
+    finally:
+        if cache is not None:
+            cache.close()
+    if cache is not None:
+        cache.prune(clients)
+
+
+def cache_path(conf_path):
+    return os.path.abspath(conf_path) + CACHE_SUFFIX
+
+
+def _conf_signature(conf_path):
+    st = os.stat(conf_path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def load_cache(conf_path):
+    """Caché guardada junto a `conf_path`, o una vacía si no existe, no es válida o el .conf cambió."""
+    cache = PeerCache()
+    try:
+        with open(cache_path(conf_path), encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("format") == CACHE_FORMAT and data.get("conf") == _conf_signature(conf_path):
+            cache.digests = dict(data["digests"])
+            cache.disabled = set(data.get("disabled", ()))
+            cache.warnings = dict(data.get("warnings", {}))
+            cache.source = conf_path
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        pass
+    return cache
+
+
+def save_cache(conf_path, cache):
+    """Guarda la caché del `conf_path` recién escrito, con permisos 0600.
+
+    Solo contiene resúmenes, pero se protege igual que el .conf.
+    """
+    data = {
+        "format": CACHE_FORMAT,
+        "conf": _conf_signature(conf_path),
+        "digests": cache.digests,
+        "disabled": sorted(cache.disabled),
+        "warnings": cache.warnings,
+    }
+    path = cache_path(conf_path)
+    store._atomic_write(path, json.dumps(data, separators=(",", ":")))
+    os.chmod(path, 0o600)
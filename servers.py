@@ -12,7 +12,9 @@ from textual.widgets import Button, Label, Input, Static, Select
 #import uuid
 import json
 
-import works
+import liveapply
+import models
+import netcheck
 # DNS públicas más conocidas y seguras
 dns_servers = [
     "1.1.1.1",       # Cloudflare DNS (rápido y privado)
@@ -67,6 +69,12 @@ class Add_edit_server(ModalScreen):
                 Input(id="name", classes="input_edit_client"),
                 Label("address:", classes="label_edit_client"),
                 Input(id="input_address", classes="input_edit_client")),
+            Horizontal(
+                Label("pools:", classes="label_edit_client"),
+                Input(id="input_pools", classes="input_edit_client", placeholder="10.0.1.1/24, 10.0.2.1/24 (se usan al llenarse address)")),
+            Horizontal(
+                Label("interfaz wg:", classes="label_edit_client"),
+                Input(id="input_wg_interface", classes="input_edit_client", placeholder="wg0 (interfaz en marcha, para WG_LIVE_APPLY)")),
           
             Horizontal(
                 Label("endpoint:", classes="label_edit_client"),
@@ -95,22 +103,26 @@ class Add_edit_server(ModalScreen):
     async def load_client_server(self):
         if self.new_server == False:
             """Carga los datos del server."""
-            valor = self.previous_screen.wg_data.get("servers", {}).get(self.id_server, {})
-            self.query_one("#name", Input).value = valor.get("name", "") or ""
-            self.query_one("#input_address", Input).value = valor.get("address", "") or ""
-            self.query_one("#input_private_key", Input).value = valor.get("privateKey", "") or ""
-            self.query_one("#input_public_key", Input).value = valor.get("publicKey", "") or ""
-            self.query_one("#input_dns", Input).value = valor.get("dns", "") or ""
-            self.query_one("#select_enabled", Select).value = valor.get("enabled", False)
+            server = models.Server.from_dict(self.id_server, self.previous_screen.wg_data.get("servers", {}).get(self.id_server, {}), with_clients=False)
+            self.query_one("#name", Input).value = server.name or ""
+            self.query_one("#input_address", Input).value = server.address
+            self.query_one("#input_pools", Input).value = server.pools
+            self.query_one("#input_wg_interface", Input).value = server.wg_interface or ""
+            self.query_one("#input_private_key", Input).value = server.private_key or ""
+            self.query_one("#input_public_key", Input).value = server.public_key or ""
+            self.query_one("#input_dns", Input).value = server.dns or ""
+            self.query_one("#endpoint", Input).value = server.endpoint or ""
+            self.query_one("#port", Input).value = str(server.port)
+            self.query_one("#select_enabled", Select).value = server.enable
         else:
-            priv_key, pub_key = works.generate_keys()
+            priv_key, pub_key = self.app.key_pool.take_keypair()
             self.query_one("#input_private_key", Input).value = priv_key
             self.query_one("#input_public_key", Input).value = pub_key
 
         
     @on(Button.Pressed, "#btn_gen_key")
     def btn_gen_key(self, event: Button.Pressed) -> None:
-        priv_key, pub_key = works.generate_keys()
+        priv_key, pub_key = self.app.key_pool.take_keypair()
         self.query_one("#input_private_key", Input).value = priv_key
         self.query_one("#input_public_key", Input).value = pub_key
  
@@ -140,6 +152,25 @@ class Add_edit_server(ModalScreen):
         if self.query_one("#input_address", Input).value == "" or self.query_one("#port",Input).value == "" or self.query_one("#endpoint", Input).value == "" or self.query_one("#input_private_key", Input).value == "" or self.query_one("#input_public_key", Input).value == "":
             self.notify("Los siguientes camposs no pueden quedar vacios: \n - privateKey\n - publicKey\n - address\n - port\n - dns\n - endpoint",severity="warning")
             return
+        # Validación rápida: la subred no puede solaparse con la de otro servidor.
+        address = models.join_addresses(models.split_addresses(self.query_one("#input_address", Input).value))
+        pools = models.join_addresses(models.split_addresses(self.query_one("#input_pools", Input).value))
+        conflicts = netcheck.index_for(self.previous_screen.wg_data, all_servers=True).check_server(self.id_server, address, pools)
+        if conflicts:
+            self.notify("\n".join(f"{c.address}: {c.detail}" for c in conflicts),
+                        title="Conflicto de direcciones", severity="error")
+            return
+        wg_interface = self.query_one("#input_wg_interface", Input).value.strip()
+        if wg_interface:
+            if not liveapply.valid_interface(wg_interface):
+                self.notify(f"'{wg_interface}' no es un nombre de interfaz válido (hasta 15 letras, números o _=+.-).", severity="error")
+                return
+            servers = self.previous_screen.wg_data.get("servers", {})
+            others = [servers[sid].get("name", sid) for sid in servers
+                      if sid != self.id_server and liveapply.interface_name(servers[sid]) == wg_interface]
+            if others:
+                self.notify(f"La interfaz '{wg_interface}' ya la usa: {', '.join(others)}.", severity="error")
+                return
         if self.save_data():
             await self.previous_screen.refresh_server_select()
             self.notify(f"Se guardo correctamente la configutacion de {self.query_one("#name", Input).value}",severity="information",title="Guardado")
@@ -149,20 +180,29 @@ class Add_edit_server(ModalScreen):
         
     def save_data(self):
         try:
-            server_new={
-                "name":self.query_one("#name", Input).value,
-                "privateKey":self.query_one("#input_private_key", Input).value,
-                "publicKey":self.query_one("#input_public_key", Input).value,
-                "address":self.query_one("#input_address", Input).value,
-                "port": self.query_one("#port",Input).value,
-                "dns":self.query_one("#input_dns", Input).value ,
-                "endpoint":self.query_one("#endpoint", Input).value,
-                "enable":self.query_one("#select_enabled", Select).value
-                }
-            self.previous_screen.wg_data["servers"][self.id_server] = server_new
-        
-            with open("wg_data.json", 'w', encoding='utf-8') as f:
-                json.dump(self.previous_screen.wg_data, f, indent=2, ensure_ascii=False)
+            server_new = models.Server(
+                id=self.id_server,
+                name=self.query_one("#name", Input).value,
+                private_key=self.query_one("#input_private_key", Input).value,
+                public_key=self.query_one("#input_public_key", Input).value,
+                address=models.join_addresses(models.split_addresses(self.query_one("#input_address", Input).value)),
+                pools=models.join_addresses(models.split_addresses(self.query_one("#input_pools", Input).value)),
+                wg_interface=self.query_one("#input_wg_interface", Input).value.strip(),
+                port=models.to_int(self.query_one("#port", Input).value, 51820),
+                dns=self.query_one("#input_dns", Input).value,
+                endpoint=self.query_one("#endpoint", Input).value,
+                enable=self.query_one("#select_enabled", Select).value,
+                ).to_dict(with_clients=False)
+            if self.id_server in self.previous_screen.wg_data["servers"]:
+                # Actualizar campo a campo para no perder la sección 'clients' del servidor.
+                ops = [("set", ["servers", self.id_server, key], value) for key, value in server_new.items()]
+                if "pools" not in server_new and "pools" in self.previous_screen.wg_data["servers"][self.id_server]:
+                    ops.append(("del", ["servers", self.id_server, "pools"])) # Se quitaron todos los pools
+                if "wgInterface" not in server_new and "wgInterface" in self.previous_screen.wg_data["servers"][self.id_server]:
+                    ops.append(("del", ["servers", self.id_server, "wgInterface"]))
+            else:
+                ops = [("set", ["servers", self.id_server], {**server_new, "clients": {}})]
+            self.previous_screen.persist(ops)
             return True # Indicar éxito
         except Exception as e:
             return False
@@ -0,0 +1,255 @@
+import json
+import os
+import re
+import sys
+from collections.abc import MutableMapping
+
+# Disposición por fragmentos para el almacén (store.py).
+# En lugar de un único wg_data.json, un directorio (p. ej. wg_data.d/) contiene:
+#   manifest.json        -> {"servers": [{"id", "name", "file"}, ...], ...resto de claves raíz}
+#   servers/<file>.json  -> un servidor completo (claves + clientes)
+#   version              -> versión del documento (un entero, ver store.py)
+# Editar un servidor solo reescribe su fragmento y el archivo de versión; el
+# manifiesto solo se reescribe al crear, renombrar o eliminar servidores. Las
+# vistas que solo necesitan la lista de servidores leen únicamente el manifiesto.
+
+MANIFEST = "manifest.json"
+SERVERS_DIR = "servers"
+VERSION = "version"
+
+
+def is_sharded_path(path):
+    """Indica si `path` es un directorio de fragmentos (o debe crearse como tal)."""
+    return os.path.isdir(path) or str(path).endswith(".d")
+
+
+def manifest_path(path):
+    return os.path.join(path, MANIFEST)
+
+
+def version_path(path):
+    return os.path.join(path, VERSION)
+
+
+def read_version(path):
+    """Versión del documento; los directorios antiguos la guardaban en el manifiesto."""
+    try:
+        with open(version_path(path), "r", encoding="utf-8") as f:
+            return int(f.read().strip() or 0)
+    except FileNotFoundError:
+        return read_manifest(path).get("version", 0)
+
+
+def _write_version(path, value, atomic_write):
+    atomic_write(version_path(path), str(value))
+
+
+def _write_json(target, data, atomic_write):
+    atomic_write(target, json.dumps(data, indent=2, ensure_ascii=False))
+
+
+def _read_json(target):
+    with open(target, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def read_manifest(path):
+    """Lee el manifiesto. Devuelve {"servers": [...], ...} (vacío si no existe el directorio)."""
+    try:
+        manifest = _read_json(manifest_path(path))
+    except FileNotFoundError:
+        manifest = {}
+    manifest.setdefault("servers", [])
+    return manifest
+
+
+def signature(path):
+    """Firma del directorio: manifiesto + cada fragmento (solo stat, sin leer contenido)."""
+    st = os.stat(manifest_path(path))
+    sig = [(MANIFEST, st.st_mtime_ns, st.st_size, st.st_ino)]
+    try:
+        st = os.stat(version_path(path))
+        sig.append((VERSION, st.st_mtime_ns, st.st_size, st.st_ino))
+    except FileNotFoundError:
+        pass
+    shard_dir = os.path.join(path, SERVERS_DIR)
+    if os.path.isdir(shard_dir):
+        for name in sorted(os.listdir(shard_dir)):
+            st = os.stat(os.path.join(shard_dir, name))
+            sig.append((name, st.st_mtime_ns, st.st_size, st.st_ino))
+    return tuple(sig)
+
+
+def _shard_file(server_id, taken):
+    base = re.sub(r"[^A-Za-z0-9_.-]", "_", str(server_id)) or "server"
+    name, n = base + ".json", 1
+    while name in taken:
+        n += 1
+        name = f"{base}_{n}.json"
+    return name
+
+
+class LazyServers(MutableMapping):
+    """Mapeo id -> servidor que lee cada fragmento solo la primera vez que se accede."""
+
+    def __init__(self, path, entries):
+        self.path = path
+        self.entries = {e["id"]: e for e in entries}
+        self._loaded = {}
+        self.transform = None # Opcional: se aplica a cada fragmento al leerlo
+
+    def names(self):
+        """Lista [(nombre, id)] sacada del manifiesto, sin cargar fragmentos."""
+        return [(self.name_of(sid), sid) for sid in self.entries]
+
+    def is_loaded(self, server_id):
+        return server_id in self._loaded
+
+    def __getitem__(self, server_id):
+        if server_id not in self.entries:
+            raise KeyError(server_id)
+        server = self._loaded.get(server_id)
+        if server is None:
+            server = _read_json(os.path.join(self.path, SERVERS_DIR, self.entries[server_id]["file"]))
+            if self.transform is not None:
+                server = self.transform(server)
+            self._loaded[server_id] = server
+        return server
+
+    def __setitem__(self, server_id, server):
+        if server_id not in self.entries:
+            taken = {e["file"] for e in self.entries.values()}
+            self.entries[server_id] = {"id": server_id, "file": _shard_file(server_id, taken)}
+        self.entries[server_id]["name"] = server.get("name", server_id)
+        self._loaded[server_id] = server
+
+    def __delitem__(self, server_id):
+        del self.entries[server_id]
+        self._loaded.pop(server_id, None)
+
+    def pop(self, server_id, *default):
+        # Borrar un servidor no necesita leer su fragmento.
+        if server_id not in self.entries:
+            if default:
+                return default[0]
+            raise KeyError(server_id)
+        server = self._loaded.get(server_id)
+        del self[server_id]
+        return server
+
+    def name_of(self, server_id):
+        server = self._loaded.get(server_id)
+        if server is not None:
+            return server.get("name", server_id)
+        return self.entries[server_id].get("name", server_id)
+
+    def __iter__(self):
+        return iter(list(self.entries))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, server_id):
+        return server_id in self.entries
+
+
+def read_server(path, server_id):
+    """Lee un único fragmento desde disco, sin pasar por LazyServers. None si no existe."""
+    for entry in read_manifest(path)["servers"]:
+        if entry["id"] == server_id:
+            return _read_json(os.path.join(path, SERVERS_DIR, entry["file"]))
+    return None
+
+
+def load(path):
+    """Documento con los servidores como LazyServers (ningún fragmento se lee todavía)."""
+    manifest = read_manifest(path)
+    doc = {k: v for k, v in manifest.items() if k not in ("servers", "version")}
+    doc["version"] = read_version(path)
+    doc["servers"] = LazyServers(path, manifest["servers"])
+    return doc
+
+
+def _write_manifest(path, doc, servers, atomic_write):
+    manifest = {k: v for k, v in doc.items() if k not in ("servers", "version")}
+    manifest["servers"] = [
+        {"id": sid, "name": servers.name_of(sid), "file": e["file"]} for sid, e in servers.entries.items()
+    ]
+    _write_json(manifest_path(path), manifest, atomic_write)
+
+
+def _as_lazy(path, servers):
+    if isinstance(servers, LazyServers):
+        return servers
+    lazy = LazyServers(path, read_manifest(path)["servers"])
+    for sid in list(lazy):
+        if sid not in servers:
+            del lazy[sid]
+    for sid, server in servers.items():
+        lazy[sid] = server
+    return lazy
+
+
+def save(path, doc, atomic_write):
+    """Escribe el manifiesto y todos los fragmentos cargados; borra los de servidores eliminados."""
+    os.makedirs(os.path.join(path, SERVERS_DIR), exist_ok=True)
+    servers = _as_lazy(path, doc.get("servers", {}))
+    for sid in list(servers._loaded):
+        _write_json(os.path.join(path, SERVERS_DIR, servers.entries[sid]["file"]), servers[sid], atomic_write)
+    _write_manifest(path, doc, servers, atomic_write)
+    _write_version(path, doc.get("version", 0), atomic_write)
+    _remove_orphans(path, servers)
+
+
+def _remove_orphans(path, servers):
+    keep = {e["file"] for e in servers.entries.values()}
+    for name in os.listdir(os.path.join(path, SERVERS_DIR)):
+        if name.endswith(".json") and name not in keep:
+            os.unlink(os.path.join(path, SERVERS_DIR, name))
+
+
+def apply(path, doc, ops, atomic_write):
+    """Persiste operaciones ya aplicadas a `doc` reescribiendo solo los fragmentos afectados."""
+    servers = doc.get("servers")
+    if not isinstance(servers, LazyServers) or any(list(op[1]) == ["servers"] for op in ops):
+        # Se reemplazó la sección 'servers' completa: reescribir todo.
+        save(path, doc, atomic_write)
+        doc["servers"] = _as_lazy(path, servers or {})
+        return
+    os.makedirs(os.path.join(path, SERVERS_DIR), exist_ok=True)
+    touched, manifest_dirty, version_dirty = [], False, False
+    for op in ops:
+        op_path = op[1]
+        if list(op_path) == ["version"]:
+            version_dirty = True # Va en su propio archivo: no toca el manifiesto
+        elif op_path[0] != "servers" or len(op_path) == 2 or (len(op_path) == 3 and op_path[2] == "name"):
+            manifest_dirty = True
+        if op_path[0] == "servers" and op_path[1] not in touched:
+            touched.append(op_path[1])
+    for sid in touched:
+        if sid in servers:
+            _write_json(os.path.join(path, SERVERS_DIR, servers.entries[sid]["file"]), servers[sid], atomic_write)
+    if manifest_dirty:
+        _write_manifest(path, doc, servers, atomic_write)
+        _remove_orphans(path, servers)
+    if version_dirty:
+        # Lo último: quien compare versiones ve la nueva solo con los fragmentos ya escritos.
+        _write_version(path, doc.get("version", 0), atomic_write)
+
+
+def migrate(json_path, shard_dir, atomic_write):
+    """Divide un wg_data.json en fragmentos por servidor. Devuelve el número de servidores."""
+    doc = _read_json(json_path)
+    os.makedirs(os.path.join(shard_dir, SERVERS_DIR), exist_ok=True)
+    save(shard_dir, doc, atomic_write)
+    return len(doc.get("servers", {}))
+
+
+if __name__ == "__main__":
+    # Migración única: python shards.py wg_data.json wg_data.d
+    if len(sys.argv) != 3:
+        print("Uso: python shards.py <wg_data.json> <directorio.d>")
+        sys.exit(1)
+    import store
+    n_servers = migrate(sys.argv[1], sys.argv[2], store._atomic_write)
+    print(f"Migrados {n_servers} servidores a '{sys.argv[2]}'.")
@@ -0,0 +1,764 @@
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+
+import headers
+import journal
+import locking
+import models
+import shards
+from store_sqlite import SqliteBackend, is_sqlite_path
+
+# Almacén compartido en proceso para wg_data.json (y wg0.json).
+# Cada archivo se parsea una sola vez y se guarda en caché junto a su firma
+# (mtime, tamaño, inodo). Mientras la firma no cambie, load() devuelve el mismo
+# objeto sin volver a leer el disco.
+#
+# IMPORTANTE: el documento devuelto es compartido. Quien lo modifique debe
+# guardarlo con save() o descartar los cambios con invalidate().
+#
+# Si la ruta termina en .db/.sqlite se usa el backend SQLite (store_sqlite.py)
+# con la misma forma de documento. Los cambios puntuales se expresan como
+# operaciones ("set", ruta, valor) / ("del", ruta) y se persisten con apply(),
+# que en SQLite se traduce en actualizaciones de fila.
+#
+# En modo diario (WG_DATA_JOURNAL=1, o si ya existe <archivo>.journal) apply()
+# solo añade las operaciones a journal.py; load() las reaplica sobre la
+# instantánea y un compactor en segundo plano las incorpora a una instantánea
+# nueva cuando el diario supera JOURNAL_COMPACT_BYTES.
+#
+# Si la ruta es un directorio *.d se usa la disposición por fragmentos de
+# shards.py: un archivo por servidor más un manifiesto con nombres e ids. La
+# sección 'servers' del documento se carga de forma perezosa (LazyServers) y
+# list_servers() solo lee el manifiesto.
+#
+# load_headers() devuelve un documento cuyos clientes son headers.ClientStub
+# (solo los campos que muestran los selectores); load_client() lee el registro
+# completo bajo demanda. WG_LAZY_CLIENTS=1 activa este modo en el TUI.
+#
+# Todo documento leído pasa por models.normalize_document(), así que quien lo
+# consume ve siempre el esquema canónico ('enable', 'presharedKey', 'port'
+# entero, 'address' como cadena) y la siguiente escritura lo deja así en disco.
+#
+# Varios procesos (TUI y CLI) pueden escribir el mismo archivo. El documento
+# lleva un campo 'version' que cada escritura incrementa; las escrituras toman
+# el cerrojo de locking.py y comparan la versión cargada con la del disco. Si
+# otro proceso escribió entretanto, apply() vuelve a leer el disco, reaplica
+# solo sus propias operaciones y actualiza el documento en memoria en sitio;
+# save() (sin operaciones que reaplicar) lanza ConflictError.
+
+# Archivo de datos por defecto del TUI y de la CLI multi-servidor.
+DATA_FILE = os.environ.get("WG_DATA_FILE", "wg_data.json")
+JOURNAL_ENABLED = os.environ.get("WG_DATA_JOURNAL", "") == "1"
+LAZY_CLIENTS = os.environ.get("WG_LAZY_CLIENTS", "") == "1"
+JOURNAL_COMPACT_BYTES = int(os.environ.get("WG_JOURNAL_COMPACT_BYTES", 1024 * 1024))
+
+_cache = {}
+_header_cache = {}
+_backends = {}
+_lock = threading.Lock()
+_journal_lock = threading.RLock()
+_compacting = set()
+_stats = {"hits": 0, "misses": 0}
+
+
+class ConflictError(RuntimeError):
+    """El archivo cambió en disco desde que se cargó y no hay operaciones que reaplicar."""
+
+
+def _key(path):
+    return os.path.abspath(path)
+
+
+def file_lock(path):
+    """Cerrojo entre procesos de `path` (reentrante dentro del proceso)."""
+    return locking.lock_for(_key(path))
+
+
+def version(data):
+    """Versión (generación) de un documento; 0 si aún no tiene."""
+    value = data.get("version", 0) if isinstance(data, dict) else 0
+    return value if isinstance(value, int) else 0
+
+
+def _signature(path):
+    if shards.is_sharded_path(path):
+        return shards.signature(path)
+    st = os.stat(path)
+    sig = (st.st_mtime_ns, st.st_size, st.st_ino)
+    try:
+        jst = os.stat(journal.journal_path(path))
+    except FileNotFoundError:
+        return sig
+    return sig + (jst.st_mtime_ns, jst.st_size, jst.st_ino)
+
+
+def signature(path):
+    """Firma (stat) actual de `path`; cambia con cada escritura. Lanza OSError si no existe."""
+    return _signature(_key(path))
+
+
+def journaled(path):
+    """Indica si los cambios de `path` se escriben en el diario en lugar de reescribir el archivo."""
+    if is_sqlite_path(path) or shards.is_sharded_path(path):
+        return False
+    return JOURNAL_ENABLED or os.path.exists(journal.journal_path(_key(path)))
+
+
+def supports_delta(path):
+    """Indica si apply() puede persistir solo las operaciones, sin reescribir el documento."""
+    return is_sqlite_path(path) or shards.is_sharded_path(path) or journaled(path)
+
+
+def _plain_json(path):
+    return not is_sqlite_path(path) and not shards.is_sharded_path(path)
+
+
+def streamable(path):
+    """Indica si `path` puede leerse con jsonstream (JSON plano sin diario pendiente)."""
+    return _plain_json(path) and not journaled(path)
+
+
+def _sqlite(path):
+    key = _key(path)
+    with _lock:
+        backend = _backends.get(key)
+        if backend is None:
+            backend = _backends[key] = SqliteBackend(key)
+        return backend
+
+
+def load(path):
+    """Devuelve el documento JSON de `path`, volviendo a parsearlo solo si el archivo cambió.
+
+    Propaga FileNotFoundError y json.JSONDecodeError igual que json.load para que
+    cada llamador mantenga su propio manejo de errores.
+    """
+    key = _key(path)
+    sig = _signature(key)
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[0] == sig:
+            _stats["hits"] += 1
+            return entry[1]
+    data = _read(key)
+    with _lock:
+        _stats["misses"] += 1
+        _cache[key] = (sig, data)
+    return data
+
+
+def _read(key):
+    """Lee el documento desde disco, sin caché (instantánea + diario si existe)."""
+    if is_sqlite_path(key):
+        return models.normalize_document(_sqlite(key).load())
+    if shards.is_sharded_path(key):
+        doc = shards.load(key)
+        doc["servers"].transform = models.normalize_server
+        return doc
+    with _journal_lock:
+        with open(key, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return models.normalize_document(apply_ops(data, journal.read_ops(key)))
+
+
+def load_headers(path):
+    """Como load(), pero con los clientes reducidos a headers.ClientStub.
+
+    El documento completo no queda en memoria: en SQLite solo se leen las
+    columnas de cabecera y en JSON el árbol completo se descarta tras el índice.
+    """
+    key = _key(path)
+    sig = _signature(key)
+    with _lock:
+        entry = _header_cache.get(key)
+        if entry is not None and entry[0] == sig:
+            _stats["hits"] += 1
+            return entry[1]
+    if is_sqlite_path(key):
+        doc = _sqlite(key).load_headers()
+        servers = doc["servers"]
+        for server_id, server in servers.items():
+            clients = server.pop("clients", {})
+            servers[server_id] = models.Server.from_dict(server_id, server).to_dict(with_clients=False)
+            servers[server_id]["clients"] = clients
+    else:
+        doc = headers.stub_document(_read(key))
+    with _lock:
+        _stats["misses"] += 1
+        _header_cache[key] = (sig, doc)
+    return doc
+
+
+def remember_headers(path, doc):
+    """Asocia el documento de cabeceras a la firma actual y suelta el documento completo en caché."""
+    key = _key(path)
+    sig = _signature(key)
+    with _lock:
+        _header_cache[key] = (sig, doc)
+        _cache.pop(key, None)
+
+
+def headers_current(path, doc):
+    """Indica si `doc` es el documento de cabeceras en caché y el archivo no cambió desde entonces."""
+    key = _key(path)
+    try:
+        sig = _signature(key)
+    except FileNotFoundError:
+        return False
+    with _lock:
+        entry = _header_cache.get(key)
+    return entry is not None and entry[1] is doc and entry[0] == sig
+
+
+def load_client(path, server_id, client_id):
+    """Devuelve una copia del registro completo de un cliente (con claves), o None."""
+    key = _key(path)
+    if is_sqlite_path(key):
+        client = _sqlite(key).get_client(server_id, client_id)
+        return models.normalize_client(client) if client is not None else None
+    sig = _signature(key)
+    with _lock:
+        entry = _cache.get(key)
+    if entry is not None and entry[0] == sig:
+        server = entry[1].get("servers", {}).get(server_id)
+    elif shards.is_sharded_path(key):
+        server = shards.read_server(key, server_id)
+    else:
+        server = _read(key).get("servers", {}).get(server_id)
+    client = ((server or {}).get("clients") or {}).get(client_id)
+    return models.normalize_client(client) if client is not None else None
+
+
+def _atomic_write(path, text):
+    """Escribe `text` en un temporal del mismo directorio, hace fsync y lo renombra sobre `path`."""
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(prefix=".wg_data.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _dump(data):
+    return json.dumps(data, indent=2, ensure_ascii=False)
+
+
+def _commit(path, text, data):
+    """Escribe el texto ya serializado y actualiza la caché con `data`."""
+    key = _key(path)
+    try:
+        with _journal_lock:
+            _atomic_write(key, text)
+            # La instantánea nueva ya incluye todo lo que había en el diario.
+            if os.path.exists(journal.journal_path(key)):
+                journal.truncate(key)
+            sig = _signature(key)
+    except Exception:
+        invalidate(path)
+        raise
+    with _lock:
+        _cache[key] = (sig, data)
+
+
+def _remember(path, data):
+    """Asocia `data` a la firma actual de `path` en la caché."""
+    key = _key(path)
+    sig = _signature(key)
+    with _lock:
+        _cache[key] = (sig, data)
+
+
+def _disk_state(key, data):
+    """Con el cerrojo tomado: None si `data` está al día con el disco, o el documento actual del disco.
+
+    Si la caché sigue apuntando a `data` con la firma actual no se lee nada.
+    """
+    try:
+        sig = _signature(key)
+    except FileNotFoundError:
+        return None # Archivo nuevo: no hay nada que pisar
+    with _lock:
+        entry = _cache.get(key)
+    if entry is not None and entry[1] is data and entry[0] == sig:
+        return None
+    fresh = None
+    if is_sqlite_path(key):
+        disk_version = _sqlite(key).get_meta("version", 0)
+    elif shards.is_sharded_path(key):
+        disk_version = shards.read_version(key)
+    else:
+        fresh = _read(key)
+        disk_version = version(fresh)
+    if disk_version == version(data):
+        return None
+    return fresh if fresh is not None else _read(key)
+
+
+def _replace_contents(data, fresh):
+    """Sustituye en sitio el contenido de `data` (quien lo tenga referenciado ve el cambio)."""
+    data.clear()
+    data.update(fresh)
+
+
+def _reconcile(key, ops, data):
+    """Con el cerrojo tomado: fusiona con el disco si hace falta y sube la versión.
+
+    Si otro proceso escribió, `data` pasa a ser el documento del disco con `ops`
+    aplicadas encima, sin las que tocan registros que ya no existen (ver
+    rebase_ops). Devuelve (ops + operación de versión, fusionado).
+    """
+    fresh = _disk_state(key, data)
+    if fresh is not None:
+        ops = rebase_ops(fresh, ops)
+        _replace_contents(data, fresh)
+    data["version"] = version(data) + 1
+    return list(ops) + [("set", ["version"], data["version"])], fresh is not None
+
+
+def _claim(key, data):
+    """Con el cerrojo tomado: sube la versión de `data` o lanza ConflictError si el disco cambió."""
+    if _disk_state(key, data) is not None:
+        invalidate(key)
+        raise ConflictError(f"'{key}' fue modificado por otro proceso; vuelve a cargarlo antes de guardar.")
+    data["version"] = version(data) + 1
+
+
+def save(path, data):
+    """Guarda `data` en `path` de forma atómica y lo deja en caché sin volver a parsearlo.
+
+    Lanza ConflictError si otro proceso escribió el archivo desde que se cargó
+    `data`; para fusionar cambios usa apply() con operaciones.
+    """
+    key = _key(path)
+    with locking.lock_for(key):
+        _claim(key, data)
+        _write(key, data)
+
+
+def _write(path, data):
+    if is_sqlite_path(path):
+        try:
+            _sqlite(path).save(data)
+        except Exception:
+            invalidate(path)
+            raise
+        _remember(path, data)
+        return
+    if shards.is_sharded_path(path):
+        try:
+            shards.save(_key(path), data, _atomic_write)
+        except Exception:
+            invalidate(path)
+            raise
+        _remember(path, data)
+        return
+    _commit(path, _dump(data), data)
+
+
+def apply_ops(data, ops):
+    """Aplica en memoria una lista de operaciones ("set", ruta, valor) / ("del", ruta)."""
+    for op in ops:
+        action, path = op[0], op[1]
+        target = data
+        for key in path[:-1]:
+            target = target.setdefault(key, {})
+        if action == "set":
+            target[path[-1]] = op[2]
+        elif action == "del":
+            target.pop(path[-1], None)
+        else:
+            raise ValueError(f"Operación desconocida: {action}")
+    return data
+
+
+RECORD_COLLECTIONS = ("servers", "clients")
+
+
+def rebase_ops(data, ops):
+    """Aplica `ops` sobre un documento más reciente (`data`) y devuelve las que se aplicaron.
+
+    Se descartan las operaciones cuyo registro padre ya no existe en `data`
+    (otro proceso lo borró): un ("set", [..., "c1", "enable"], False) no debe
+    recrear el cliente c1 como un registro vacío. Solo un "set" de un registro
+    completo (servers.<id>, servers.<id>.clients.<id>, clients.<id>) puede crear
+    la colección que lo contiene, nunca el registro padre.
+    """
+    kept = []
+    for op in ops:
+        action, path = op[0], op[1]
+        target = data
+        for depth, key in enumerate(path[:-1]):
+            child = target.get(key) if hasattr(target, "get") else None
+            if child is None:
+                whole_record = action == "set" and depth == len(path) - 2 and key in RECORD_COLLECTIONS
+                if not whole_record:
+                    target = None
+                    break
+                child = target[key] = {}
+            target = child
+        if not hasattr(target, "get"): # Registro padre borrado: se descarta
+            continue
+        apply_ops(target, [(action, path[-1:]) + tuple(op[2:])])
+        kept.append(op)
+    return kept
+
+
+def apply(path, ops, data=None):
+    """Persiste una lista de operaciones. Devuelve True si hubo que fusionar con otro proceso.
+
+    `data` es el documento en memoria al que ya se aplicaron las operaciones; si
+    no se indica, se carga (desde la caché) y se modifica aquí. En SQLite solo se
+    escriben las filas afectadas; en JSON se reescribe el archivo o, en modo
+    diario, se añaden al diario.
+    """
+    key = _key(path)
+    with locking.lock_for(key):
+        if data is None and is_sqlite_path(key):
+            backend = _sqlite(key)
+            ops = list(ops) + [("set", ["version"], backend.get_meta("version", 0) + 1)]
+            try:
+                backend.apply(ops)
+            finally:
+                invalidate(key)
+            return False
+        if data is None:
+            data = load(key)
+            ops = rebase_ops(data, ops)
+        ops, merged = _reconcile(key, ops, data)
+        _persist(key, ops, data)
+    return merged
+
+
+def _persist(key, ops, data):
+    """Escribe `ops` (ya aplicadas a `data`) con el mecanismo de cada backend."""
+    if is_sqlite_path(key):
+        try:
+            _sqlite(key).apply(ops)
+        except Exception:
+            invalidate(key)
+            raise
+        _remember(key, data)
+        return
+    if shards.is_sharded_path(key):
+        try:
+            shards.apply(key, data, ops, _atomic_write)
+        except Exception:
+            invalidate(key)
+            raise
+        _remember(key, data)
+        return
+    if not journaled(key):
+        _write(key, data)
+        return
+    try:
+        with _journal_lock:
+            journal.append(key, ops)
+            _remember(key, data)
+    except Exception:
+        invalidate(key)
+        raise
+    if journal.size(key) > JOURNAL_COMPACT_BYTES:
+        compact_async(key)
+
+
+def compact(path):
+    """Incorpora el diario a una instantánea nueva y lo vacía.
+
+    El documento se vuelve a leer de disco (no se usa el objeto en caché, que
+    puede estar modificándose en otro hilo), así que es seguro en segundo plano.
+    """
+    key = _key(path)
+    with locking.lock_for(key), _journal_lock:
+        if not journal.size(key):
+            return False
+        old_sig = _signature(key)
+        data = _read(key)
+        _atomic_write(key, _dump(data))
+        journal.truncate(key)
+        new_sig = _signature(key)
+        with _lock:
+            entry = _cache.get(key)
+            # Si la caché estaba al día sigue siéndolo: solo cambia la firma.
+            if entry is not None and entry[0] == old_sig:
+                _cache[key] = (new_sig, entry[1])
+    return True
+
+
+def compact_async(path):
+    """Lanza compact() en un hilo en segundo plano si no hay otro en curso para `path`."""
+    key = _key(path)
+    with _lock:
+        if key in _compacting:
+            return
+        _compacting.add(key)
+
+    def run():
+        try:
+            compact(key)
+        except Exception:
+            pass # Se reintentará con el siguiente cambio que supere el umbral.
+        finally:
+            with _lock:
+                _compacting.discard(key)
+
+    threading.Thread(target=run, name="wg-journal-compact", daemon=True).start()
+
+
+def server_names(servers):
+    """Lista [(nombre, id)] de una sección 'servers'. Con fragmentos no lee ningún servidor."""
+    if isinstance(servers, shards.LazyServers):
+        return servers.names()
+    return [(server.get("name", server_id), server_id) for server_id, server in servers.items()]
+
+
+def list_servers(path):
+    """Lista [(nombre, id)] de los servidores de `path`. Con fragmentos solo se lee el manifiesto."""
+    return server_names(load(path).get("servers", {}))
+
+
+def find_client(path, server_id, field, value):
+    """Busca un cliente de `server_id` cuyo `field` (publicKey, address o name) sea `value`.
+
+    Devuelve (id_cliente, datos) o None. En SQLite usa los índices de la tabla.
+    """
+    if is_sqlite_path(path):
+        return _sqlite(path).find_client(server_id, field, value)
+    clients = load(path).get("servers", {}).get(server_id, {}).get("clients", {}) or {}
+    if field == "address":
+        value = (models.split_addresses(value) or [None])[0]
+    for client_id, client in clients.items():
+        current = client.get(field)
+        if field == "address":
+            current = (models.split_addresses(current) or [None])[0]
+        if current == value:
+            return client_id, client
+    return None
+
+
+def invalidate(path=None):
+    """Descarta la entrada en caché de `path` (o de todos los archivos si es None)."""
+    with _lock:
+        if path is None:
+            _cache.clear()
+            _header_cache.clear()
+        else:
+            _cache.pop(_key(path), None)
+            _header_cache.pop(_key(path), None)
+
+
+def stats():
+    """Devuelve los contadores de aciertos/fallos de la caché."""
+    with _lock:
+        return {"hits": _stats["hits"], "misses": _stats["misses"], "files": len(_cache)}
+
+
+class WriteBehind:
+    """Escritor en segundo plano que agrupa ráfagas de cambios en una sola escritura.
+
+    Los cambios se envían con submit(ops), que los aplica a `data` y los encola;
+    quien modifique `data` directamente debe hacerlo dentro de `with writer.lock:`
+    y luego llamar a touch() (lo que fuerza una escritura completa). Tras `delay` segundos sin cambios nuevos se serializa el documento y
+    se escribe de forma atómica (temporal + fsync + rename). `on_flush(pending, error)`
+    se invoca desde el hilo del escritor después de cada intento de escritura.
+
+    Con headers_only=True `data` es un documento de load_headers(): las
+    operaciones se aplican sobre el archivo real (no se serializa `data`) y los
+    registros completos que llegan en submit() se reducen a ClientStub.
+
+    Si otro proceso escribió el archivo, las operaciones encoladas se reaplican
+    sobre lo que hay en disco, `data` se actualiza en sitio y `merged` queda en
+    True hasta la siguiente escritura.
+
+    after_flush(callback) deja una tarea para el hilo del escritor (p. ej. un
+    archivo derivado de `data`): se llama callback(versión) tras la primera
+    escritura que no deje cambios pendientes, y se descarta si esa escritura
+    fusionó cambios externos.
+    """
+
+    def __init__(self, path, data, delay=0.5, on_flush=None, headers_only=False):
+        self.path = path
+        self.data = data
+        self.delay = delay
+        self.on_flush = on_flush
+        self.headers_only = headers_only
+        self.lock = threading.RLock()
+        self._io_lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._last_change = 0.0
+        self._pending = 0
+        self._ops = []
+        self._full = False
+        self._after = None
+        self._closed = False
+        self.merged = False
+        self._thread = threading.Thread(target=self._run, name="wg-write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    @property
+    def pending(self):
+        """Número de cambios aún no escritos en disco."""
+        with self.lock:
+            return self._pending
+
+    def touch(self):
+        """Registra un cambio hecho directamente en `data` y reinicia el periodo de espera."""
+        if self.headers_only:
+            raise RuntimeError("Con headers_only solo se admiten cambios mediante submit().")
+        with self.lock:
+            self._full = True
+            self._pending += 1
+            self._last_change = time.monotonic()
+        self._dirty.set()
+
+    def submit(self, ops):
+        """Aplica `ops` a `data` y las encola para la próxima escritura."""
+        with self.lock:
+            apply_ops(self.data, ops)
+            if self.headers_only:
+                headers.absorb(self.data, ops)
+            self._ops.extend(ops)
+            self._pending += 1
+            self._last_change = time.monotonic()
+        self._dirty.set()
+
+    def after_flush(self, callback):
+        """Sustituye la tarea pendiente por callback(versión), ver la documentación de la clase.
+
+        Para que corresponda a los cambios enviados, llámese junto con submit()
+        dentro de `with writer.lock:`. callback no debe lanzar excepciones.
+        """
+        with self.lock:
+            self._after = callback
+
+    def flush(self):
+        """Escribe inmediatamente los cambios pendientes. Devuelve cuántos se escribieron."""
+        with self._io_lock, file_lock(self.path):
+            with self.lock:
+                flushed = self._pending
+                if not flushed:
+                    return 0
+                ops, full = self._ops, self._full
+                self._pending, self._ops, self._full = 0, [], False
+            try:
+                if self.headers_only:
+                    self.merged = self._flush_headers(ops)
+                else:
+                    self.merged = self._flush_data(ops, full)
+            except Exception:
+                with self.lock:
+                    self._pending += flushed
+                    self._ops[:0] = ops
+                    self._full = self._full or full
+                raise
+            with self.lock:
+                callback = None
+                if self.merged:
+                    self._after = None
+                elif not self._pending:
+                    callback, self._after = self._after, None
+                doc_version = version(self.data)
+            if callback is not None:
+                callback(doc_version)
+        return flushed
+
+    def _flush_data(self, ops, full):
+        key = _key(self.path)
+        with self.lock:
+            if not _plain_json(self.path) or (not full and journaled(self.path)):
+                if full:
+                    save(self.path, self.data)
+                    return False
+                return apply(self.path, ops, self.data)
+            # JSON plano: se serializa bajo el lock y se escribe fuera de él.
+            if full:
+                _claim(key, self.data)
+                merged = False
+            else:
+                ops, merged = _reconcile(key, ops, self.data)
+            text = _dump(self.data)
+        _commit(self.path, text, self.data)
+        return merged
+
+    def _flush_headers(self, ops):
+        stale = not headers_current(self.path, self.data)
+        apply(self.path, ops)
+        if stale:
+            # Otro proceso cambió el archivo: recargar las cabeceras y reaplicar lo que siga en cola.
+            invalidate(self.path)
+            fresh = load_headers(self.path)
+            with self.lock:
+                _replace_contents(self.data, fresh)
+                self._ops = rebase_ops(self.data, self._ops)
+                headers.absorb(self.data, self._ops)
+        remember_headers(self.path, self.data)
+        return stale
+
+    def reload(self):
+        """Vuelve a leer el archivo tras un cambio externo, reaplicando lo que siga en cola.
+
+        Devuelve la sección 'servers' anterior (para compararla con la nueva) o
+        None si `data` ya estaba al día (p. ej. el cambio era una escritura propia).
+        """
+        with file_lock(self.path):
+            fresh = load_headers(self.path) if self.headers_only else load(self.path)
+            if fresh is self.data:
+                return None
+            with self.lock:
+                previous = self.data.get("servers", {})
+                _replace_contents(self.data, fresh)
+                self._ops = rebase_ops(self.data, self._ops)
+                if self.headers_only:
+                    headers.absorb(self.data, self._ops)
+            if self.headers_only:
+                remember_headers(self.path, self.data)
+            else:
+                _remember(self.path, self.data)
+        return previous
+
+    def close(self):
+        """Detiene el hilo y escribe lo que quede pendiente (se llama también al salir)."""
+        if self._closed:
+            return
+        self._closed = True
+        self._dirty.set()
+        self._thread.join(timeout=5)
+        self.flush()
+
+    def _run(self):
+        while not self._closed:
+            self._dirty.wait()
+            # Esperar un periodo de silencio para agrupar la ráfaga en una sola escritura.
+            while not self._closed:
+                with self.lock:
+                    remaining = self._last_change + self.delay - time.monotonic()
+                if remaining <= 0:
+                    break
+                time.sleep(remaining)
+            self._dirty.clear()
+            if self._closed:
+                return
+            error = None
+            try:
+                self.flush()
+            except Exception as e:
+                error = e
+                self._dirty.set()
+                time.sleep(self.delay)
+            if self.on_flush:
+                try:
+                    self.on_flush(self.pending, error)
+                except Exception:
+                    pass # La UI pudo haberse cerrado mientras se escribía.
@@ -0,0 +1,274 @@
+import json
+import sqlite3
+import sys
+import threading
+
+import models
+from headers import ClientStub
+
+# Backend SQLite opcional para el almacén (store.py).
+# Mantiene la misma forma de documento que wg_data.json ({"servers": {...}}),
+# pero guarda cada servidor y cada cliente en su propia fila. Los clientes se
+# indexan por servidor + publicKey / address / name para que las búsquedas y las
+# comprobaciones de duplicados no recorran todo el archivo, y los cambios de un
+# solo cliente se escriben como una actualización de fila.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS servers (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS clients (
+    server_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    name TEXT,
+    address TEXT,
+    public_key TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (server_id, id)
+);
+CREATE INDEX IF NOT EXISTS idx_clients_public_key ON clients (server_id, public_key);
+CREATE INDEX IF NOT EXISTS idx_clients_address ON clients (server_id, address);
+CREATE INDEX IF NOT EXISTS idx_clients_name ON clients (server_id, name);
+"""
+
+LOOKUP_COLUMNS = {"publicKey": "public_key", "address": "address", "name": "name"}
+
+
+def is_sqlite_path(path):
+    """Indica si `path` debe abrirse con el backend SQLite (por su extensión)."""
+    return str(path).lower().endswith((".db", ".sqlite", ".sqlite3"))
+
+
+def _address_key(address):
+    # Se indexa la primera dirección ('address' puede traer varias separadas por comas).
+    addresses = models.split_addresses(address)
+    return addresses[0] if addresses else None
+
+
+class SqliteBackend:
+    """Acceso por filas a un archivo SQLite con el mismo contenido que wg_data.json."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    # --- Lectura -----------------------------------------------------------
+
+    def load(self):
+        """Reconstruye el documento completo {"servers": {...}}."""
+        with self.lock:
+            doc = {key: json.loads(value) for key, value in self.conn.execute("SELECT key, value FROM meta ORDER BY rowid")}
+            servers = {}
+            for server_id, data in self.conn.execute("SELECT id, data FROM servers ORDER BY rowid"):
+                server = json.loads(data)
+                server["clients"] = {}
+                servers[server_id] = server
+            for server_id, client_id, data in self.conn.execute("SELECT server_id, id, data FROM clients ORDER BY rowid"):
+                if server_id in servers:
+                    servers[server_id]["clients"][client_id] = json.loads(data)
+        doc["servers"] = servers
+        return doc
+
+    def load_headers(self):
+        """Documento con los clientes reducidos a ClientStub, leyendo solo las columnas indexadas."""
+        with self.lock:
+            doc = {key: json.loads(value) for key, value in self.conn.execute("SELECT key, value FROM meta ORDER BY rowid")}
+            servers = {}
+            for server_id, data in self.conn.execute("SELECT id, data FROM servers ORDER BY rowid"):
+                server = json.loads(data)
+                server["clients"] = {}
+                servers[server_id] = server
+            rows = self.conn.execute(
+                "SELECT server_id, id, name, json_extract(data, '$.address'), public_key, "
+                "coalesce(json_extract(data, '$.enable'), json_extract(data, '$.enabled'), 0), "
+                "json_extract(data, '$.dns') FROM clients ORDER BY rowid"
+            )
+            for server_id, client_id, name, address, public_key, enable, dns in rows:
+                if server_id in servers:
+                    if isinstance(address, str) and address.startswith("["):
+                        address = json.loads(address)
+                    address = models.join_addresses(models.split_addresses(address))
+                    servers[server_id]["clients"][client_id] = ClientStub(client_id, name, address, bool(enable), public_key, dns)
+        doc["servers"] = servers
+        return doc
+
+    def get_meta(self, key, default=None):
+        """Valor de una clave raíz del documento (p. ej. 'version') sin cargar el resto."""
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def get_client(self, server_id, client_id):
+        """Registro completo de un cliente, o None."""
+        with self.lock:
+            row = self.conn.execute("SELECT data FROM clients WHERE server_id = ? AND id = ?", (server_id, client_id)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def find_client(self, server_id, field, value):
+        """Busca un cliente por publicKey, address o name usando el índice. Devuelve (id, datos) o None."""
+        column = LOOKUP_COLUMNS[field]
+        if field == "address":
+            value = _address_key(value)
+        with self.lock:
+            row = self.conn.execute(
+                f"SELECT id, data FROM clients WHERE server_id = ? AND {column} = ? LIMIT 1",
+                (server_id, value),
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    # --- Escritura ---------------------------------------------------------
+
+    def save(self, doc):
+        """Sincroniza el documento completo en una sola transacción."""
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM meta")
+            for key, value in doc.items():
+                if key != "servers":
+                    self.conn.execute("INSERT INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value, ensure_ascii=False)))
+            self._sync_servers(doc.get("servers", {}))
+
+    def apply(self, ops):
+        """Aplica operaciones ('set'/'del', ruta, valor) como actualizaciones de fila."""
+        with self.lock, self.conn:
+            for op in ops:
+                action, path = op[0], op[1]
+                value = op[2] if len(op) > 2 else None
+                self._apply_one(action, list(path), value)
+
+    def _apply_one(self, action, path, value):
+        if path[0] != "servers":
+            if action == "set" and len(path) == 1:
+                self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (path[0], json.dumps(value, ensure_ascii=False)))
+            elif action == "del" and len(path) == 1:
+                self.conn.execute("DELETE FROM meta WHERE key = ?", (path[0],))
+            else:
+                raise ValueError(f"Ruta no soportada por el backend SQLite: {path}")
+            return
+        if len(path) == 1:
+            self._sync_servers(value if action == "set" else {})
+            return
+        server_id = path[1]
+        if len(path) == 2:
+            if action == "set":
+                self._put_server(server_id, value)
+            else:
+                self._delete_server(server_id)
+        elif path[2] != "clients":
+            server = self._read_server(server_id)
+            if len(path) == 3:
+                if action == "set":
+                    server[path[2]] = value
+                else:
+                    server.pop(path[2], None)
+            else:
+                self._set_nested(server, path[2:], action, value)
+            self._write_server_row(server_id, server)
+        elif len(path) == 3:
+            # Reemplazo de la sección 'clients' completa de un servidor.
+            self.conn.execute("DELETE FROM clients WHERE server_id = ?", (server_id,))
+            if action == "set":
+                for client_id, client in (value or {}).items():
+                    self._put_client(server_id, client_id, client)
+        elif len(path) == 4:
+            if action == "set":
+                self._put_client(server_id, path[3], value)
+            else:
+                self.conn.execute("DELETE FROM clients WHERE server_id = ? AND id = ?", (server_id, path[3]))
+        else:
+            row = self.conn.execute("SELECT data FROM clients WHERE server_id = ? AND id = ?", (server_id, path[3])).fetchone()
+            if row is None:
+                raise KeyError(path[3])
+            client = json.loads(row[0])
+            self._set_nested(client, path[4:], action, value)
+            self._put_client(server_id, path[3], client)
+
+    @staticmethod
+    def _set_nested(target, path, action, value):
+        for key in path[:-1]:
+            target = target.setdefault(key, {})
+        if action == "set":
+            target[path[-1]] = value
+        else:
+            target.pop(path[-1], None)
+
+    def _sync_servers(self, servers):
+        existing = [row[0] for row in self.conn.execute("SELECT id FROM servers")]
+        for server_id in existing:
+            if server_id not in servers:
+                self._delete_server(server_id)
+        for server_id, server in (servers or {}).items():
+            self._put_server(server_id, server)
+
+    def _read_server(self, server_id):
+        row = self.conn.execute("SELECT data FROM servers WHERE id = ?", (server_id,)).fetchone()
+        if row is None:
+            raise KeyError(server_id)
+        return json.loads(row[0])
+
+    def _write_server_row(self, server_id, server):
+        fields = {k: v for k, v in server.items() if k != "clients"}
+        self.conn.execute(
+            "INSERT INTO servers (id, name, data) VALUES (?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET name = excluded.name, data = excluded.data",
+            (server_id, fields.get("name"), json.dumps(fields, ensure_ascii=False)),
+        )
+
+    def _put_server(self, server_id, server):
+        self._write_server_row(server_id, server)
+        clients = server.get("clients", {}) or {}
+        existing = [row[0] for row in self.conn.execute("SELECT id FROM clients WHERE server_id = ?", (server_id,))]
+        for client_id in existing:
+            if client_id not in clients:
+                self.conn.execute("DELETE FROM clients WHERE server_id = ? AND id = ?", (server_id, client_id))
+        for client_id, client in clients.items():
+            self._put_client(server_id, client_id, client)
+
+    def _put_client(self, server_id, client_id, client):
+        self.conn.execute(
+            "INSERT INTO clients (server_id, id, name, address, public_key, data) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(server_id, id) DO UPDATE SET name = excluded.name, address = excluded.address, "
+            "public_key = excluded.public_key, data = excluded.data",
+            (server_id, client_id, client.get("name"), _address_key(client.get("address")),
+             client.get("publicKey"), json.dumps(client, ensure_ascii=False)),
+        )
+
+    def _delete_server(self, server_id):
+        self.conn.execute("DELETE FROM clients WHERE server_id = ?", (server_id,))
+        self.conn.execute("DELETE FROM servers WHERE id = ?", (server_id,))
+
+
+def migrate(json_path, db_path):
+    """Copia un wg_data.json completo a una base SQLite. Devuelve (servidores, clientes)."""
+    with open(json_path, "r", encoding="utf-8") as f:
+        doc = json.load(f)
+    backend = SqliteBackend(db_path)
+    try:
+        backend.save(doc)
+    finally:
+        backend.close()
+    servers = doc.get("servers", {})
+    return len(servers), sum(len(s.get("clients", {}) or {}) for s in servers.values())
+
+
+if __name__ == "__main__":
+    # Migración única: python store_sqlite.py wg_data.json wg_data.db
+    if len(sys.argv) != 3:
+        print("Uso: python store_sqlite.py <wg_data.json> <destino.db>")
+        sys.exit(1)
+    n_servers, n_clients = migrate(sys.argv[1], sys.argv[2])
+    print(f"Migrados {n_servers} servidores y {n_clients} clientes a '{sys.argv[2]}'.")
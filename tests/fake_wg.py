@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+import json
+import os
+import sys
+import time
+
+# 'wg' falso para las pruebas de liveapply.py. Entiende solo lo que usa el motor:
+#   wg show <interfaz> dump
+#   wg set <interfaz> peer <clave> [remove | allowed-ips <ips> | preshared-key <archivo>]...
+# El estado de las interfaces está en FAKE_WG_STATE (JSON):
+#   {"wg0": {"<clave pública>": {"psk": "..." o null, "allowed_ips": "10.0.0.2/32,..."}}}
+# y cada llamada se añade a FAKE_WG_LOG como una línea JSON {"args": [...], "stdin": "..."}.
+# Con FAKE_WG_DELAY (segundos) cada 'set' tarda ese tiempo, para las pruebas de concurrencia.
+
+NONE = "(none)"
+
+
+def load_state():
+    with open(os.environ["FAKE_WG_STATE"], encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(state):
+    path = os.environ["FAKE_WG_STATE"]
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(path + ".tmp", path)
+
+
+def fail(message):
+    sys.stderr.write(message + "\n")
+    sys.exit(1)
+
+
+def show(state, interface):
+    if interface not in state:
+        fail("Unable to access interface: No such device")
+    lines = ["PRIVATEKEY\tPUBLICKEY\t51820\toff"]
+    for public_key, peer in state[interface].items():
+        lines.append("\t".join([public_key, peer["psk"] or NONE, NONE, peer["allowed_ips"] or NONE,
+                                "0", "0", "0", "off"]))
+    print("\n".join(lines))
+
+
+def read_key(path, stdin):
+    if path == "/dev/null":
+        return None
+    if path == "/dev/stdin":
+        return stdin.strip() or None
+    with open(path, encoding="utf-8") as f:
+        return f.read().strip() or None
+
+
+def set_peers(state, interface, args, stdin):
+    if interface not in state:
+        fail("Unable to access interface: No such device")
+    peers = state[interface]
+    peer = None
+    i = 0
+    while i < len(args):
+        word = args[i]
+        if word == "peer":
+            peer = peers.setdefault(args[i + 1], {"psk": None, "allowed_ips": ""})
+            key = args[i + 1]
+            i += 2
+        elif peer is None:
+            fail(f"Invalid argument: {word}")
+        elif word == "remove":
+            peers.pop(key, None)
+            peer = None
+            i += 1
+        elif word == "allowed-ips":
+            peer["allowed_ips"] = args[i + 1]
+            i += 2
+        elif word == "preshared-key":
+            peer["psk"] = read_key(args[i + 1], stdin)
+            i += 2
+        else:
+            fail(f"Invalid argument: {word}")
+    save_state(state)
+
+
+def main(argv):
+    uses_stdin = "/dev/stdin" in argv
+    stdin = sys.stdin.read() if uses_stdin else None
+    with open(os.environ["FAKE_WG_LOG"], "a", encoding="utf-8") as f:
+        f.write(json.dumps({"args": argv, "stdin": stdin}) + "\n")
+    state = load_state()
+    if argv[:1] == ["show"] and argv[2:] == ["dump"]:
+        show(state, argv[1])
+    elif argv[:1] == ["set"] and len(argv) > 1:
+        time.sleep(float(os.environ.get("FAKE_WG_DELAY", "0")))
+        set_peers(state, argv[1], argv[2:], stdin)
+    else:
+        fail(f"Orden no soportada por el wg falso: {' '.join(argv)}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,203 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+import liveapply
+
+# Pruebas del motor de aplicación en caliente contra el 'wg' falso (fake_wg.py),
+# que guarda el estado de las interfaces en un JSON y registra cada llamada.
+# Uso: python -m unittest discover -s tests
+
+FAKE_WG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_wg.py")
+PSK_A = "A" * 43 + "="
+PSK_B = "B" * 43 + "="
+
+
+def client(public_key, address, psk=None, enable=True):
+    return {"publicKey": public_key, "presharedKey": psk, "address": address, "enable": enable}
+
+
+def server(clients, interface="wg0"):
+    return {"wgInterface": interface, "enable": True,
+            "clients": {f"id-{key}": data for key, data in clients.items()}}
+
+
+class FakeWgTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.state_path = os.path.join(self.dir, "state.json")
+        self.log_path = os.path.join(self.dir, "calls.jsonl")
+        self.env = {key: os.environ.get(key) for key in ("FAKE_WG_STATE", "FAKE_WG_LOG", "FAKE_WG_DELAY")}
+        os.environ["FAKE_WG_STATE"] = self.state_path
+        os.environ["FAKE_WG_LOG"] = self.log_path
+        os.environ.pop("FAKE_WG_DELAY", None)
+        self.set_live({})
+
+    def tearDown(self):
+        for key, value in self.env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def set_live(self, peers, interface="wg0"):
+        with open(self.state_path, "w", encoding="utf-8") as f:
+            json.dump({interface: peers}, f)
+
+    def live(self, interface="wg0"):
+        with open(self.state_path, encoding="utf-8") as f:
+            return json.load(f)[interface]
+
+    def calls(self):
+        if not os.path.exists(self.log_path):
+            return []
+        with open(self.log_path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+
+    def set_calls(self):
+        return [call for call in self.calls() if call["args"][0] == "set"]
+
+    def apply(self, desired, **kwargs):
+        return liveapply.apply(server(desired), wg=FAKE_WG, **kwargs)
+
+
+class ApplyTest(FakeWgTestCase):
+
+    def test_add_remove_update_in_one_batch(self):
+        self.set_live({
+            "keep": {"psk": None, "allowed_ips": "10.0.0.2/32"},
+            "gone": {"psk": None, "allowed_ips": "10.0.0.3/32"},
+            "moved": {"psk": None, "allowed_ips": "10.0.0.4/32"},
+        })
+        result = self.apply({
+            "keep": client("keep", "10.0.0.2/32"),
+            "moved": client("moved", "10.0.0.40/32"),
+            "new": client("new", "10.0.0.5/32"),
+            "off": client("off", "10.0.0.6/32", enable=False),
+        })
+        self.assertEqual(liveapply.summary(result["changes"]), {"add": 1, "remove": 1, "update": 1})
+        self.assertEqual(self.set_calls(), [{"args": [
+            "set", "wg0",
+            "peer", "gone", "remove",
+            "peer", "moved", "allowed-ips", "10.0.0.40/32",
+            "peer", "new", "allowed-ips", "10.0.0.5/32",
+        ], "stdin": None}])
+        self.assertEqual(self.live(), {
+            "keep": {"psk": None, "allowed_ips": "10.0.0.2/32"},
+            "moved": {"psk": None, "allowed_ips": "10.0.0.40/32"},
+            "new": {"psk": None, "allowed_ips": "10.0.0.5/32"},
+        })
+
+    def test_no_changes_runs_only_show(self):
+        self.set_live({"keep": {"psk": PSK_A, "allowed_ips": "10.0.0.2/32"}})
+        result = self.apply({"keep": client("keep", "10.0.0.2", psk=PSK_A)})
+        self.assertEqual(result["changes"], [])
+        self.assertEqual([call["args"] for call in self.calls()], [["show", "wg0", "dump"]])
+
+    def test_psk_goes_through_stdin(self):
+        self.set_live({"old": {"psk": PSK_A, "allowed_ips": "10.0.0.2/32"}})
+        self.apply({
+            "old": client("old", "10.0.0.2/32", psk=PSK_B),
+            "new": client("new", "10.0.0.3/32", psk=PSK_A),
+        })
+        calls = self.set_calls()
+        self.assertEqual(len(calls), 2)
+        for call in calls:
+            self.assertEqual(call["args"][-2:], ["preshared-key", "/dev/stdin"])
+            self.assertFalse(any(psk in " ".join(call["args"]) for psk in (PSK_A, PSK_B)))
+        self.assertEqual(sorted(call["stdin"] for call in calls), [PSK_A + "\n", PSK_B + "\n"])
+        self.assertEqual(self.live()["old"]["psk"], PSK_B)
+        self.assertEqual(self.live()["new"], {"psk": PSK_A, "allowed_ips": "10.0.0.3/32"})
+
+    def test_psk_removed_with_dev_null(self):
+        self.set_live({"peer": {"psk": PSK_A, "allowed_ips": "10.0.0.2/32"}})
+        result = self.apply({"peer": client("peer", "10.0.0.2/32")})
+        self.assertEqual(result["changes"][0].fields, ("preshared-key",))
+        self.assertEqual(self.set_calls(), [{"args": [
+            "set", "wg0", "peer", "peer", "allowed-ips", "10.0.0.2/32", "preshared-key", "/dev/null",
+        ], "stdin": None}])
+        self.assertIsNone(self.live()["peer"]["psk"])
+
+    def test_dry_run_does_not_touch_the_interface(self):
+        live = {"gone": {"psk": None, "allowed_ips": "10.0.0.3/32"}}
+        self.set_live(live)
+        result = self.apply({"new": client("new", "10.0.0.5/32", psk=PSK_A)}, dry_run=True)
+        self.assertTrue(result["dry_run"])
+        self.assertEqual(result["commands"], [
+            ["set", "wg0", "peer", "gone", "remove"],
+            ["set", "wg0", "peer", "new", "allowed-ips", "10.0.0.5/32", "preshared-key", "/dev/stdin"],
+        ])
+        self.assertEqual(self.set_calls(), [])
+        self.assertEqual(self.live(), live)
+
+    def test_missing_interface_raises(self):
+        with self.assertRaises(liveapply.ApplyError):
+            liveapply.apply(server({}, interface="wg9"), wg=FAKE_WG)
+
+    def test_server_without_interface_is_not_applied(self):
+        desired = server({"new": client("new", "10.0.0.5/32")})
+        del desired["wgInterface"]
+        with self.assertRaises(liveapply.ApplyError):
+            liveapply.apply(desired, wg=FAKE_WG)
+        with self.assertRaises(liveapply.ApplyError):
+            liveapply.apply_async(desired, lambda result, error: None, wg=FAKE_WG)
+        self.assertEqual(self.calls(), [])
+
+    def test_invalid_interface_name_raises(self):
+        with self.assertRaises(liveapply.ApplyError):
+            liveapply.apply(server({}, interface="wg0 peer x remove"), wg=FAKE_WG)
+        self.assertEqual(self.calls(), [])
+
+
+class SharedInterfacesTest(unittest.TestCase):
+
+    def test_only_enabled_servers_with_the_same_interface(self):
+        servers = {
+            "a": server({}),
+            "b": server({}),
+            "c": dict(server({}), enable=False),
+            "d": server({}, interface="wg1"),
+            "e": {"enable": True, "clients": {}},
+        }
+        self.assertEqual(liveapply.shared_interfaces(servers), {"wg0": ["a", "b"]})
+        del servers["b"]
+        self.assertEqual(liveapply.shared_interfaces(servers), {})
+
+
+class ApplyAsyncTest(FakeWgTestCase):
+
+    def test_quick_saves_leave_the_last_state(self):
+        os.environ["FAKE_WG_DELAY"] = "0.2"
+        states = [
+            {"a": client("a", "10.0.0.2/32")},
+            {"a": client("a", "10.0.0.2/32"), "b": client("b", "10.0.0.3/32")},
+            {"b": client("b", "10.0.0.30/32")},
+        ]
+        results = []
+        finished = threading.Event()
+
+        def done(result, error):
+            results.append((result, error))
+            finished.set()
+        for desired in states:
+            thread = liveapply.apply_async(server(desired), done, wg=FAKE_WG)
+        thread.join(timeout=10)
+        self.assertTrue(finished.is_set())
+        self.assertTrue(all(error is None for _, error in results))
+        self.assertLessEqual(len(results), len(states)) # Las pendientes sustituidas se descartan
+        self.assertEqual(self.live(), {"b": {"psk": None, "allowed_ips": "10.0.0.30/32"}})
+        self.assertEqual(liveapply.diff(liveapply.read_peers("wg0", wg=FAKE_WG),
+                                        liveapply.desired_peers(server(states[-1]))), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
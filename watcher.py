@@ -0,0 +1,198 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+
+import headers
+import shards
+import store
+
+# Vigilancia del archivo de datos para recargar el TUI en caliente.
+# En Linux se usa inotify (vía ctypes, sin dependencias); si no está
+# disponible se consulta periódicamente la firma del archivo (stat). Se vigila
+# el directorio que contiene el archivo porque las escrituras atómicas lo
+# sustituyen con un rename (el inodo cambia).
+#
+# diff_servers() compara dos secciones 'servers' por servidor y por cliente para
+# que la interfaz solo actualice lo que cambió.
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+_EVENT = struct.Struct("iIII")
+
+
+def _inotify():
+    """libc con inotify, o None si el sistema no lo ofrece."""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError, TypeError):
+        return None
+    return libc
+
+
+class FileWatcher:
+    """Llama a `callback()` (desde un hilo propio) cuando cambia el archivo de datos `path`.
+
+    `interval` es el periodo de consulta cuando no hay inotify y `debounce` el
+    tiempo que se esperan más eventos antes de avisar (una escritura produce varios).
+    """
+
+    def __init__(self, path, callback, interval=1.0, debounce=0.2):
+        self.path = os.path.abspath(path)
+        self.callback = callback
+        self.interval = interval
+        self.debounce = debounce
+        self.mode = None # "inotify" o "polling", una vez iniciado
+        self._stop = threading.Event()
+        self._last = self._signature()
+        self._thread = threading.Thread(target=self._run, name="wg-file-watcher", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=2)
+
+    def _signature(self):
+        try:
+            return store.signature(self.path)
+        except OSError:
+            return None
+
+    def _changed(self):
+        """Avisa si la firma cambió desde el último aviso (filtra eventos sin efecto)."""
+        sig = self._signature()
+        if sig == self._last:
+            return
+        self._last = sig
+        try:
+            self.callback()
+        except Exception:
+            pass # La interfaz pudo cerrarse; el siguiente cambio lo reintentará.
+
+    def _run(self):
+        libc = _inotify()
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC) if libc is not None else -1
+        if fd < 0:
+            self.mode = "polling"
+            self._run_polling()
+            return
+        self.mode = "inotify"
+        try:
+            self._run_inotify(libc, fd)
+        finally:
+            os.close(fd)
+
+    def _watch_dirs(self):
+        if shards.is_sharded_path(self.path):
+            return [self.path, os.path.join(self.path, shards.SERVERS_DIR)]
+        return [os.path.dirname(self.path) or "."]
+
+    def _relevant(self, name):
+        if shards.is_sharded_path(self.path):
+            return name.endswith(".json")
+        base = os.path.basename(self.path)
+        return name in (base, base + ".journal")
+
+    def _run_inotify(self, libc, fd):
+        for directory in self._watch_dirs():
+            if os.path.isdir(directory):
+                libc.inotify_add_watch(fd, os.fsencode(directory), WATCH_MASK)
+        while not self._stop.is_set():
+            ready, _, _ = select.select([fd], [], [], 0.5)
+            if not ready or not self._drain(fd):
+                continue
+            # Agrupar la ráfaga de eventos de una misma escritura.
+            while not self._stop.wait(self.debounce):
+                if not select.select([fd], [], [], 0)[0]:
+                    break
+                self._drain(fd)
+            self._changed()
+
+    def _drain(self, fd):
+        """Lee los eventos pendientes. Devuelve True si alguno afecta al archivo vigilado."""
+        relevant = False
+        while True:
+            try:
+                buf = os.read(fd, 64 * 1024)
+            except BlockingIOError:
+                return relevant
+            offset = 0
+            while offset + _EVENT.size <= len(buf):
+                _, _, _, length = _EVENT.unpack_from(buf, offset)
+                name = buf[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b"\0").decode(errors="replace")
+                relevant = relevant or self._relevant(name)
+                offset += _EVENT.size + length
+
+    def _run_polling(self):
+        while not self._stop.wait(self.interval):
+            self._changed()
+
+
+def _client_key(client):
+    if headers.is_stub(client):
+        return tuple(getattr(client, field) for field in headers.HEADER_FIELDS)
+    return client
+
+
+def _server_fields(server):
+    return {key: value for key, value in server.items() if key != "clients"}
+
+
+class ServerDiff:
+    """Cambios de un servidor: campos propios, lista de clientes y clientes modificados."""
+
+    __slots__ = ("fields", "client_list", "clients")
+
+    def __init__(self):
+        self.fields = False # Cambió algún campo del servidor (no de sus clientes)
+        self.client_list = False # Se añadieron, eliminaron o renombraron clientes
+        self.clients = set() # Ids de clientes nuevos o modificados
+
+
+def diff_servers(old, new):
+    """Compara dos secciones 'servers'.
+
+    Devuelve (servidores_lista, cambios): servidores_lista es True si hay que
+    reconstruir las opciones del selector de servidores (altas, bajas o
+    renombres) y cambios es {id_servidor: ServerDiff} solo para los servidores
+    que cambiaron. Con fragmentos solo se comparan los servidores ya cargados.
+    """
+    old_names = store.server_names(old)
+    new_names = store.server_names(new)
+    server_list = old_names != new_names
+    changes = {}
+    for server_id in new:
+        if server_id not in old:
+            continue
+        if isinstance(old, shards.LazyServers) and not old.is_loaded(server_id):
+            continue
+        old_server, new_server = old[server_id], new[server_id]
+        if old_server is new_server:
+            continue
+        diff = ServerDiff()
+        diff.fields = _server_fields(old_server) != _server_fields(new_server)
+        old_clients = old_server.get("clients") or {}
+        new_clients = new_server.get("clients") or {}
+        diff.client_list = (list(old_clients) != list(new_clients)
+                            or any(old_clients[cid].get("name") != new_clients[cid].get("name") for cid in new_clients))
+        for client_id, client in new_clients.items():
+            previous = old_clients.get(client_id)
+            if previous is None or _client_key(previous) != _client_key(client):
+                diff.clients.add(client_id)
+        if diff.fields or diff.client_list or diff.clients:
+            changes[server_id] = diff
+    return server_list, changes
@@ -11,7 +11,14 @@ from textual.widgets import Button, Label, Input, Static, Select,Switch
 import json
 from textual.widget import Widget
 from textual.binding import Binding
+import allocator
 import clients, servers
+import keypool
+import liveapply
+import models
+import netcheck
+import store
+import watcher
 import uuid
 import os
 from confirm_msg import ConfirmModal
@@ -40,6 +47,7 @@ class MainAppUI(Static):
                                 Horizontal(Label("Puerto:", classes="field-label"), Label(id="input_port", classes="value-label")),
                                 Horizontal(Label("DNS:", classes="field-label"), Label(id="input_dns", classes="value-label")),
                                 Horizontal(Label("Endpoint:", classes="field-label"), Label(id="input_endpoint", classes="value-label")),
+                                Horizontal(Label("Uso:", classes="field-label"), Label(id="input_usage", classes="value-label")),
                                 classes="details-container"
                             ),
                             Horizontal(
@@ -101,7 +109,7 @@ class TerminalUI(App):
 
         # Recarga servidores
         selct_server.clear()
-        list_cl = [(server_id["name"], id_) for id_, server_id in self.wg_data["servers"].items()]
+        list_cl = store.server_names(self.wg_data["servers"])
         selct_server.set_options(list_cl)
         # Restaurar selección de servidor
         if previous_value_server in self.wg_data["servers"]:
@@ -112,17 +120,27 @@ class TerminalUI(App):
     async def on_mount(self) -> None:
         """Carga datos y refresca la lista al iniciar."""
         self.theme = "flexoki"
-        self.load_data("wg_data.json") # Considera usar una constante o atributo de clase para "wg_data.json"
+        # Claves pre-generadas en segundo plano: los modales las toman sin bloquear.
+        self.key_pool = keypool.KeyPool().start()
+        self.load_data(store.DATA_FILE)
+        # Estado de los asignadores guardado junto a los datos (si es de esta misma versión).
+        allocator.load_state(store.DATA_FILE, store.version(self.wg_data))
+        # Las escrituras se agrupan en segundo plano para no bloquear el bucle de eventos.
+        self.writer = store.WriteBehind(store.DATA_FILE, self.wg_data, headers_only=store.LAZY_CLIENTS,
+                                        on_flush=lambda pending, error: self.call_from_thread(self.update_save_status, pending, error))
+        # Recarga en caliente cuando otro proceso (p. ej. la CLI) modifica el archivo.
+        self.watcher = watcher.FileWatcher(store.DATA_FILE, lambda: self.call_from_thread(self.reload_from_disk)).start()
         self.query_one("#main_app_ui_container", Horizontal).border_title = "WG-TUI - A simple terminal interface for WireGuard" 
         self.query_one("#select_server", Vertical).border_title = "Selecciona un servidor"
         self.query_one("#select_client_h",Horizontal).border_title = "Selecciona un cliente"
+        self.set_interval(1.0, self.update_key_pool_status)
         await self.refresh_server_select()
 
     def load_data(self, path_json: str):
         """Carga wg_data desde un archivo JSON."""
         try:
-            with open(path_json, "r", encoding="utf-8") as f:
-                data = json.load(f)
+            # Con WG_LAZY_CLIENTS=1 los clientes se cargan solo como cabeceras.
+            data = store.load_headers(path_json) if store.LAZY_CLIENTS else store.load(path_json)
             self.wg_data = data  # Siempre el objeto raíz
             if "servers" not in data:
                 self.notify("La clave 'servers' no se encontró en el JSON. Usando datos raíz.", severity="warning", title="Advertencia de Carga")
@@ -139,21 +157,148 @@ class TerminalUI(App):
             self.notify(f"Error inesperado al cargar datos: {e}", severity="error", title="Error de Carga")
             self.wg_data = {"servers": {}}
     
+    def update_save_status(self, pending: int, error=None) -> None:
+        """Muestra en el borde inferior si hay cambios pendientes de escribir."""
+        container = self.query_one("#main_app_ui_container", Horizontal)
+        if error is not None:
+            container.border_subtitle = f"Error al guardar: {error}"
+        elif self.writer.merged:
+            # Otro proceso (p. ej. la CLI) cambió el archivo: wg_data ya incluye sus cambios.
+            self.writer.merged = False
+            allocator.reset() # Los asignadores se reconstruyen con los cambios fusionados
+            netcheck.reset()
+            container.border_subtitle = "Guardado (fusionado con cambios externos)"
+            self.call_later(self.refresh_server_select)
+        elif pending:
+            container.border_subtitle = f"Cambios pendientes: {pending}"
+        else:
+            container.border_subtitle = "Guardado"
+
+    def save_allocator_state(self, state, version) -> None:
+        """Escribe el estado de los asignadores (se llama desde el hilo del escritor)."""
+        try:
+            allocator.write_state(store.DATA_FILE, state, version)
+        except OSError as e:
+            message = f"No se pudo guardar el estado de direcciones: {e}"
+            try:
+                self.call_from_thread(self.notify, message, severity="warning", title="Aviso")
+            except RuntimeError: # flush() llamado desde el propio hilo de la interfaz
+                self.notify(message, severity="warning", title="Aviso")
+
+    def update_key_pool_status(self) -> None:
+        """Muestra la profundidad de la reserva de claves y su ritmo de relleno."""
+        self.query_one("#select_server", Vertical).border_subtitle = self.key_pool.status()
+
+    def persist(self, ops) -> None:
+        """Aplica las operaciones a wg_data y las encola en el escritor en segundo plano."""
+        with self.writer.lock:
+            self.writer.submit(ops)
+            allocator.refresh(self.wg_data, ops)
+            netcheck.refresh(self.wg_data, ops)
+            # El estado de direcciones se escribe en el hilo del escritor, tras guardar estos cambios.
+            state = allocator.snapshot()
+            self.writer.after_flush(lambda version: self.save_allocator_state(state, version))
+        self.update_save_status(self.writer.pending)
+        if liveapply.LIVE_APPLY:
+            self.live_apply({op[1][1] for op in ops if len(op[1]) > 1 and op[1][0] == "servers"})
+        server_id = self.query_one("#select_server", Select).value
+        if server_id is not Select.BLANK and server_id in self.wg_data.get("servers", {}):
+            self.show_usage(server_id)
+
+    def live_apply(self, server_ids) -> None:
+        """Lleva los peers de cada servidor habilitado a su interfaz en marcha (WG_LIVE_APPLY=1)."""
+        if store.LAZY_CLIENTS:
+            # Las cabeceras no incluyen la PSK: aplicar con ellas la quitaría de los peers.
+            self.notify("La aplicación en caliente no está disponible con WG_LAZY_CLIENTS=1.", severity="warning")
+            return
+        servers_now = self.wg_data.get("servers", {})
+        shared = liveapply.shared_interfaces(servers_now)
+        for server_id in server_ids:
+            server = servers_now.get(server_id)
+            if server is None or not server.get("enable"):
+                continue
+            name = server.get("name", server_id)
+            interface = liveapply.interface_name(server)
+            # Sin interfaz explícita, o compartida con otro servidor habilitado, se
+            # borrarían de la interfaz los peers de otro servidor: no se aplica.
+            if interface is None:
+                self.notify(f"{name}: sin interfaz WireGuard; defínela en el formulario del servidor para aplicar en caliente.",
+                            severity="warning", title="Aplicación en caliente")
+                continue
+            if interface in shared:
+                otros = ", ".join(servers_now[sid].get("name", sid) for sid in shared[interface] if sid != server_id)
+                self.notify(f"{name}: la interfaz '{interface}' también es de {otros}; no se aplica en caliente.",
+                            severity="warning", title="Aplicación en caliente")
+                continue
+            def done(result, error, name=name):
+                if error is not None:
+                    self.call_from_thread(self.notify, f"{name}: {error}", severity="error", title="Aplicación en caliente")
+                elif result["changes"]:
+                    resumen = ", ".join(f"{action}: {count}" for action, count in liveapply.summary(result["changes"]).items() if count)
+                    self.call_from_thread(self.notify, f"{name} ({result['interface']}): {resumen}", title="Aplicado en caliente")
+            try:
+                liveapply.apply_async(server, done, interface)
+            except liveapply.ApplyError as e:
+                self.notify(f"{name}: {e}", severity="error", title="Aplicación en caliente")
+
+    def on_unmount(self) -> None:
+        """Escribe los cambios pendientes antes de salir."""
+        self.watcher.stop()
+        self.key_pool.stop()
+        self.writer.close()
+
     def on_switch_changed(self, event:Switch.Changed) -> None:
         try:
             if event.switch.id == "enable_server":
-                self.wg_data["servers"][self.query_one("#select_server",Select).value]["enable"]= event.switch.value
+                path = ["servers", self.query_one("#select_server",Select).value]
+                target = self.wg_data["servers"][path[1]]
             elif event.switch.id == "enable_client":
-                self.wg_data["servers"][self.query_one("#select_server",Select).value]["clients"][self.query_one("#select_client",Select).value]["enable"]= event.switch.value
-                
-            with open("wg_data.json", 'w', encoding='utf-8') as f:
-                    json.dump(self.wg_data, f, indent=2, ensure_ascii=False)
+                path = ["servers", self.query_one("#select_server",Select).value, "clients", self.query_one("#select_client",Select).value]
+                target = self.wg_data["servers"][path[1]]["clients"][path[3]]
+            else:
+                return
+            # Al cambiar de selección el switch se actualiza por código; no es un cambio real.
+            if target.get("enable") == event.switch.value:
+                return
+            self.persist([("set", path + ["enable"], event.switch.value)])
         except Exception as e:
             self.notify(f"Error al guardar el estado: {e}", severity="error", title="Error de Guardado")
             return
 
 
 
+    def show_server_details(self, server_id) -> None:
+        """Rellena las etiquetas y el switch del servidor `server_id`."""
+        server = models.Server.from_dict(server_id, self.wg_data["servers"][server_id], with_clients=False)
+        self.query_one("#input_pubkey", Label).update(server.public_key or "")
+        self.query_one("#input_address", Label).update(server.address + (f" (pools: {server.pools})" if server.pools else ""))
+        self.query_one("#input_port", Label).update(str(server.port))
+        self.query_one("#input_dns", Label).update(server.dns or "")
+        self.query_one("#input_endpoint", Label).update(server.endpoint or "")
+        self.query_one("#enable_server", Switch).value = server.enable
+        self.show_usage(server_id)
+
+    def show_usage(self, server_id) -> None:
+        """Uso de las subredes del servidor a partir del estado de los asignadores (sin recorrer clientes)."""
+        try:
+            usage = "\n".join(allocator.format_usage(item) for item in allocator.utilization(self.wg_data, server_id))
+        except ValueError:
+            usage = "Dirección del servidor inválida"
+        self.query_one("#input_usage", Label).update(usage)
+
+    def show_client_details(self, server_id, client_id) -> None:
+        """Rellena las etiquetas y el switch del cliente `client_id`."""
+        client_data = self.wg_data["servers"][server_id]["clients"][client_id]
+        self.query_one("#name_client", Label).update(client_data.get("name", ""))
+        self.query_one("#input_pubkey_client", Label).update(client_data.get("publicKey", ""))
+        self.query_one("#input_address_client", Label).update(models.join_addresses(models.split_addresses(client_data.get("address"))))
+        self.query_one("#input_dns_client", Label).update(client_data.get("dns", ""))
+        self.query_one("#enable_client", Switch).value = client_data.get("enable", False)
+
+    @staticmethod
+    def client_options(clients_dict) -> list:
+        return [(client_data.get("name", ""), client_id) for client_id, client_data in clients_dict.items()]
+
     def on_select_changed(self, event: Select.Changed) -> None:
         try:
             """Manejador de eventos para cambios en los selectores."""
@@ -168,27 +313,19 @@ class TerminalUI(App):
                     self.query_one("#input_port", Label).update("")
                     self.query_one("#input_dns", Label).update("")
                     self.query_one("#input_endpoint", Label).update("")
+                    self.query_one("#input_usage", Label).update("")
                     return
 
-                server_id = self.wg_data.get("servers", {}).get(selected_server_id)
-                if not server_id:
+                server_data = self.wg_data.get("servers", {}).get(selected_server_id)
+                if not server_data:
                     self.notify(f"No se encontró el servidor seleccionado: {selected_server_id}", severity="error", title="Error de Datos")
                     return
 
-                self.query_one("#input_pubkey", Label).update(server_id.get("publicKey", ""))
-                self.query_one("#input_address", Label).update(server_id.get("address", ""))
-                self.query_one("#input_port", Label).update(str(server_id.get("port", "")))
-                self.query_one("#input_dns", Label).update(server_id.get("dns", ""))
-                self.query_one("#input_endpoint", Label).update(server_id.get("endpoint", ""))
-                self.query_one("#enable_server", Switch).value = server_id.get("enable", False)
+                self.show_server_details(selected_server_id)
                 
                 select_client.clear()
-                clients_dict = server_id.get("clients", {})
-                clients = []
-                for client_id, client_data in clients_dict.items():
-                    name_id = client_data.get("name", "")
-                    clients.append((name_id, client_id))
-                select_client.set_options(clients)
+                clients_dict = server_data.get("clients", {})
+                select_client.set_options(self.client_options(clients_dict))
                 # Restaurar selección de cliente si existe
                 if self.previous_value_client in clients_dict:
                     select_client.value = self.previous_value_client
@@ -205,20 +342,60 @@ class TerminalUI(App):
                     self.query_one("#input_dns_client", Label).update("")
                     return
 
-                client_data = self.wg_data.get("servers", {}).get(server_id, {}).get("clients", {}).get(selected_client_id, {})
-                if not client_data:
+                if not self.wg_data.get("servers", {}).get(server_id, {}).get("clients", {}).get(selected_client_id):
                     self.notify(f"No se encontró el servidor cliente.", severity="error", title="Error de Datos")
                     return
 
-                self.query_one("#name_client", Label).update(client_data.get("name", ""))
-                self.query_one("#input_pubkey_client", Label).update(client_data.get("publicKey", ""))
-                self.query_one("#input_address_client", Label).update(client_data.get("address", ""))
-                self.query_one("#input_dns_client", Label).update(client_data.get("dns", ""))
-                self.query_one("#enable_client", Switch).value = client_data.get("enable", False)
+                self.show_client_details(server_id, selected_client_id)
         except Exception as e:
             self.notify(f"Error con la selección: {e}", severity="error", title="Error de Selección")
             return
 
+    def reload_from_disk(self) -> None:
+        """Incorpora un cambio del archivo hecho por otro proceso, actualizando solo lo afectado."""
+        try:
+            previous = self.writer.reload()
+        except Exception as e:
+            self.notify(f"No se pudo recargar '{store.DATA_FILE}': {e}", severity="error", title="Error de Carga")
+            return
+        if previous is None:
+            return # Era una escritura propia
+        # Si el otro proceso guardó el estado de direcciones se reutiliza; si no, se reconstruye al consultarlo.
+        allocator.load_state(store.DATA_FILE, store.version(self.wg_data))
+        netcheck.reset()
+        servers_now = self.wg_data.get("servers", {})
+        server_list, changes = watcher.diff_servers(previous, servers_now)
+        select_server = self.query_one("#select_server", Select)
+        select_client = self.query_one("#select_client", Select)
+        server_id = select_server.value
+        if server_list:
+            if server_id is not Select.BLANK and server_id not in servers_now:
+                # El servidor seleccionado ya no existe: el evento de cambio limpia los detalles.
+                select_server.set_options(store.server_names(servers_now))
+                select_server.value = Select.BLANK
+                return
+            with select_server.prevent(Select.Changed):
+                select_server.set_options(store.server_names(servers_now))
+                select_server.value = server_id
+        diff = changes.get(server_id)
+        if diff is None:
+            return
+        if diff.fields:
+            self.show_server_details(server_id)
+        elif diff.client_list:
+            self.show_usage(server_id)
+        client_id = select_client.value
+        if diff.client_list:
+            clients_dict = servers_now[server_id].get("clients", {})
+            if client_id is not Select.BLANK and client_id not in clients_dict:
+                select_client.set_options(self.client_options(clients_dict))
+                select_client.value = Select.BLANK
+                return
+            with select_client.prevent(Select.Changed):
+                select_client.set_options(self.client_options(clients_dict))
+                select_client.value = client_id
+        if client_id in diff.clients:
+            self.show_client_details(server_id, client_id)
 
   
     @on(Button.Pressed, "#add_client")
@@ -288,11 +465,9 @@ class TerminalUI(App):
     async def del_reg(self,id_server,id_client,item_name):
         try:
             if id_client == None:
-                del self.wg_data["servers"][id_server]
+                self.persist([("del", ["servers", id_server])])
             else:
-                del self.wg_data["servers"][id_server]["clients"][id_client]
-            with open("wg_data.json", "w", encoding="utf-8") as f:
-                json.dump(self.wg_data, f, indent=2, ensure_ascii=False)
+                self.persist([("del", ["servers", id_server, "clients", id_client])])
             self.notify(f"'{item_name}' fue eliminado correctamente.", severity="success", title="Eliminado")
             await self.refresh_server_select()
         except Exception as e: